@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Restaurant, MenuCategory
+from .models import Restaurant, MenuCategory, Courier
 
 admin.site.register(Restaurant)
 admin.site.register(MenuCategory)
+admin.site.register(Courier)
@@ -0,0 +1,284 @@
+from decimal import Decimal
+
+from django.db import connections, router, transaction
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Order, OrderItem, ArchivedOrder, ArchivedOrderItem, DailyOrderRollup, DailyMenuItemRollup
+
+
+# Incremental sales rollups. Every order write adjusts a handful of
+# (restaurant, day, ...) counter rows, so dashboards read a few hundred rows
+# instead of scanning Order/OrderItem. Cancelled orders keep their status row
+# but don't count towards item sales.
+
+def increment(model, rows):
+    """
+    Add non-negative deltas to many counter rows in one INSERT ... ON
+    CONFLICT/ON DUPLICATE KEY UPDATE statement. `rows` is a list of
+    (keys, deltas) dicts; all rows share the same key and counter fields.
+    """
+    merged = {}
+    for keys, deltas in rows:
+        key = tuple(sorted(keys.items()))
+        totals = merged.setdefault(key, dict.fromkeys(deltas, 0))
+        for field, delta in deltas.items():
+            totals[field] += delta
+    if not merged:
+        return
+
+    connection = connections[router.db_for_write(model)]
+    qn = connection.ops.quote_name
+    key_fields = [field for field, _ in next(iter(merged))]
+    counter_fields = list(next(iter(merged.values())))
+    fields = [model._meta.get_field(name) for name in key_fields + counter_fields]
+    columns = [field.column for field in fields]
+    key_columns = columns[:len(key_fields)]
+    counter_columns = columns[len(key_fields):]
+    table = qn(model._meta.db_table)
+
+    placeholders = ", ".join(["(" + ", ".join(["%s"] * len(columns)) + ")"] * len(merged))
+    params = []
+    for key, totals in merged.items():
+        values = [value for _, value in key] + [totals[name] for name in counter_fields]
+        params.extend(field.get_db_prep_value(value, connection) for field, value in zip(fields, values))
+
+    sql = f"INSERT INTO {table} ({', '.join(qn(c) for c in columns)}) VALUES {placeholders} "
+    if connection.vendor == 'mysql':
+        sql += "ON DUPLICATE KEY UPDATE " + ", ".join(
+            f"{qn(c)} = {qn(c)} + VALUES({qn(c)})" for c in counter_columns
+        )
+    else:
+        sql += f"ON CONFLICT ({', '.join(qn(c) for c in key_columns)}) DO UPDATE SET " + ", ".join(
+            f"{qn(c)} = {table}.{qn(c)} + excluded.{qn(c)}" for c in counter_columns
+        )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def bump(model, keys, **deltas):
+    """Atomically add `deltas` to the counter row identified by `keys`."""
+    if not any(deltas.values()):
+        return
+    if all(delta >= 0 for delta in deltas.values()):
+        increment(model, [(keys, deltas)])
+        return
+    # Decrements only touch rows that exist (a row may be missing if the
+    # rollups were never backfilled)
+    model.objects.filter(**keys).update(**{field: F(field) + delta for field, delta in deltas.items()})
+
+
+def order_state(values):
+    return {
+        "restaurant_id": values["restaurant_id"],
+        "day": timezone.localdate(values["created_at"]),
+        "status": values["status"],
+        "total_price": values["total_price"],
+    }
+
+
+def current_order_state(order):
+    return order_state({
+        "restaurant_id": order.restaurant_id,
+        "created_at": order.created_at,
+        "status": order.status,
+        "total_price": order.total_price,
+    })
+
+
+def counts_item_sales(state):
+    return state["status"] != "CANCELLED"
+
+
+def apply_order(state, sign):
+    bump(
+        DailyOrderRollup,
+        {"restaurant_id": state["restaurant_id"], "day": state["day"], "status": state["status"]},
+        order_count=sign,
+        revenue=sign * state["total_price"],
+    )
+
+
+def apply_items(state, items, sign):
+    rows = [
+        (
+            {"restaurant_id": state["restaurant_id"], "day": state["day"], "menu_item_id": menu_item_id},
+            {"quantity": sign * quantity, "revenue": sign * quantity * price},
+        )
+        for menu_item_id, quantity, price in items
+    ]
+    if sign > 0:
+        increment(DailyMenuItemRollup, rows)
+        return
+    for keys, deltas in rows:
+        bump(DailyMenuItemRollup, keys, **deltas)
+
+
+def order_items(order):
+    return list(OrderItem.objects.filter(order=order).values_list('menu_item_id', 'quantity', 'price'))
+
+
+def record_order_saved(order, created):
+    new = current_order_state(order)
+    loaded = getattr(order, '_loaded_values', None)
+    old = None
+    if not created and loaded and all(key in loaded for key in ('restaurant_id', 'created_at', 'status', 'total_price')):
+        old = order_state(loaded)
+    order._loaded_values = {**(loaded or {}), **{
+        "restaurant_id": order.restaurant_id,
+        "created_at": order.created_at,
+        "status": order.status,
+        "total_price": order.total_price,
+    }}
+
+    if created:
+        apply_order(new, 1)
+        return
+    if old is None or old == new:
+        return
+
+    apply_order(old, -1)
+    apply_order(new, 1)
+
+    moved = (old["restaurant_id"], old["day"]) != (new["restaurant_id"], new["day"])
+    if counts_item_sales(old) != counts_item_sales(new) or moved:
+        items = order_items(order)
+        if counts_item_sales(old):
+            apply_items(old, items, -1)
+        if counts_item_sales(new):
+            apply_items(new, items, 1)
+
+
+def record_order_deleted(order):
+    state = current_order_state(order)
+    apply_order(state, -1)
+    if counts_item_sales(state):
+        apply_items(state, order_items(order), -1)
+
+
+def record_orders_status_changed(orders, previous_status):
+    """
+    Move `orders`, already saved with their new status by a queryset
+    .update() (which sends no signals), out of `previous_status`.
+    """
+    removed, added = {}, []
+    for order in orders:
+        new = current_order_state(order)
+        old = {**new, "status": previous_status}
+        if counts_item_sales(old) != counts_item_sales(new):
+            # Rare for batch moves; go through the per-order path
+            record_order_saved(order, False)
+            continue
+        key = (old["restaurant_id"], old["day"])
+        count, revenue = removed.get(key, (0, 0))
+        removed[key] = (count + 1, revenue + old["total_price"])
+        added.append((
+            {"restaurant_id": new["restaurant_id"], "day": new["day"], "status": new["status"]},
+            {"order_count": 1, "revenue": new["total_price"]},
+        ))
+        order._loaded_values = {**getattr(order, '_loaded_values', {}), "status": order.status}
+    for (restaurant_id, day), (count, revenue) in removed.items():
+        bump(DailyOrderRollup, {"restaurant_id": restaurant_id, "day": day, "status": previous_status},
+             order_count=-count, revenue=-revenue)
+    increment(DailyOrderRollup, added)
+
+
+def record_order_items_added(order, items):
+    """
+    Count new items for `order`. Called by the OrderItem signal and directly
+    by code that inserts items with bulk_create (which sends no signals).
+    """
+    state = current_order_state(order)
+    if counts_item_sales(state):
+        apply_items(state, [(item.menu_item_id, item.quantity, item.price) for item in items], 1)
+
+
+def record_order_item_saved(item, created):
+    loaded = getattr(item, '_loaded_values', None)
+    item._loaded_values = {
+        **(loaded or {}), "menu_item_id": item.menu_item_id, "quantity": item.quantity, "price": item.price,
+    }
+    if created:
+        record_order_items_added(item.order, [item])
+        return
+    if not loaded or not all(key in loaded for key in ('menu_item_id', 'quantity', 'price')):
+        return
+    old = (loaded["menu_item_id"], loaded["quantity"], loaded["price"])
+    new = (item.menu_item_id, item.quantity, item.price)
+    state = current_order_state(item.order)
+    if old != new and counts_item_sales(state):
+        apply_items(state, [old], -1)
+        apply_items(state, [new], 1)
+
+
+def record_order_item_deleted(item):
+    state = current_order_state(item.order)
+    if counts_item_sales(state):
+        apply_items(state, [(item.menu_item_id, item.quantity, item.price)], -1)
+
+
+def rebuild_rollups(restaurant_ids=None):
+    """
+    Recompute rollups from the hot and archived orders, with two GROUP BY
+    queries per tier.
+    """
+    order_totals, item_totals = {}, {}
+    for order_model, item_model in ((Order, OrderItem), (ArchivedOrder, ArchivedOrderItem)):
+        orders = order_model.objects.all()
+        items = item_model.objects.exclude(order__status="CANCELLED")
+        if restaurant_ids is not None:
+            orders = orders.filter(restaurant_id__in=restaurant_ids)
+            items = items.filter(order__restaurant_id__in=restaurant_ids)
+
+        order_rows = (
+            orders.annotate(day=TruncDate('created_at'))
+            .values('restaurant_id', 'day', 'status')
+            .annotate(order_count=Count('id'), revenue=Sum('total_price'))
+            .order_by()
+        )
+        item_rows = (
+            items.annotate(day=TruncDate('order__created_at'))
+            .values('order__restaurant_id', 'day', 'menu_item_id')
+            .annotate(
+                sold=Sum('quantity'),
+                takings=Sum(F('quantity') * F('price'), output_field=DecimalField(max_digits=14, decimal_places=2)),
+            )
+            .order_by()
+        )
+        # A day can have orders in both tiers
+        for row in order_rows:
+            totals = order_totals.setdefault((row['restaurant_id'], row['day'], row['status']), [0, Decimal("0")])
+            totals[0] += row['order_count']
+            totals[1] += row['revenue'] or Decimal("0")
+        for row in item_rows:
+            totals = item_totals.setdefault((row['order__restaurant_id'], row['day'], row['menu_item_id']), [0, Decimal("0")])
+            totals[0] += row['sold']
+            totals[1] += row['takings'] or Decimal("0")
+
+    with transaction.atomic():
+        order_rollups = DailyOrderRollup.objects.all()
+        item_rollups = DailyMenuItemRollup.objects.all()
+        if restaurant_ids is not None:
+            order_rollups = order_rollups.filter(restaurant_id__in=restaurant_ids)
+            item_rollups = item_rollups.filter(restaurant_id__in=restaurant_ids)
+        order_rollups.delete()
+        item_rollups.delete()
+
+        created = DailyOrderRollup.objects.bulk_create(
+            [
+                DailyOrderRollup(restaurant_id=restaurant_id, day=day, status=status, order_count=count, revenue=revenue)
+                for (restaurant_id, day, status), (count, revenue) in order_totals.items()
+            ],
+            batch_size=1000,
+        )
+        created_items = DailyMenuItemRollup.objects.bulk_create(
+            [
+                DailyMenuItemRollup(
+                    restaurant_id=restaurant_id, day=day, menu_item_id=menu_item_id, quantity=quantity, revenue=revenue,
+                )
+                for (restaurant_id, day, menu_item_id), (quantity, revenue) in item_totals.items()
+            ],
+            batch_size=1000,
+        )
+    return len(created), len(created_items)
@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def install_search_indexes(sender, using='default', **kwargs):
+    from .search import install_search_indexes
+    install_search_indexes(using)
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Api'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        post_migrate.connect(install_search_indexes, sender=self)
@@ -0,0 +1,231 @@
+import time
+from datetime import timedelta
+from functools import cmp_to_key
+from heapq import merge
+from itertools import islice
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils import timezone
+from rest_framework.permissions import SAFE_METHODS
+
+from .dispatch import lock_rows
+from .fieldsets import FULL, order_queryset
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+
+
+# Order archiving. Delivered and cancelled orders older than AGE_DAYS move,
+# with their items, from Order/OrderItem into ArchivedOrder/ArchivedOrderItem
+# (same ids and columns). Each batch is one short transaction that copies
+# BATCH_SIZE orders and deletes them from the hot tables, so an interrupted
+# run loses nothing and the next run simply carries on with what's left.
+# Sales rollups already count the archived orders and are left alone.
+# `?history=1` on the order list/detail reads both tiers as one.
+
+HISTORY_PARAM = "history"
+
+
+def archive_settings():
+    options = {
+        "AGE_DAYS": 90,
+        "STATUSES": ("DELIVERED", "CANCELLED"),
+        "BATCH_SIZE": 500,
+        "PAUSE": 0,
+    }
+    options.update(getattr(settings, 'ARCHIVE', None) or {})
+    return options
+
+
+def copy_rows(using, source, target, key, ids, extra=None):
+    """
+    INSERT INTO target SELECT ... FROM source WHERE key IN ids, so rows
+    never round-trip through Python. `extra` sets target-only fields.
+    Returns the number of rows copied.
+    """
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    extra = extra or {}
+    fields = source._meta.concrete_fields
+    columns = [qn(target._meta.get_field(field.name).column) for field in fields]
+    values = [qn(field.column) for field in fields]
+    params = []
+    for name, value in extra.items():
+        field = target._meta.get_field(name)
+        columns.append(qn(field.column))
+        values.append("%s")
+        params.append(field.get_db_prep_value(value, connection))
+    sql = (
+        f"INSERT INTO {qn(target._meta.db_table)} ({', '.join(columns)}) "
+        f"SELECT {', '.join(values)} FROM {qn(source._meta.db_table)} "
+        f"WHERE {qn(source._meta.get_field(key).column)} IN ({', '.join(['%s'] * len(ids))})"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + list(ids))
+        return cursor.rowcount
+
+
+def archive_batch(status, cutoff, batch_size, now=None):
+    """
+    Move up to `batch_size` of the oldest `status` orders created before
+    `cutoff` to the archive. Returns (orders, order items) moved.
+    """
+    now = now or timezone.now()
+    using = router.db_for_write(Order)
+    with transaction.atomic(using=using):
+        # Walks order_status_created_at_idx, so no sort over the whole backlog
+        ids = list(
+            lock_rows(
+                Order.objects.using(using).filter(status=status, created_at__lt=cutoff).order_by('created_at', 'pk')
+            ).values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return 0, 0
+        orders = copy_rows(using, Order, ArchivedOrder, 'id', ids, extra={'archived_at': now})
+        items = copy_rows(using, OrderItem, ArchivedOrderItem, 'order', ids)
+        # Plain DELETEs: the collector would load every row to send delete
+        # signals, and those would take archived sales out of the rollups
+        OrderItem.objects.filter(order_id__in=ids)._raw_delete(using)
+        Order.objects.filter(pk__in=ids)._raw_delete(using)
+    return orders, items
+
+
+def archive_orders(now=None, options=None, limit=None, log=None):
+    """
+    Archive every eligible order, a batch at a time, stopping after about
+    `limit` orders if given. Returns {"orders", "order_items", "batches"}.
+    """
+    options = {**archive_settings(), **(options or {})}
+    now = now or timezone.now()
+    log = log or (lambda message: None)
+    cutoff = now - timedelta(days=options["AGE_DAYS"])
+    result = {"orders": 0, "order_items": 0, "batches": 0}
+
+    for status in options["STATUSES"]:
+        while limit is None or result["orders"] < limit:
+            batch_size = options["BATCH_SIZE"] if limit is None else min(options["BATCH_SIZE"], limit - result["orders"])
+            orders, items = archive_batch(status, cutoff, batch_size, now)
+            if not orders:
+                break
+            result["orders"] += orders
+            result["order_items"] += items
+            result["batches"] += 1
+            log(f"{status}: archived {orders} orders")
+            if orders < batch_size:
+                break
+            if options["PAUSE"]:
+                # Lets other writers in between batches
+                time.sleep(options["PAUSE"])
+    return result
+
+
+def archived_order_queryset(shape=FULL):
+    return order_queryset(shape, ArchivedOrder, ArchivedOrderItem)
+
+
+def compare_on(ordering):
+    # Django-style ordering (['-created_at', 'pk']) as a cmp function over instances
+    terms = [(term.lstrip('-'), term.startswith('-')) for term in ordering]
+
+    def compare(a, b):
+        for field, desc in terms:
+            x, y = getattr(a, field), getattr(b, field)
+            if x != y:
+                return (-1 if x < y else 1) * (-1 if desc else 1)
+        return 0
+    return compare
+
+
+class TieredQuerySet:
+    """
+    Several querysets of look-alike models read as one: filters and
+    ordering apply to each, and slices merge their ordered results. Enough
+    of the QuerySet API for the filter backends, pagination and get_object.
+    """
+
+    def __init__(self, *querysets):
+        self.querysets = querysets
+
+    @property
+    def model(self):
+        return self.querysets[0].model
+
+    @property
+    def ordered(self):
+        return all(queryset.ordered for queryset in self.querysets)
+
+    def _chain(self, method, *args, **kwargs):
+        return TieredQuerySet(*(getattr(queryset, method)(*args, **kwargs) for queryset in self.querysets))
+
+    def all(self):
+        return self._chain('all')
+
+    def none(self):
+        return self._chain('none')
+
+    def filter(self, *args, **kwargs):
+        return self._chain('filter', *args, **kwargs)
+
+    def exclude(self, *args, **kwargs):
+        return self._chain('exclude', *args, **kwargs)
+
+    def order_by(self, *fields):
+        return self._chain('order_by', *fields)
+
+    def distinct(self, *fields):
+        return self._chain('distinct', *fields)
+
+    def count(self):
+        return sum(queryset.count() for queryset in self.querysets)
+
+    def exists(self):
+        return any(queryset.exists() for queryset in self.querysets)
+
+    def get(self, *args, **kwargs):
+        for queryset in self.querysets:
+            try:
+                return queryset.get(*args, **kwargs)
+            except queryset.model.DoesNotExist:
+                pass
+        raise self.model.DoesNotExist(f"{self.model._meta.object_name} matching query does not exist.")
+
+    def get_ordering(self):
+        query = self.querysets[0].query
+        return list(query.order_by or (query.default_ordering and self.model._meta.ordering) or [])
+
+    def merged(self, parts):
+        ordering = self.get_ordering()
+        if not ordering:
+            return (obj for part in parts for obj in part)
+        return merge(*parts, key=cmp_to_key(compare_on(ordering)))
+
+    def __iter__(self):
+        return iter(self.merged(self.querysets))
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, k):
+        if isinstance(k, int):
+            return self[k:k + 1][0]
+        if k.stop is None or k.step is not None:
+            raise TypeError("TieredQuerySet only supports bounded slices without a step.")
+        # Rows [start, stop) of the merge come from the first `stop` of each tier
+        start = k.start or 0
+        return list(islice(self.merged([queryset[:k.stop] for queryset in self.querysets]), start, k.stop))
+
+
+#Adds archived orders to safe requests that ask for ?history=1
+class OrderHistoryMixin:
+    def wants_history(self):
+        request = self.request
+        return (
+            request.method in SAFE_METHODS
+            and request.query_params.get(HISTORY_PARAM, "").lower() in ("1", "true", "yes")
+        )
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if not self.wants_history():
+            return queryset
+        # Shaped like the hot tier when the view takes ?fields=/?expand=
+        return TieredQuerySet(queryset, archived_order_queryset(getattr(self, 'shape', FULL)))
@@ -0,0 +1,213 @@
+import inspect
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.http import Http404
+from rest_framework.response import Response
+
+from .instrumentation import timed
+from .readers import instance_from_row
+from .views import (
+    RestaurantListCreateAPIView, RestaurantRetrieveUpdateDestroyAPIView,
+    MenuItemListCreateAPIView, MenuItemRetrieveUpdateDestroyAPIView,
+    OrderListCreateAPIView, OrderRetrieveUpdateDestroyAPIView,
+)
+
+
+# Native async versions of the hot read endpoints, used when the project is
+# served through asgi.py (ASYNC_VIEWS = True). GETs run on the event loop:
+# async permission checks, async keyset pagination and the async ORM, with
+# only authentication (which may read the user cache's database fallback)
+# hopping to a thread. Every other method runs the view's ordinary sync
+# dispatch in one worker thread, so writes keep their transactions,
+# Idempotency-Key handling and validators exactly as under WSGI.
+
+
+async def maybe_await(value):
+    if inspect.isawaitable(value):
+        return await value
+    return value
+
+
+class AsyncViewMixin:
+    """
+    Put in front of a DRF generic view. `async_handlers` maps HTTP methods
+    to coroutine methods; anything not listed uses the sync view.
+    """
+
+    view_is_async = True
+    async_handlers = {}
+
+    async def dispatch(self, request, *args, **kwargs):
+        handler_name = self.async_handlers.get(request.method.lower())
+        if handler_name is None:
+            return await sync_to_async(super().dispatch)(request, *args, **kwargs)
+
+        # APIView.dispatch, with the checks and the handler awaited
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await self.ainitial(request, *args, **kwargs)
+            response = await getattr(self, handler_name)(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def ainitial(self, request, *args, **kwargs):
+        self.format_kwarg = self.get_format_suffix(**kwargs)
+        request.accepted_renderer, request.accepted_media_type = self.perform_content_negotiation(request)
+        request.version, request.versioning_scheme = self.determine_version(request, *args, **kwargs)
+
+        await sync_to_async(self.perform_authentication)(request)
+        await self.acheck_permissions(request)
+        await self.acheck_throttles(request)
+
+    async def acheck_permissions(self, request):
+        # Permission classes may define has_permission as a coroutine
+        with timed('perm'):
+            for permission in self.get_permissions():
+                if not await maybe_await(permission.has_permission(request, self)):
+                    self.permission_denied(
+                        request,
+                        message=getattr(permission, 'message', None),
+                        code=getattr(permission, 'code', None),
+                    )
+
+    async def acheck_throttles(self, request):
+        # In-memory counters are checked inline; anything that may do I/O in a thread
+        throttles = self.get_throttles()
+        if any(getattr(throttle, 'blocking', True) for throttle in throttles):
+            await sync_to_async(self.check_throttles)(request)
+        elif throttles:
+            self.check_throttles(request)
+
+    async def acheck_object_permissions(self, request, obj):
+        with timed('perm'):
+            for permission in self.get_permissions():
+                if not await maybe_await(permission.has_object_permission(request, self, obj)):
+                    self.permission_denied(
+                        request,
+                        message=getattr(permission, 'message', None),
+                        code=getattr(permission, 'code', None),
+                    )
+        # ConditionalViewMixin hooks in after the checks, as for sync views
+        object_loaded = getattr(self, 'object_loaded', None)
+        if object_loaded is not None:
+            object_loaded(obj)
+
+    def get_row_reader(self):
+        # FastReadMixin views serve `.values()` rows instead of instances
+        get_row_reader = getattr(super(), 'get_row_reader', None)
+        return None if get_row_reader is None else get_row_reader()
+
+    def get_lookup(self):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        return {self.lookup_field: self.kwargs[lookup_url_kwarg]}
+
+    async def aget_object(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        # Same 404s as DRF's get_object_or_404
+        try:
+            obj = await queryset.aget(**self.get_lookup())
+        except queryset.model.DoesNotExist:
+            raise Http404(f"No {queryset.model._meta.object_name} matches the given query.")
+        except (TypeError, ValueError, ValidationError):
+            raise Http404
+        await self.acheck_object_permissions(self.request, obj)
+        return obj
+
+    async def apaginate_queryset(self, queryset):
+        if self.paginator is None:
+            return None
+        if hasattr(self.paginator, 'apaginate_queryset'):
+            page = await self.paginator.apaginate_queryset(queryset, self.request, view=self)
+        else:
+            page = await sync_to_async(self.paginator.paginate_queryset)(queryset, self.request, view=self)
+        page_loaded = getattr(self, 'page_loaded', None)
+        return page if page_loaded is None else page_loaded(page)
+
+    async def alist(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        reader = self.get_row_reader()
+        if reader is not None:
+            rows = reader.rows(queryset)
+            page = await self.apaginate_queryset(rows)
+            paginated = page is not None
+            if not paginated:
+                page = [row async for row in rows]
+            data = reader.serialize(page, request)
+        else:
+            page = await self.apaginate_queryset(queryset)
+            paginated = page is not None
+            if not paginated:
+                page = [obj async for obj in queryset]
+            data = self.get_serializer(page, many=True).data
+
+        if paginated:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        reader = self.get_row_reader()
+        if reader is None:
+            instance = await self.aget_object()
+            return Response(self.get_serializer(instance).data)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        row = await reader.rows(queryset).filter(**self.get_lookup()).afirst()
+        if row is None:
+            # Same 404 as aget_object()
+            return Response(self.get_serializer(await self.aget_object()).data)
+        await self.acheck_object_permissions(request, instance_from_row(queryset.model, row))
+        with timed('serialize'):
+            data = reader.serialize_row(row, request)
+        return Response(data)
+
+
+class AsyncListMixin(AsyncViewMixin):
+    async_handlers = {'get': 'alist', 'head': 'alist'}
+
+
+class AsyncRetrieveMixin(AsyncViewMixin):
+    async_handlers = {'get': 'aretrieve', 'head': 'aretrieve'}
+
+
+class AsyncRestaurantListCreateAPIView(AsyncListMixin, RestaurantListCreateAPIView):
+    pass
+
+
+class AsyncRestaurantRetrieveUpdateDestroyAPIView(AsyncRetrieveMixin, RestaurantRetrieveUpdateDestroyAPIView):
+    pass
+
+
+class AsyncMenuItemListCreateAPIView(AsyncListMixin, MenuItemListCreateAPIView):
+    async def alist(self, request, *args, **kwargs):
+        response = await super().alist(request, *args, **kwargs)
+        rows = self.facet_rows()
+        return response if rows is None else self.with_facets(response, [row async for row in rows])
+
+
+class AsyncMenuItemRetrieveUpdateDestroyAPIView(AsyncRetrieveMixin, MenuItemRetrieveUpdateDestroyAPIView):
+    pass
+
+
+# ?history=1 merges the hot and archive tiers with the sync TieredQuerySet
+
+class AsyncOrderListCreateAPIView(AsyncListMixin, OrderListCreateAPIView):
+    async def alist(self, request, *args, **kwargs):
+        if self.wants_history():
+            return await sync_to_async(self.list)(request, *args, **kwargs)
+        return await super().alist(request, *args, **kwargs)
+
+
+class AsyncOrderRetrieveUpdateDestroyAPIView(AsyncRetrieveMixin, OrderRetrieveUpdateDestroyAPIView):
+    async def aretrieve(self, request, *args, **kwargs):
+        if self.wants_history():
+            return await sync_to_async(self.retrieve)(request, *args, **kwargs)
+        return await super().aretrieve(request, *args, **kwargs)
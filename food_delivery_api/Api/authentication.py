@@ -0,0 +1,201 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from .blacklist import get_revocation_list, maybe_prune_expired_tokens
+from .models import User
+from .replicas import primary_reads
+
+
+# Access tokens carry the fields permission checks need, so authenticating a
+# request builds the user from the token instead of SELECTing the User row.
+CLAIM_FIELDS = ('username', 'role', 'is_staff', 'is_superuser')
+
+
+def stamp_claims(token, user):
+    for field in CLAIM_FIELDS:
+        token[field] = getattr(user, field)
+    return token
+
+
+class RoleRefreshToken(RefreshToken):
+    @classmethod
+    def for_user(cls, user):
+        # Access tokens derived from this refresh token copy these claims
+        return stamp_claims(super().for_user(user), user)
+
+    def check_blacklist(self):
+        # In-memory revocation set instead of a BlacklistedToken query
+        if get_revocation_list().is_revoked(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        result = super().blacklist()
+        get_revocation_list().add(self.payload[api_settings.JTI_CLAIM], datetime_from_epoch(self.payload["exp"]))
+        maybe_prune_expired_tokens()
+        return result
+
+
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = RoleRefreshToken
+
+
+class RoleTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = RoleRefreshToken
+
+    def validate(self, attrs):
+        # Re-read the user so a refreshed access token never carries a stale role
+        refresh = self.token_class(attrs["refresh"])
+        user = User.objects.filter(**{api_settings.USER_ID_FIELD: refresh.get(api_settings.USER_ID_CLAIM)}).first()
+        if user is not None:
+            attrs = {**attrs, "refresh": str(stamp_claims(refresh, user))}
+        return super().validate(attrs)
+
+
+CHANGED_KEY = "auth:user-changed:{}"
+
+
+class UserCache:
+    """
+    Bounded, thread-safe LRU of users keyed by id (as the string stored in
+    the token's user id claim) with a TTL. Also remembers
+    when each user last changed, so tokens issued before a role change or
+    deactivation stop being trusted. `shared` (a Django cache) carries
+    those stamps to every other worker.
+    """
+
+    def __init__(self, max_size=10000, ttl=300, shared=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.shared = shared
+        self._users = OrderedDict()
+        self._changed_at = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, fresh_after=None):
+        # fresh_after: a change stamp; users cached before it are reloaded
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return None
+            user, expires, loaded_at = entry
+            if expires < time.monotonic() or (fresh_after is not None and loaded_at <= fresh_after):
+                del self._users[user_id]
+                return None
+            self._users.move_to_end(user_id)
+            # Callers get their own copy; the cached instance is shared
+            return copy.copy(user)
+
+    def set(self, user_id, user):
+        with self._lock:
+            self._users[user_id] = (user, time.monotonic() + self.ttl, time.time())
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_size:
+                self._users.popitem(last=False)
+
+    def changed_at(self, user_id):
+        with self._lock:
+            changed_at = self._changed_at.get(user_id)
+        if self.shared is not None:
+            # One cache GET: a change saved by another worker
+            shared = self.shared.get(CHANGED_KEY.format(user_id))
+            if shared is not None and (changed_at is None or shared > changed_at):
+                changed_at = shared
+        return changed_at
+
+    def changed_since(self, user_id, issued_at):
+        changed_at = self.changed_at(user_id)
+        return changed_at is not None and issued_at <= changed_at
+
+    def invalidate(self, user_id):
+        changed_at = time.time()
+        with self._lock:
+            self._users.pop(user_id, None)
+            self._changed_at[user_id] = changed_at
+            self._changed_at.move_to_end(user_id)
+            while len(self._changed_at) > self.max_size:
+                self._changed_at.popitem(last=False)
+        if self.shared is not None:
+            # Only tokens issued before the change care, and none outlive this
+            self.shared.set(
+                CHANGED_KEY.format(user_id), changed_at,
+                timeout=int(api_settings.ACCESS_TOKEN_LIFETIME.total_seconds()) + 60,
+            )
+
+
+_user_cache = None
+_user_cache_lock = threading.Lock()
+
+
+def get_user_cache():
+    global _user_cache
+    if _user_cache is None:
+        with _user_cache_lock:
+            if _user_cache is None:
+                options = getattr(settings, 'AUTH_USER_CACHE', None) or {}
+                alias = options.get('CACHE', 'default')
+                _user_cache = UserCache(
+                    max_size=options.get('MAX_SIZE', 10000),
+                    ttl=options.get('TTL', 300),
+                    shared=caches[alias] if alias else None,
+                )
+    return _user_cache
+
+
+def reset_user_cache():
+    global _user_cache
+    with _user_cache_lock:
+        _user_cache = None
+
+
+def user_cache_enabled():
+    return bool(getattr(settings, 'AUTH_USER_CACHE', None))
+
+
+def user_from_claims(token):
+    # A real User instance (so FK assignment and == work) whose other fields
+    # are deferred and only loaded if something actually reads them.
+    # is_active holds because deactivating a user stamps a change, which
+    # sends their older tokens down the database path in get_user()
+    known = {field: token[field] for field in CLAIM_FIELDS}
+    known.update(id=User._meta.pk.to_python(token[api_settings.USER_ID_CLAIM]), is_active=True)
+    fields = [f.attname for f in User._meta.concrete_fields if f.attname in known]
+    return User.from_db('default', fields, [known[name] for name in fields])
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = str(validated_token[api_settings.USER_ID_CLAIM])
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        cache = get_user_cache()
+        changed_at = cache.changed_at(user_id)
+        has_claims = all(field in validated_token for field in CLAIM_FIELDS)
+        if has_claims and (changed_at is None or validated_token.get('iat', 0) > changed_at):
+            return user_from_claims(validated_token)
+
+        # Older tokens, or the user changed after this token was issued
+        if not user_cache_enabled():
+            return super().get_user(validated_token)
+
+        user = cache.get(user_id, fresh_after=changed_at)
+        if user is None:
+            with primary_reads():
+                user = super().get_user(validated_token)
+            cache.set(user_id, user)
+        elif api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
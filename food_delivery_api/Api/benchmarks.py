@@ -0,0 +1,598 @@
+import gc
+import json
+import platform
+import random
+import resource
+import statistics
+import time
+import tracemalloc
+from decimal import Decimal
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver
+
+from . import analytics
+from .archive import archive_orders, archive_settings
+from .authentication import RoleRefreshToken
+from .geo import encode_geohash
+from .models import User, Restaurant, MenuCategory, MenuItem, Order, OrderItem, Courier, ArchivedOrder, ArchivedOrderItem
+
+
+# Synthetic dataset + request benchmarks. Everything runs in-process through
+# django.test.Client against whatever database the settings point at, so a
+# laptop with SQLite (see food_delivery_api/benchmark_settings.py) is enough.
+
+SCALES = {
+    "tiny": {"restaurants": 5, "menu_items": 100, "customers": 20, "couriers": 5, "orders": 200, "big_menu": 500},
+    "small": {"restaurants": 100, "menu_items": 5000, "customers": 1000, "couriers": 200, "orders": 20000, "big_menu": 2000},
+    "medium": {"restaurants": 1000, "menu_items": 50000, "customers": 10000, "couriers": 2000, "orders": 500000, "big_menu": 5000},
+    "large": {"restaurants": 10000, "menu_items": 500000, "customers": 100000, "couriers": 20000, "orders": 5000000, "big_menu": 10000},
+}
+
+CATEGORIES_PER_RESTAURANT = 5
+# One extra restaurant with `big_menu` items, for menu filtering and facets
+BIG_MENU_CATEGORIES = 20
+MAX_ITEMS_PER_ORDER = 4
+BENCHMARK_PASSWORD = "bench-pass-1234"
+CITY_CENTRE = (5.6037, -0.1870)
+STATUSES = [choice for choice, _ in Order.STATUS_CHOICES]
+SENT_OUT = ("OUT_FOR_DELIVERY", "DELIVERED")
+WORDS = (
+    "jollof waakye kenkey banku fufu suya kelewele tilapia chicken beef goat spicy grilled fried "
+    "smoked pepper soup stew rice plantain beans yam cassava shito garden egg palm nut groundnut"
+).split()
+
+
+def bulk_insert(model, objects, batch_size):
+    """
+    bulk_create `objects` a batch at a time and return the new primary keys
+    in insertion order. Reads them back by pk range because MySQL's
+    bulk_create doesn't set them.
+    """
+    ids = []
+    batch = []
+    for obj in objects:
+        batch.append(obj)
+        if len(batch) == batch_size:
+            ids.extend(insert_batch(model, batch))
+            batch = []
+    if batch:
+        ids.extend(insert_batch(model, batch))
+    return ids
+
+
+def insert_batch(model, batch):
+    start = model.objects.aggregate(top=Max('pk'))['top'] or 0
+    model.objects.bulk_create(batch)
+    return model.objects.filter(pk__gt=start).order_by('pk').values_list('pk', flat=True)
+
+
+def words(rng, count):
+    return " ".join(rng.choice(WORDS) for _ in range(count))
+
+
+def seed_dataset(restaurants, menu_items, customers, orders, couriers=0, big_menu=0, seed=42, batch_size=5000, log=None):
+    """
+    Insert a deterministic dataset with bulk inserts. Returns row counts.
+    Signals don't fire for bulk_create, so sales rollups are rebuilt at the
+    end (search index triggers are SQL-level and keep up on their own).
+    """
+    rng = random.Random(seed)
+    log = log or (lambda message: None)
+    password = make_password(BENCHMARK_PASSWORD)
+
+    if connection.vendor == 'sqlite' and not connection.in_atomic_block:
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA synchronous = OFF")
+            cursor.execute("PRAGMA journal_mode = WAL")
+
+    def users(prefix, role, count):
+        return bulk_insert(User, (
+            User(username=f"{prefix}{seed}_{i}", email=f"{prefix}{i}@bench.example", password=password, role=role)
+            for i in range(count)
+        ), batch_size)
+
+    log(f"users: {restaurants} owners, {customers} customers, {couriers} couriers")
+    owner_ids = users("owner", "restaurant_owner", restaurants)
+    customer_ids = users("customer", "customer", customers)
+    courier_user_ids = users("courier", "courier", couriers)
+    users("admin", "admin", 1)
+
+    now = timezone.now()
+    courier_ids = bulk_insert(Courier, (
+        Courier(
+            user_id=user_id,
+            latitude=CITY_CENTRE[0] + rng.uniform(-0.18, 0.18),
+            longitude=CITY_CENTRE[1] + rng.uniform(-0.18, 0.18),
+            is_available=True,
+            last_seen=now,
+        )
+        for user_id in courier_user_ids
+    ), batch_size)
+
+    log(f"restaurants: {restaurants}")
+    def restaurant(i, owner_id):
+        # Spread over a ~40km square around the benchmark city centre
+        latitude = CITY_CENTRE[0] + rng.uniform(-0.18, 0.18)
+        longitude = CITY_CENTRE[1] + rng.uniform(-0.18, 0.18)
+        return Restaurant(
+            owner_id=owner_id,
+            name=f"{words(rng, 2).title()} {i}",
+            address=f"{rng.randint(1, 999)} {words(rng, 1).title()} Street",
+            phone=f"02{rng.randint(0, 99999999):08d}",
+            latitude=latitude,
+            longitude=longitude,
+            geohash=encode_geohash(latitude, longitude),
+        )
+
+    restaurant_ids = bulk_insert(
+        Restaurant, (restaurant(i, owner_id) for i, owner_id in enumerate(owner_ids)), batch_size
+    )
+
+    category_ids = bulk_insert(MenuCategory, (
+        MenuCategory(restaurant_id=restaurant_id, name=f"Category {c}")
+        for restaurant_id in restaurant_ids
+        for c in range(CATEGORIES_PER_RESTAURANT)
+    ), batch_size)
+
+    log(f"menu items: {menu_items}")
+    prices = [Decimal(rng.randint(300, 25000)) / 100 for _ in range(menu_items)]
+    item_categories = [category_ids[i % len(category_ids)] for i in range(menu_items)]
+    item_ids = bulk_insert(MenuItem, (
+        MenuItem(category_id=category_id, name=words(rng, 3).title(), description=words(rng, 12), price=price)
+        for category_id, price in zip(item_categories, prices)
+    ), batch_size)
+
+    # Orders pick items from a single restaurant, like checkout does
+    category_restaurant = {
+        category_id: restaurant_ids[position // CATEGORIES_PER_RESTAURANT]
+        for position, category_id in enumerate(category_ids)
+    }
+    menus = {}
+    for item_id, category_id, price in zip(item_ids, item_categories, prices):
+        menus.setdefault(category_restaurant[category_id], []).append((item_id, price))
+    menu_restaurants = sorted(menus)
+
+    log(f"orders: {orders}")
+    order_items = 0
+    for chunk_start in range(0, orders, batch_size):
+        chunk = range(chunk_start, min(orders, chunk_start + batch_size))
+        baskets = []
+        for _ in chunk:
+            restaurant_id = rng.choice(menu_restaurants)
+            menu = menus[restaurant_id]
+            lines = [(rng.choice(menu), rng.randint(1, 3)) for _ in range(rng.randint(1, MAX_ITEMS_PER_ORDER))]
+            status = rng.choice(STATUSES)
+            # Orders that left the restaurant went with a courier
+            courier_id = rng.choice(courier_ids) if courier_ids and status in SENT_OUT else None
+            baskets.append((restaurant_id, rng.choice(customer_ids), status, courier_id, lines))
+        with transaction.atomic():
+            order_ids = bulk_insert(Order, (
+                Order(
+                    customer_id=customer_id,
+                    restaurant_id=restaurant_id,
+                    status=status,
+                    courier_id=courier_id,
+                    total_price=sum(price * quantity for (_, price), quantity in lines),
+                )
+                for restaurant_id, customer_id, status, courier_id, lines in baskets
+            ), batch_size)
+            rows = [
+                OrderItem(order_id=order_id, menu_item_id=item_id, quantity=quantity, price=price)
+                for order_id, (_, _, _, _, lines) in zip(order_ids, baskets)
+                for (item_id, price), quantity in lines
+            ]
+            OrderItem.objects.bulk_create(rows, batch_size=batch_size)
+        order_items += len(rows)
+        log(f"  {chunk.stop}/{orders} orders")
+
+    # Seeded last so the rest of the dataset is the same with or without it
+    big_menu_categories = []
+    if big_menu:
+        log(f"big menu: {big_menu} items")
+        big_owner_id, = users("bigowner", "restaurant_owner", 1)
+        owner_ids.append(big_owner_id)
+        restaurant_ids.extend(bulk_insert(Restaurant, [restaurant(len(restaurant_ids), big_owner_id)], batch_size))
+        big_menu_categories = bulk_insert(MenuCategory, (
+            MenuCategory(restaurant_id=restaurant_ids[-1], name=f"{words(rng, 1).title()} {c}")
+            for c in range(BIG_MENU_CATEGORIES)
+        ), batch_size)
+        item_ids.extend(bulk_insert(MenuItem, (
+            MenuItem(
+                category_id=rng.choice(big_menu_categories),
+                name=words(rng, 3).title(),
+                description=words(rng, 12),
+                price=Decimal(rng.randint(300, 25000)) / 100,
+            )
+            for _ in range(big_menu)
+        ), batch_size))
+
+    log("rebuilding sales rollups")
+    analytics.rebuild_rollups()
+    return {
+        "users": len(owner_ids) + len(customer_ids) + len(courier_user_ids) + 1,
+        "couriers": len(courier_ids),
+        "restaurants": len(restaurant_ids),
+        "menu_categories": len(category_ids) + len(big_menu_categories),
+        "menu_items": len(item_ids),
+        "orders": orders,
+        "order_items": order_items,
+    }
+
+
+def iter_routes(patterns=None, prefix=""):
+    """Yield the route string of every URL pattern, e.g. 'api/orders/<int:pk>/'."""
+    for pattern in patterns if patterns is not None else get_resolver().url_patterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_routes(pattern.url_patterns, prefix + str(pattern.pattern))
+        elif isinstance(pattern, URLPattern):
+            yield prefix + str(pattern.pattern)
+
+
+class BenchmarkContext:
+    """Sample rows and tokens that scenarios build their requests from."""
+
+    def __init__(self):
+        self.order = Order.objects.select_related('restaurant', 'customer').order_by('pk').first()
+        if self.order is None:
+            raise ValueError("No orders found; run seed_benchmark_data first")
+        self.restaurant = self.order.restaurant
+        self.owner = User.objects.get(pk=self.restaurant.owner_id)
+        self.customer = self.order.customer
+        self.admin = User.objects.filter(role='admin').order_by('pk').first() or self.owner
+        self.menu_item = MenuItem.objects.filter(category__restaurant=self.restaurant).order_by('pk').first()
+        # The longest menu, i.e. the big_menu restaurant when the seed made one
+        self.big_menu = Restaurant.objects.annotate(items=Count('categories__items')).order_by('-items', 'pk').first()
+        self.big_menu_category = MenuCategory.objects.filter(restaurant=self.big_menu).order_by('pk').first()
+        self.delivery = (
+            Order.objects.filter(status="OUT_FOR_DELIVERY", courier__isnull=False)
+            .select_related('courier__user').order_by('pk').first()
+        )
+        self.courier = self.delivery.courier.user if self.delivery else self.customer
+        self.etags = {}
+        self.tokens = {
+            role: str(RoleRefreshToken.for_user(user).access_token)
+            for role, user in (
+                ("owner", self.owner), ("customer", self.customer), ("admin", self.admin), ("courier", self.courier),
+            )
+        }
+
+    def auth(self, role):
+        return {"HTTP_AUTHORIZATION": f"Bearer {self.tokens[role]}"}
+
+
+def menu_csv(ctx):
+    return ("category,name,price\nCategory 0,Benchmark Special,12.00\n").encode()
+
+
+# route -> (name, method, role, path/body builder). Writes run inside a
+# rolled-back transaction so every iteration sees the same dataset.
+SCENARIOS = {
+    "api/auth/token/": [("token_obtain", "post", None, lambda ctx: (
+        "/api/auth/token/", {"username": ctx.customer.username, "password": BENCHMARK_PASSWORD}))],
+    "api/auth/token/refresh/": [("token_refresh", "post", None, lambda ctx: (
+        "/api/auth/token/refresh/", {"refresh": str(RoleRefreshToken.for_user(ctx.customer))}))],
+    "api/auth/register/": [("register", "post", None, lambda ctx: (
+        "/api/auth/register/",
+        {"username": "bench-new", "email": "new@bench.example", "password": BENCHMARK_PASSWORD, "role": "customer"}))],
+    "api/auth/login/": [("login", "post", None, lambda ctx: (
+        "/api/auth/login/", {"username": ctx.customer.username, "password": BENCHMARK_PASSWORD}))],
+    "api/auth/logout/": [("logout", "post", "customer", lambda ctx: (
+        "/api/auth/logout/", {"refresh": str(RoleRefreshToken.for_user(ctx.customer))}))],
+    "api/restaurants/": [
+        ("restaurant_list", "get", "customer", lambda ctx: ("/api/restaurants/", None)),
+        ("restaurant_search", "get", "customer", lambda ctx: ("/api/restaurants/?search=jollof", None)),
+        ("restaurant_nearby", "get", "customer", lambda ctx: (
+            f"/api/restaurants/?near={CITY_CENTRE[0]},{CITY_CENTRE[1]}&radius=5", None)),
+    ],
+    "api/restaurants/<int:pk>/": [("restaurant_detail", "get", "owner", lambda ctx: (
+        f"/api/restaurants/{ctx.restaurant.pk}/", None))],
+    "api/restaurants/<int:pk>/menu/": [("restaurant_menu", "get", "customer", lambda ctx: (
+        f"/api/restaurants/{ctx.restaurant.pk}/menu/", None))],
+    "api/restaurants/<int:pk>/menu/import/": [("menu_import", "multipart", "owner", lambda ctx: (
+        f"/api/restaurants/{ctx.restaurant.pk}/menu/import/", {"file": ("menu.csv", menu_csv(ctx))}))],
+    "api/restaurants/<int:pk>/menu/export/": [("menu_export", "get", "owner", lambda ctx: (
+        f"/api/restaurants/{ctx.restaurant.pk}/menu/export/", None))],
+    "api/restaurants/<int:pk>/orders/export/": [("order_export", "get", "owner", lambda ctx: (
+        f"/api/restaurants/{ctx.restaurant.pk}/orders/export/", None))],
+    "api/restaurants/<int:pk>/analytics/revenue/": [("analytics_revenue", "get", "owner", lambda ctx: (
+        f"/api/restaurants/{ctx.restaurant.pk}/analytics/revenue/", None))],
+    "api/restaurants/<int:pk>/analytics/status/": [("analytics_status", "get", "owner", lambda ctx: (
+        f"/api/restaurants/{ctx.restaurant.pk}/analytics/status/", None))],
+    "api/restaurants/<int:pk>/analytics/top-items/": [("analytics_top_items", "get", "owner", lambda ctx: (
+        f"/api/restaurants/{ctx.restaurant.pk}/analytics/top-items/", None))],
+    "api/categories/": [("category_list", "get", "admin", lambda ctx: ("/api/categories/", None))],
+    "api/menu-items/": [
+        ("menu_item_list", "get", "customer", lambda ctx: ("/api/menu-items/", None)),
+        ("menu_item_by_price", "get", "customer", lambda ctx: ("/api/menu-items/?ordering=-price", None)),
+        ("menu_item_list_304", "revalidate", "customer", lambda ctx: ("/api/menu-items/", None)),
+        ("menu_item_list_sparse", "get", "customer", lambda ctx: ("/api/menu-items/?fields=id,name,price", None)),
+        ("menu_item_list_expanded", "get", "customer", lambda ctx: ("/api/menu-items/?expand=category", None)),
+        ("menu_item_search", "get", "customer", lambda ctx: ("/api/menu-items/?search=spicy+rice", None)),
+        ("menu_item_by_restaurant", "get", "customer", lambda ctx: (
+            f"/api/menu-items/?restaurant={ctx.big_menu.pk}", None)),
+        ("menu_item_facets", "get", "customer", lambda ctx: (
+            f"/api/menu-items/?restaurant={ctx.big_menu.pk}&facets=1", None)),
+        ("menu_item_facets_filtered", "get", "customer", lambda ctx: (
+            f"/api/menu-items/?restaurant={ctx.big_menu.pk}&category={ctx.big_menu_category.pk}"
+            "&min_price=10&max_price=50&ordering=price&facets=1", None)),
+    ],
+    "api/menu-items/<int:pk>/": [
+        ("menu_item_detail", "get", "customer", lambda ctx: (f"/api/menu-items/{ctx.menu_item.pk}/", None)),
+        ("menu_item_detail_304", "revalidate", "customer", lambda ctx: (f"/api/menu-items/{ctx.menu_item.pk}/", None)),
+    ],
+    "api/order-items/": [("order_item_list", "get", "customer", lambda ctx: ("/api/order-items/", None))],
+    "api/orders/": [
+        ("order_list", "get", "customer", lambda ctx: ("/api/orders/", None)),
+        ("order_list_304", "revalidate", "customer", lambda ctx: ("/api/orders/", None)),
+        ("order_list_sparse", "get", "customer", lambda ctx: ("/api/orders/?fields=id,status,total_price", None)),
+        ("order_list_item_names", "get", "customer", lambda ctx: (
+            "/api/orders/?fields=id,status,order_items.quantity,order_items.menu_item.name", None)),
+        ("order_list_expanded", "get", "customer", lambda ctx: ("/api/orders/?expand=restaurant", None)),
+    ],
+    "api/orders/<int:pk>/": [
+        ("order_detail", "get", "customer", lambda ctx: (f"/api/orders/{ctx.order.pk}/", None)),
+        ("order_detail_304", "revalidate", "customer", lambda ctx: (f"/api/orders/{ctx.order.pk}/", None)),
+        ("order_detail_sparse", "get", "customer", lambda ctx: (
+            f"/api/orders/{ctx.order.pk}/?fields=id,status,total_price", None)),
+        ("order_status_update", "patch", "customer", lambda ctx: (
+            f"/api/orders/{ctx.order.pk}/", {"status": "CANCELLED" if ctx.order.status != "CANCELLED" else "PENDING"})),
+    ],
+    "metrics": [("metrics", "get", "admin", lambda ctx: ("/metrics", None))],
+    "api/couriers/me/": [
+        ("courier_detail", "get", "courier", lambda ctx: ("/api/couriers/me/", None)),
+        ("courier_location", "patch", "courier", lambda ctx: (
+            "/api/couriers/me/", {"latitude": CITY_CENTRE[0], "longitude": CITY_CENTRE[1], "is_available": True})),
+    ],
+    "api/couriers/me/orders/<int:pk>/delivered/": [("courier_delivered", "post", "courier", lambda ctx: (
+        f"/api/couriers/me/orders/{ctx.delivery.pk if ctx.delivery else 0}/delivered/", None))],
+    "api/checkout/": [("checkout", "post", "customer", lambda ctx: (
+        "/api/checkout/",
+        {"restaurant": ctx.restaurant.pk, "items": [{"menu_item": ctx.menu_item.pk, "quantity": 2}]}))],
+}
+
+# Routes that can't be timed as a single request/response
+SKIPPED_ROUTES = {
+    "admin/": "Django admin",
+    "api/orders/stream/": "long-lived server-sent events stream (needs ASGI)",
+}
+
+
+class RolledBack(Exception):
+    pass
+
+
+def send(client, ctx, method, role, builder):
+    path, body = builder(ctx)
+    headers = ctx.auth(role) if role else {}
+    if method == "get":
+        return client.get(path, **headers)
+    if method == "revalidate":
+        # A GET sending back the ETag an earlier GET of the same path got
+        if path not in ctx.etags:
+            ctx.etags[path] = client.get(path, **headers)["ETag"]
+        return client.get(path, HTTP_IF_NONE_MATCH=ctx.etags[path], **headers)
+    if method == "multipart":
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        body = {key: SimpleUploadedFile(*value) for key, value in body.items()}
+        return client.post(path, body, **headers)
+    return getattr(client, method)(path, json.dumps(body), content_type="application/json", **headers)
+
+
+def timed_request(client, ctx, method, role, builder):
+    """One request; writes are rolled back. Returns (seconds, response)."""
+    if method in ("get", "revalidate"):
+        started = time.perf_counter()
+        response = send(client, ctx, method, role, builder)
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        return time.perf_counter() - started, response
+
+    result = {}
+    try:
+        with transaction.atomic():
+            started = time.perf_counter()
+            response = send(client, ctx, method, role, builder)
+            result["elapsed"] = time.perf_counter() - started
+            result["response"] = response
+            raise RolledBack
+    except RolledBack:
+        pass
+    return result["elapsed"], result["response"]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_scenario(client, ctx, method, role, builder, iterations, warmup):
+    for _ in range(warmup):
+        timed_request(client, ctx, method, role, builder)
+
+    with CaptureQueriesContext(connection) as queries:
+        _, response = timed_request(client, ctx, method, role, builder)
+    query_count = len(queries.captured_queries)
+    gc.collect()
+    tracemalloc.start()
+    timed_request(client, ctx, method, role, builder)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    query_seconds = []
+
+    def time_query(execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            query_seconds.append(time.perf_counter() - started)
+
+    latencies = []
+    started = time.perf_counter()
+    with connection.execute_wrapper(time_query):
+        for _ in range(iterations):
+            elapsed, _ = timed_request(client, ctx, method, role, builder)
+            latencies.append(elapsed * 1000)
+    wall = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "method": {"multipart": "POST", "revalidate": "GET"}.get(method, method.upper()),
+        "status": response.status_code,
+        "iterations": iterations,
+        "queries": query_count,
+        # Body size; ?fields=/?expand= scenarios compare payloads
+        "response_bytes": None if response.streaming else len(response.content),
+        # Mean time per request spent waiting on the database
+        "sql_ms": sum(query_seconds) * 1000 / iterations if iterations else None,
+        "p50_ms": percentile(latencies, 0.50),
+        "p90_ms": percentile(latencies, 0.90),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "mean_ms": statistics.fmean(latencies) if latencies else None,
+        "max_ms": latencies[-1] if latencies else None,
+        "throughput_rps": iterations / wall if wall else None,
+        "peak_alloc_kb": peak // 1024,
+    }
+
+
+def run_benchmarks(iterations=50, warmup=5, only=None, log=None):
+    """
+    Drive every route in the URLconf and return a JSON-serialisable report.
+    Routes without a scenario are listed under "unbenchmarked".
+    """
+    log = log or (lambda message: None)
+    ctx = BenchmarkContext()
+    client = Client()
+    results, unbenchmarked = {}, {}
+    for route in iter_routes():
+        if route in SKIPPED_ROUTES or route.startswith("admin/"):
+            unbenchmarked[route] = SKIPPED_ROUTES.get(route, SKIPPED_ROUTES["admin/"])
+            continue
+        if route not in SCENARIOS:
+            unbenchmarked[route] = "no scenario defined"
+            continue
+        for name, method, role, builder in SCENARIOS[route]:
+            if only and name not in only:
+                continue
+            log(f"{name} ({route})")
+            results[name] = {"route": route, **run_scenario(client, ctx, method, role, builder, iterations, warmup)}
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "iterations": iterations,
+            "warmup": warmup,
+            "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "rows": {
+                "restaurants": Restaurant.objects.count(),
+                "menu_items": MenuItem.objects.count(),
+                "orders": Order.objects.count(),
+                "order_items": OrderItem.objects.count(),
+            },
+        },
+        "results": results,
+        "unbenchmarked": unbenchmarked,
+    }
+
+
+def archive_scenarios(hot_order, cold_order):
+    """Order reads for a kept (hot) order and one that gets archived (cold)."""
+    return [
+        ("order_list", "get", "customer", lambda ctx: ("/api/orders/", None)),
+        ("order_list_by_price", "get", "customer", lambda ctx: ("/api/orders/?ordering=-total_price", None)),
+        ("order_list_numbered", "get", "admin", lambda ctx: ("/api/orders/?page=1", None)),
+        ("order_detail", "get", "customer", lambda ctx: (f"/api/orders/{hot_order.pk}/", None)),
+        ("order_list_history", "get", "customer", lambda ctx: ("/api/orders/?history=1", None)),
+        ("order_detail_history", "get", "customer", lambda ctx: (f"/api/orders/{cold_order.pk}/?history=1", None)),
+    ]
+
+
+def order_row_counts():
+    return {
+        "orders": Order.objects.count(),
+        "order_items": OrderItem.objects.count(),
+        "archived_orders": ArchivedOrder.objects.count(),
+        "archived_order_items": ArchivedOrderItem.objects.count(),
+    }
+
+
+def run_archive_benchmark(iterations=50, warmup=5, options=None, log=None):
+    """
+    Time the order read paths, archive (`options` override ARCHIVE) and
+    time them again. The archiving is committed: reseed to start over.
+    """
+    log = log or (lambda message: None)
+    options = {**archive_settings(), "PAUSE": 0, **(options or {})}
+    ctx = BenchmarkContext()
+    # Customers only see their own orders
+    orders = Order.objects.filter(customer=ctx.customer).order_by('pk')
+    hot_order = orders.exclude(status__in=options["STATUSES"]).first()
+    cold_order = orders.filter(status__in=options["STATUSES"]).first()
+    if hot_order is None or cold_order is None:
+        raise ValueError("Need orders both in and out of the archived statuses; run seed_benchmark_data first")
+    client = Client()
+    scenarios = archive_scenarios(hot_order, cold_order)
+
+    def measure(stage):
+        results = {}
+        for name, method, role, builder in scenarios:
+            log(f"{stage}: {name}")
+            results[name] = run_scenario(client, ctx, method, role, builder, iterations, warmup)
+        return {"rows": order_row_counts(), "results": results}
+
+    report = {"before": measure("before")}
+    started = time.perf_counter()
+    report["archiving"] = {**archive_orders(options=options), "seconds": time.perf_counter() - started}
+    report["after"] = measure("after")
+
+    report["meta"] = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "database": connection.vendor,
+        "iterations": iterations,
+        "warmup": warmup,
+        "age_days": options["AGE_DAYS"],
+        "statuses": list(options["STATUSES"]),
+    }
+    return report
+
+
+def compare_to_baseline(report, baseline, threshold=0.10):
+    """
+    Compare p50/p95 latency and query counts per scenario. Returns a list of
+    {"scenario", "metric", "baseline", "current", "change"} regressions.
+    """
+    regressions = []
+    for name, current in report["results"].items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None:
+            continue
+        if current["queries"] > previous["queries"]:
+            regressions.append({
+                "scenario": name, "metric": "queries",
+                "baseline": previous["queries"], "current": current["queries"],
+                "change": current["queries"] - previous["queries"],
+            })
+        for metric in ("p50_ms", "p95_ms"):
+            if previous.get(metric) and current.get(metric) is not None:
+                change = current[metric] / previous[metric] - 1
+                if change > threshold:
+                    regressions.append({
+                        "scenario": name, "metric": metric,
+                        "baseline": previous[metric], "current": current[metric], "change": round(change, 4),
+                    })
+    return regressions
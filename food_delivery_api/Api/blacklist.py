@@ -0,0 +1,166 @@
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.utils import aware_utcnow
+
+
+# Answers "is this refresh token revoked?" from an in-process hash set of
+# unexpired blacklisted jtis. The set is topped up from the database at most
+# once per SYNC_INTERVAL, so a refresh costs no query in the common case and
+# refresh latency doesn't grow with the size of the blacklist tables.
+# Revocations are also written to a shared Django cache, so other workers
+# refuse a logged-out token straight away instead of at their next sync.
+
+REVOKED_KEY = "auth:revoked:{}"
+
+def blacklist_settings():
+    options = {
+        "SYNC_INTERVAL": 5,
+        "SYNC_OVERLAP": 60,
+        "PRUNE_INTERVAL": 3600,
+        "PRUNE_BATCH_SIZE": 1000,
+        "CACHE": "default",
+    }
+    options.update(getattr(settings, 'TOKEN_BLACKLIST', None) or {})
+    return options
+
+
+class RevocationList:
+    def __init__(self, sync_interval=5, sync_overlap=60, shared=None):
+        self.sync_interval = sync_interval
+        self.shared = shared
+        # Rows are read back by blacklisted_at with this much overlap so a
+        # slow transaction committing an older timestamp is never missed
+        self.sync_overlap = timedelta(seconds=sync_overlap)
+        self._revoked = {}
+        self._synced_at = None
+        self._synced_until = None
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    def is_revoked(self, jti):
+        with self._lock:
+            if jti in self._revoked:
+                return True
+            fresh = self._synced_at is not None and time.monotonic() - self._synced_at < self.sync_interval
+        if not fresh:
+            self.sync()
+            with self._lock:
+                if jti in self._revoked:
+                    return True
+        return self.revoked_elsewhere(jti)
+
+    def revoked_elsewhere(self, jti):
+        # Revoked by another worker since the last sync
+        if self.shared is None:
+            return False
+        expires_at = self.shared.get(REVOKED_KEY.format(jti))
+        if expires_at is None:
+            return False
+        with self._lock:
+            self._revoked[jti] = expires_at
+        return True
+
+    def add(self, jti, expires_at):
+        with self._lock:
+            self._revoked[jti] = expires_at
+        if self.shared is not None:
+            # Kept until the token would have expired anyway
+            timeout = int((expires_at - aware_utcnow()).total_seconds()) + 1
+            if timeout > 0:
+                self.shared.set(REVOKED_KEY.format(jti), expires_at, timeout=timeout)
+
+    def sync(self):
+        with self._sync_lock:
+            now = aware_utcnow()
+            revoked = BlacklistedToken.objects.filter(token__expires_at__gt=now)
+            if self._synced_until is not None:
+                revoked = revoked.filter(blacklisted_at__gte=self._synced_until - self.sync_overlap)
+            rows = list(revoked.values_list('token__jti', 'token__expires_at'))
+
+            with self._lock:
+                self._revoked.update(rows)
+                # Expired tokens fail signature checks anyway; forget them
+                for jti in [jti for jti, expires_at in self._revoked.items() if expires_at <= now]:
+                    del self._revoked[jti]
+                self._synced_until = now
+                self._synced_at = time.monotonic()
+
+    def __len__(self):
+        return len(self._revoked)
+
+
+_revocations = None
+_revocations_lock = threading.Lock()
+
+
+def get_revocation_list():
+    global _revocations
+    if _revocations is None:
+        with _revocations_lock:
+            if _revocations is None:
+                options = blacklist_settings()
+                alias = options["CACHE"]
+                _revocations = RevocationList(
+                    options["SYNC_INTERVAL"], options["SYNC_OVERLAP"], shared=caches[alias] if alias else None
+                )
+    return _revocations
+
+
+def reset_revocation_list():
+    global _revocations
+    with _revocations_lock:
+        _revocations = None
+
+
+def prune_expired_tokens(batch_size=1000):
+    """
+    Delete outstanding (and so blacklisted) tokens that have expired, in
+    batches so no single statement holds locks for long. Returns the count.
+    """
+    now = aware_utcnow()
+    pruned = 0
+    while True:
+        ids = list(
+            OutstandingToken.objects.filter(expires_at__lte=now)
+            .order_by()
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return pruned
+        OutstandingToken.objects.filter(id__in=ids).delete()
+        pruned += len(ids)
+
+
+_last_prune = None
+_prune_lock = threading.Lock()
+
+
+def maybe_prune_expired_tokens():
+    """Start a background prune if PRUNE_INTERVAL has passed in this process."""
+    global _last_prune
+    options = blacklist_settings()
+    if not options["PRUNE_INTERVAL"]:
+        return None
+    with _prune_lock:
+        if _last_prune is not None and time.monotonic() - _last_prune < options["PRUNE_INTERVAL"]:
+            return None
+        _last_prune = time.monotonic()
+
+    thread = threading.Thread(
+        target=prune_in_background, args=(options["PRUNE_BATCH_SIZE"],), daemon=True
+    )
+    thread.start()
+    return thread
+
+
+def prune_in_background(batch_size):
+    from django.db import connection
+    try:
+        prune_expired_tokens(batch_size)
+    finally:
+        connection.close()
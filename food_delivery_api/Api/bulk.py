@@ -0,0 +1,303 @@
+import codecs
+import csv
+import json
+from decimal import Decimal
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+from rest_framework import serializers
+
+from .facets import parse_id
+from .menu import invalidate_menu
+from .models import MenuCategory, MenuItem, Order, OrderItem
+
+
+# Bulk menu import/export. Uploads are parsed row by row and written in
+# batches (one transaction per batch), and exports are generators over
+# chunked querysets, so neither side holds a whole menu or order history in
+# memory.
+
+IMPORT_BATCH_SIZE = 500
+EXPORT_CHUNK_SIZE = 2000
+MENU_EXPORT_FIELDS = ['id', 'category', 'name', 'description', 'price']
+ORDER_EXPORT_FIELDS = [
+    'order', 'created_at', 'status', 'total_price', 'customer', 'menu_item', 'menu_item_name', 'quantity', 'price',
+]
+
+
+class MenuItemImportRowSerializer(serializers.Serializer):
+    id = serializers.IntegerField(required=False, allow_null=True)
+    category = serializers.CharField(max_length=250)
+    name = serializers.CharField(max_length=100)
+    description = serializers.CharField(required=False, allow_blank=True, default="")
+    price = serializers.DecimalField(max_digits=8, decimal_places=2, min_value=Decimal("0"))
+
+
+def iter_csv_rows(fileobj):
+    reader = csv.DictReader(codecs.iterdecode(fileobj, 'utf-8-sig'))
+    for row in reader:
+        # Empty cells mean "not given", e.g. no id for a new item
+        yield {key: value for key, value in row.items() if key and value not in (None, "")}
+
+
+def iter_json_rows(fileobj, chunk_size=64 * 1024):
+    """
+    Yield objects from a JSON array or from JSON Lines without reading the
+    whole upload, by decoding one value at a time from a rolling buffer.
+    """
+    decoder = json.JSONDecoder()
+    reader = codecs.getincrementaldecoder('utf-8-sig')()
+    buffer = ""
+    position = 0
+    in_array = None
+    eof = False
+    while True:
+        # Skip whitespace and the array punctuation between values
+        while position < len(buffer) and (buffer[position].isspace() or buffer[position] in ",]"):
+            position += 1
+        if in_array is None and position < len(buffer):
+            in_array = buffer[position] == "["
+            if in_array:
+                position += 1
+                continue
+        if position < len(buffer):
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                # A number at the very end of the buffer may still be growing
+                if end < len(buffer) or eof:
+                    yield value
+                    position = end
+                    continue
+        if eof:
+            return
+        chunk = fileobj.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[position:] + reader.decode(chunk or b"", final=eof)
+        position = 0
+
+
+def iter_import_rows(fileobj, fmt):
+    if fmt == 'csv':
+        return iter_csv_rows(fileobj)
+    if fmt == 'json':
+        return iter_json_rows(fileobj)
+    raise ValueError(f"Unsupported import format: {fmt}")
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def category_id(ref):
+    try:
+        return parse_id(ref, "category")
+    except serializers.ValidationError:
+        return None
+
+
+class MenuImport:
+    """
+    Imports menu items for one restaurant. Rows reference categories by id or
+    by name; items are matched for update by id, or else by (category, name).
+    """
+
+    max_reported_errors = 100
+
+    def __init__(self, restaurant, create_categories=False, batch_size=IMPORT_BATCH_SIZE):
+        self.restaurant = restaurant
+        self.create_categories = create_categories
+        self.batch_size = batch_size
+        self.created = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = []
+
+    def run(self, rows):
+        numbered = enumerate(rows, start=1)
+        try:
+            for batch in batched(numbered, self.batch_size):
+                self.import_batch(batch)
+        except (ValueError, csv.Error) as exc:
+            self.add_error(None, {"non_field_errors": [f"Could not parse upload: {exc}"]})
+        if self.created or self.updated:
+            invalidate_menu(self.restaurant.pk)
+        return self
+
+    def add_error(self, row_number, errors):
+        self.error_count += 1
+        if len(self.errors) < self.max_reported_errors:
+            self.errors.append({"row": row_number, "errors": errors})
+
+    def import_batch(self, batch):
+        valid = []
+        for number, row in batch:
+            if not isinstance(row, dict):
+                self.add_error(number, {"non_field_errors": ["Expected an object"]})
+                continue
+            serializer = MenuItemImportRowSerializer(data=row)
+            if serializer.is_valid():
+                valid.append((number, serializer.validated_data))
+            else:
+                self.add_error(number, serializer.errors)
+        if not valid:
+            return
+
+        with transaction.atomic():
+            categories = self.resolve_categories({data["category"] for _, data in valid})
+            rows = []
+            for number, data in valid:
+                category = categories.get(data["category"])
+                if category is None:
+                    self.add_error(number, {"category": [f"Unknown category '{data['category']}'"]})
+                else:
+                    rows.append((number, category, data))
+            self.write(rows)
+
+    def resolve_categories(self, references):
+        """
+        One query for every category this batch mentions. A reference that
+        reads as an id matches that category, else one with it as its name.
+        """
+        restaurant_categories = MenuCategory.objects.filter(restaurant=self.restaurant)
+        ids = {ref: category_id(ref) for ref in references}
+        by_id, by_name = {}, {}
+        for category in (
+            restaurant_categories.filter(pk__in={pk for pk in ids.values() if pk is not None})
+            | restaurant_categories.filter(name__in=references)
+        ):
+            by_id[category.pk] = category
+            by_name.setdefault(category.name, category)
+        found = {}
+        for ref in references:
+            category = by_id.get(ids[ref]) or by_name.get(ref)
+            if category is not None:
+                found[ref] = category
+
+        # An unknown id is reported rather than created as a category name
+        missing = [ref for ref in references if ref not in found and ids[ref] is None]
+        if missing and self.create_categories:
+            for category in MenuCategory.objects.bulk_create(
+                MenuCategory(restaurant=self.restaurant, name=name) for name in missing
+            ):
+                found[category.name] = category
+        return found
+
+    def write(self, rows):
+        ids = {data["id"] for _, _, data in rows if data.get("id")}
+        existing = MenuItem.objects.filter(category__restaurant=self.restaurant).filter(
+            pk__in=ids
+        ) | MenuItem.objects.filter(
+            category__in={category for _, category, _ in rows}, name__in={data["name"] for _, _, data in rows}
+        )
+        by_id = {}
+        by_name = {}
+        for item in existing:
+            by_id[item.pk] = item
+            by_name.setdefault((item.category_id, item.name), item)
+
+        to_create, to_update = [], {}
+        for number, category, data in rows:
+            item = by_id.get(data["id"]) if data.get("id") else by_name.get((category.pk, data["name"]))
+            if data.get("id") and item is None:
+                self.add_error(number, {"id": [f"Menu item {data['id']} not found in this restaurant"]})
+                continue
+            if item is None:
+                item = MenuItem(category=category)
+                to_create.append(item)
+                by_name[(category.pk, data["name"])] = item
+            elif item.pk is not None:
+                to_update[item.pk] = item
+            item.category = category
+            item.name = data["name"]
+            item.description = data["description"]
+            item.price = data["price"]
+
+        MenuItem.objects.bulk_create(to_create)
+        # bulk_update leaves auto_now fields alone
+        now = timezone.now()
+        for item in to_update.values():
+            item.updated_at = now
+        MenuItem.objects.bulk_update(list(to_update.values()), ['category', 'name', 'description', 'price', 'updated_at'])
+        self.created += len(to_create)
+        self.updated += len(to_update)
+
+    def summary(self):
+        return {
+            "created": self.created,
+            "updated": self.updated,
+            "error_count": self.error_count,
+            "errors": self.errors,
+        }
+
+
+def menu_export_rows(restaurant):
+    return (
+        MenuItem.objects.filter(category__restaurant=restaurant)
+        .order_by('category_id', 'id')
+        .values_list('id', 'category_id', 'name', 'description', 'price')
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+
+
+def order_export_rows(restaurant):
+    # One row per order line; orders without items still get one row
+    orders = (
+        Order.objects.filter(restaurant=restaurant)
+        .select_related('customer')
+        .only('id', 'created_at', 'status', 'total_price', 'customer__username')
+        .prefetch_related(
+            Prefetch('order_items', queryset=OrderItem.objects.select_related('menu_item').only(
+                'order_id', 'menu_item_id', 'menu_item__name', 'quantity', 'price',
+            ).order_by('id'))
+        )
+        .order_by('id')
+    )
+    for order in orders.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        head = (order.pk, order.created_at, order.status, order.total_price, order.customer.username)
+        items = order.order_items.all()
+        if not items:
+            yield head + (None, None, None, None)
+        for item in items:
+            yield head + (item.menu_item_id, item.menu_item.name, item.quantity, item.price)
+
+
+class Echo:
+    # csv.writer target that hands each formatted line straight back
+    def write(self, value):
+        return value
+
+
+def stream_csv(header, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def stream_json(header, rows):
+    encoder = DjangoJSONEncoder(separators=(",", ":"))
+    yield "["
+    separator = ""
+    for row in rows:
+        yield separator + encoder.encode(dict(zip(header, row)))
+        separator = ","
+    yield "]"
+
+
+def stream_export(fmt, header, rows):
+    if fmt == 'csv':
+        return stream_csv(header, rows)
+    return stream_json(header, rows)
@@ -0,0 +1,197 @@
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, router, transaction
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+
+# Conditional requests. Restaurants, menu categories, menu items and orders
+# carry an updated_at that every write bumps, so a response's version is
+# known as soon as its rows are loaded, with no extra query: the ETag hashes
+# each row's (pk, updated_at), plus the newest updated_at of anything it
+# embeds (an order's menu items, when loaded), and Last-Modified is the newest of them.
+# A matching If-None-Match is answered with 304 before anything is
+# serialized. On PUT/PATCH/DELETE, If-Match is compared with the row as
+# locked for the write, so two clients editing one version can't both win.
+# A single row's ETag is "<row version>.<representation>": the row version
+# (pk and updated_at) is what If-Match checks, so an ETag from any shape of
+# the row (?fields=, ?expand=, ?history=1) guards a write to it.
+
+
+class NotModified(Exception):
+    pass
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = "The resource has changed since you read it."
+    default_code = 'precondition_failed'
+
+
+def header_values(request, name):
+    return [value.strip() for value in request.headers.get(name, "").split(",") if value.strip()]
+
+
+def etag_matches(request, etag):
+    # If-None-Match uses the weak comparison
+    candidates = header_values(request, "If-None-Match")
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def if_match(request, version):
+    # Strong comparison on the row version part; weak tags never match
+    for candidate in header_values(request, "If-Match"):
+        if candidate == "*":
+            return True
+        if candidate.startswith('"') and candidate.strip('"').split(".")[0] == version:
+            return True
+    return False
+
+
+def make_digest(*parts):
+    payload = json.dumps(parts, cls=DjangoJSONEncoder, separators=(",", ":"))
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def row_version(item):
+    if isinstance(item, dict):
+        return make_digest(item['pk'], item['updated_at'])[:16]
+    return make_digest(item.pk, item.updated_at)[:16]
+
+
+def loaded_related(obj, name):
+    # Only what's already prefetched or joined; a relation the response's
+    # shape (Api/fieldsets.py) left out isn't part of its version
+    if name in getattr(obj, '_prefetched_objects_cache', {}):
+        return list(getattr(obj, name).all())
+    field = obj._meta.get_field(name)
+    if field.is_relation and not field.many_to_many and not field.one_to_many and field.is_cached(obj):
+        value = getattr(obj, name)
+        return [] if value is None else [value]
+    return []
+
+
+def related_objects(obj, path):
+    # Follows a lookup path like 'order_items__menu_item' through loaded rows
+    objects = [obj]
+    for name in path.split("__"):
+        objects = [related for current in objects for related in loaded_related(current, name)]
+    return objects
+
+
+def lock_for_write(queryset):
+    features = connections[queryset.db].features
+    if not features.has_select_for_update:
+        return queryset
+    return queryset.select_for_update(**({'of': ('self',)} if features.has_select_for_update_of else {}))
+
+
+class ConditionalViewMixin:
+    """
+    ETag/Last-Modified on GETs of list pages and single rows, 304s for
+    If-None-Match (and If-Modified-Since on single rows), 412s for a stale
+    If-Match on writes. `etag_embeds` lists lookup paths to related rows
+    whose changes show up in the representation.
+    """
+
+    etag_embeds = ()
+    validators = None
+    # Lock the row for every write, not just If-Match ones, when saving it
+    # derives something from the loaded values (order rollup deltas)
+    lock_writes = False
+
+    def locks_row(self, request):
+        return request.method not in SAFE_METHODS and (self.lock_writes or "If-Match" in request.headers)
+
+    def dispatch(self, request, *args, **kwargs):
+        if not self.locks_row(request):
+            return super().dispatch(request, *args, **kwargs)
+        with transaction.atomic(using=router.db_for_write(self.queryset.model)):
+            return super().dispatch(request, *args, **kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.locks_row(self.request):
+            return lock_for_write(queryset)
+        return queryset
+
+    def wants_validators(self):
+        return self.request.method in ('GET', 'HEAD')
+
+    def stamps(self, item):
+        if isinstance(item, dict):
+            # .values() rows from the fast read path
+            return [item['pk'], item['updated_at']]
+        stamps = [item.pk, item.updated_at]
+        for path in self.etag_embeds:
+            stamps.append(max((related.updated_at for related in related_objects(item, path)), default=None))
+        return stamps
+
+    def make_validators(self, parts, stamps, version=None):
+        dates = [stamp for row in stamps for stamp in row[1:] if stamp is not None]
+        digest = make_digest(self.request.accepted_media_type, *parts, stamps)
+        return (
+            f'"{digest}"' if version is None else f'"{version}.{digest}"',
+            max(dates, default=None),
+        )
+
+    def paginate_queryset(self, queryset):
+        return self.page_loaded(super().paginate_queryset(queryset))
+
+    def page_loaded(self, page):
+        if page is None or not self.wants_validators():
+            return page
+        # next/previous (and count for numbered pages) are part of the body too
+        envelope = {
+            key: value for key, value in self.paginator.get_paginated_response([]).data.items() if key != 'results'
+        }
+        stamps = [self.stamps(item) for item in page]
+        self.validators = self.make_validators([self.request.get_full_path(), envelope], stamps)
+        # Last-Modified can't see rows that left the page, so lists only honour If-None-Match
+        if etag_matches(self.request, self.validators[0]):
+            raise NotModified
+        return page
+
+    def check_object_permissions(self, request, obj):
+        super().check_object_permissions(request, obj)
+        self.object_loaded(obj)
+
+    def object_loaded(self, obj):
+        request = self.request
+        if request.method in SAFE_METHODS:
+            if self.wants_validators():
+                # The query string can reshape the body (?fields=, ?expand=)
+                self.validators = self.make_validators(
+                    [request.get_full_path()], [self.stamps(obj)], version=row_version(obj)
+                )
+                if self.not_modified():
+                    raise NotModified
+            return
+        if "If-Match" in request.headers and not if_match(request, row_version(obj)):
+            raise PreconditionFailed
+
+    def not_modified(self):
+        etag, last_modified = self.validators
+        if "If-None-Match" in self.request.headers:
+            return etag_matches(self.request, etag)
+        since = parse_http_date_safe(self.request.headers.get("If-Modified-Since", ""))
+        return since is not None and last_modified is not None and int(last_modified.timestamp()) <= since
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return Response(status=status.HTTP_304_NOT_MODIFIED)
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.validators is not None and response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            etag, last_modified = self.validators
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified.timestamp())
+        return response
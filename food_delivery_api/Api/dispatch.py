@@ -0,0 +1,358 @@
+import heapq
+import math
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Case, Exists, IntegerField, OuterRef, Value, When
+from django.utils import timezone
+
+from . import analytics
+from .events import publish_order_status
+from .geo import EARTH_RADIUS_KM, KM_PER_DEGREE
+from .models import Courier, Order
+
+
+# Courier dispatch. Each batch takes the oldest confirmed, unassigned orders
+# and the idle couriers with a fresh location. It pairs them so that as many
+# orders as possible get a courier, oldest first, and the total pickup
+# distance is as small as possible. Couriers are bucketed on a grid of
+# MAX_PICKUP_KM cells, so each order only costs out the couriers in its own
+# and neighbouring cells rather than a full orders x couriers matrix.
+
+ALGORITHMS = ('optimal', 'greedy')
+
+
+def dispatch_settings():
+    options = {
+        "BATCH_SIZE": 500,
+        "MAX_PICKUP_KM": 8.0,
+        "LOCATION_TTL": 120,
+        "ALGORITHM": "optimal",
+    }
+    options.update(getattr(settings, 'DISPATCH', None) or {})
+    return options
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    dlat = math.radians(lat2 - lat1)
+    dlng = math.radians(lng2 - lng1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def candidate_pairs(orders, couriers, max_km):
+    """
+    For each (lat, lng) in `orders`, the [(courier index, km)] within max_km.
+    Meant for city-sized areas: the grid doesn't wrap at the antimeridian.
+    """
+    if not orders or not couriers:
+        return [[] for _ in orders]
+    # Scale longitude by the smallest cos(latitude) in play, so a cell is
+    # never narrower than max_km on the ground
+    widest = max(abs(lat) for lat, _ in [*orders, *couriers])
+    x_scale = KM_PER_DEGREE * max(math.cos(math.radians(widest)), 1e-6) / max_km
+    y_scale = KM_PER_DEGREE / max_km
+
+    grid = {}
+    for index, (lat, lng) in enumerate(couriers):
+        phi = math.radians(lat)
+        grid.setdefault((math.floor(lng * x_scale), math.floor(lat * y_scale)), []).append(
+            (index, phi, math.radians(lng), math.cos(phi))
+        )
+
+    # Haversine with the radius test done on the intermediate value, so
+    # rejected pairs never reach asin/sqrt
+    limit = math.sin(min(max_km / (2 * EARTH_RADIUS_KM), math.pi / 2)) ** 2
+    sin = math.sin
+    candidates = []
+    for lat, lng in orders:
+        x, y = math.floor(lng * x_scale), math.floor(lat * y_scale)
+        phi, lam = math.radians(lat), math.radians(lng)
+        cos_phi = math.cos(phi)
+        nearby = []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for index, other_phi, other_lam, other_cos in grid.get((x + dx, y + dy), ()):
+                    a = sin((other_phi - phi) / 2) ** 2 + cos_phi * other_cos * sin((other_lam - lam) / 2) ** 2
+                    if a <= limit:
+                        nearby.append((index, 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))))
+        candidates.append(nearby)
+    return candidates
+
+
+def greedy_assignment(candidates):
+    """Take the shortest remaining order-courier pair until none is left."""
+    edges = sorted((km, order, courier) for order, nearby in enumerate(candidates) for courier, km in nearby)
+    taken_orders, taken_couriers, matches = set(), set(), []
+    for km, order, courier in edges:
+        if order not in taken_orders and courier not in taken_couriers:
+            taken_orders.add(order)
+            taken_couriers.add(courier)
+            matches.append((order, courier, km))
+    return matches
+
+
+def optimal_assignment(candidates):
+    """
+    Minimum-cost matching by successive shortest paths (the Hungarian
+    method) over the sparse candidate graph. Orders are added in list order
+    and each is matched whenever any augmenting path exists, so the result
+    serves as many orders as possible, prefers earlier ones, and has the
+    lowest total distance for that set. Most searches stop after a few
+    steps because a free courier is close by.
+    """
+    order_potential = [0.0] * len(candidates)
+    courier_potential = {}
+    courier_of = {}
+    order_of = {}
+    # Couriers seen by a failed search: every path through them ends in a
+    # matched courier, and no later augmentation can change that, so they
+    # are never searched again
+    dead = set()
+
+    for root, nearby in enumerate(candidates):
+        # Dijkstra on reduced costs; matched edges are tight (cost 0 back to their order)
+        heap = [
+            (km - order_potential[root] - courier_potential.get(courier, 0.0), courier, root)
+            for courier, km in nearby if courier not in dead
+        ]
+        if not heap:
+            continue
+        heapq.heapify(heap)
+        settled = {}
+        reached_from = {}
+        order_distance = {root: 0.0}
+        free = None
+        while heap:
+            distance, courier, order = heapq.heappop(heap)
+            if courier in settled:
+                continue
+            settled[courier] = distance
+            reached_from[courier] = order
+            matched = order_of.get(courier)
+            if matched is None:
+                free = courier
+                break
+            order_distance[matched] = distance
+            base = distance - order_potential[matched]
+            for next_courier, km in candidates[matched]:
+                if next_courier not in settled and next_courier not in dead:
+                    heapq.heappush(heap, (base + km - courier_potential.get(next_courier, 0.0), next_courier, matched))
+        if free is None:
+            dead.update(settled)
+            continue
+
+        total = settled[free]
+        for order, distance in order_distance.items():
+            if distance < total:
+                order_potential[order] += total - distance
+        for courier, distance in settled.items():
+            if distance < total:
+                courier_potential[courier] = courier_potential.get(courier, 0.0) - (total - distance)
+
+        courier = free
+        while True:
+            order = reached_from[courier]
+            previous = courier_of.get(order)
+            courier_of[order] = courier
+            order_of[courier] = order
+            if order == root:
+                break
+            courier = previous
+
+    distances = [dict(nearby) for nearby in candidates]
+    return sorted((order, courier, distances[order][courier]) for order, courier in courier_of.items())
+
+
+def assign(orders, couriers, max_km, algorithm='optimal'):
+    """Pair (lat, lng) orders with (lat, lng) couriers: [(order index, courier index, km)]."""
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"Unknown dispatch algorithm {algorithm!r}; use one of {', '.join(ALGORITHMS)}")
+    candidates = candidate_pairs(orders, couriers, max_km)
+    if algorithm == 'greedy':
+        return greedy_assignment(candidates)
+    return optimal_assignment(candidates)
+
+
+def lock_rows(queryset):
+    # Lets two dispatchers (or a location update) run side by side on MySQL;
+    # SQLite serialises writers anyway
+    features = connections[queryset.db].features
+    if not features.has_select_for_update:
+        return queryset
+    options = {}
+    if features.has_select_for_update_skip_locked:
+        options['skip_locked'] = True
+    if features.has_select_for_update_of:
+        options['of'] = ('self',)
+    return queryset.select_for_update(**options)
+
+
+def idle_couriers(now, location_ttl):
+    busy = Order.objects.filter(courier=OuterRef('pk'), status='OUT_FOR_DELIVERY')
+    return (
+        Courier.objects.filter(
+            is_available=True,
+            last_seen__gte=now - timedelta(seconds=location_ttl),
+            latitude__isnull=False,
+            longitude__isnull=False,
+        )
+        .exclude(Exists(busy))
+        .order_by('pk')
+    )
+
+
+def dispatch_batch(now=None, options=None):
+    """
+    Assign one batch of confirmed orders and move them out for delivery.
+    Returns {"orders", "couriers", "assigned", "solve_ms"}.
+    """
+    options = {**dispatch_settings(), **(options or {})}
+    now = now or timezone.now()
+    with transaction.atomic():
+        orders = list(lock_rows(
+            Order.objects.filter(
+                status='CONFIRMED',
+                courier__isnull=True,
+                restaurant__latitude__isnull=False,
+                restaurant__longitude__isnull=False,
+            )
+            .select_related('restaurant')
+            .order_by('created_at', 'pk')
+        )[:options["BATCH_SIZE"]])
+        couriers = list(lock_rows(idle_couriers(now, options["LOCATION_TTL"])).only('pk', 'latitude', 'longitude')) if orders else []
+
+        started = time.perf_counter()
+        matches = assign(
+            [(order.restaurant.latitude, order.restaurant.longitude) for order in orders],
+            [(courier.latitude, courier.longitude) for courier in couriers],
+            options["MAX_PICKUP_KM"],
+            options["ALGORITHM"],
+        )
+        solve_ms = (time.perf_counter() - started) * 1000
+
+        assigned = []
+        if matches:
+            courier_ids = {orders[o].pk: couriers[c].pk for o, c, _ in matches}
+            updated = Order.objects.filter(pk__in=courier_ids, status='CONFIRMED', courier__isnull=True).update(
+                status='OUT_FOR_DELIVERY',
+                assigned_at=now,
+                updated_at=now,
+                courier_id=Case(
+                    *[When(pk=pk, then=Value(courier_id)) for pk, courier_id in courier_ids.items()],
+                    output_field=IntegerField(),
+                ),
+            )
+            if updated != len(courier_ids):
+                # Another dispatcher got to some of these first; leave the
+                # batch to the next run
+                transaction.set_rollback(True)
+                return {"orders": len(orders), "couriers": len(couriers), "assigned": 0, "solve_ms": solve_ms}
+            for o, c, _ in matches:
+                order = orders[o]
+                order.status, order.courier_id, order.assigned_at, order.updated_at = 'OUT_FOR_DELIVERY', couriers[c].pk, now, now
+                assigned.append(order)
+            # .update() sends no signals
+            analytics.record_orders_status_changed(assigned, 'CONFIRMED')
+            for order in assigned:
+                publish_order_status(order, 'CONFIRMED')
+
+    return {"orders": len(orders), "couriers": len(couriers), "assigned": len(assigned), "solve_ms": solve_ms}
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(fraction * (len(values) - 1))))]
+
+
+def simulate(orders=5000, couriers=800, hours=2.0, interval=30, algorithm='optimal', max_km=8.0,
+             batch_size=500, speed_kmh=20.0, restaurants=300, area_km=20.0, centre=(5.6037, -0.1870), seed=42):
+    """
+    Replay a synthetic evening in memory: orders arrive at random
+    restaurants over `hours`, a batch of the oldest `batch_size` waiting
+    orders runs every `interval` seconds, and an assigned courier rides to
+    the restaurant, then to the customer, and is free again where it
+    dropped off. Reports time per batch and how long orders waited and took
+    to arrive. Stops at four times `hours` if the fleet can't keep up.
+    """
+    rng = random.Random(seed)
+    half = area_km / 2 / KM_PER_DEGREE
+
+    def point(around=centre, spread=half):
+        return (around[0] + rng.uniform(-spread, spread), around[1] + rng.uniform(-spread, spread))
+
+    kitchens = [point() for _ in range(restaurants)]
+    duration = hours * 3600
+    arrivals = sorted(
+        (rng.uniform(0, duration), rng.choice(kitchens)) for _ in range(orders)
+    )
+    # Customers live within ~3km of where they order from
+    drop_offs = [point(kitchen, 3 / KM_PER_DEGREE) for _, kitchen in arrivals]
+    fleet = [point() for _ in range(couriers)]
+    free_at = [0.0] * couriers
+
+    pending = []
+    next_arrival = 0
+    batches, waits, pickups, deliveries = [], [], [], []
+    clock = 0.0
+    while next_arrival < len(arrivals) or pending:
+        clock += interval
+        while next_arrival < len(arrivals) and arrivals[next_arrival][0] <= clock:
+            pending.append(next_arrival)
+            next_arrival += 1
+        idle = [index for index in range(couriers) if free_at[index] <= clock]
+        if not pending or not idle:
+            if clock > duration * 4:
+                break
+            continue
+
+        batch = pending[:batch_size]
+        started = time.perf_counter()
+        matches = assign(
+            [arrivals[order][1] for order in batch], [fleet[index] for index in idle], max_km, algorithm
+        )
+        batches.append({
+            "orders": len(batch), "couriers": len(idle), "assigned": len(matches),
+            "ms": (time.perf_counter() - started) * 1000,
+        })
+
+        served = set()
+        for o, c, km in matches:
+            order, courier = batch[o], idle[c]
+            ride_km = haversine_km(*arrivals[order][1], *drop_offs[order])
+            finished = clock + (km + ride_km) / speed_kmh * 3600
+            free_at[courier] = finished
+            fleet[courier] = drop_offs[order]
+            waits.append(clock - arrivals[order][0])
+            pickups.append(km)
+            deliveries.append(finished - arrivals[order][0])
+            served.add(o)
+        pending = [order for position, order in enumerate(pending) if position not in served]
+        if clock > duration * 4:
+            break
+
+    batch_ms = [batch["ms"] for batch in batches]
+    return {
+        "algorithm": algorithm,
+        "orders": orders,
+        "couriers": couriers,
+        "batches": len(batches),
+        "assigned": len(pickups),
+        "unassigned": orders - len(pickups),
+        "batch_ms_mean": statistics.fmean(batch_ms) if batch_ms else None,
+        "batch_ms_p95": percentile(batch_ms, 0.95),
+        "batch_ms_max": max(batch_ms, default=None),
+        "largest_batch": max(((b["orders"], b["couriers"]) for b in batches), default=None),
+        "wait_min_p50": (percentile(waits, 0.50) or 0) / 60,
+        "wait_min_p95": (percentile(waits, 0.95) or 0) / 60,
+        "pickup_km_mean": statistics.fmean(pickups) if pickups else None,
+        "pickup_km_total": sum(pickups),
+        "delivery_min_p50": (percentile(deliveries, 0.50) or 0) / 60,
+        "delivery_min_p95": (percentile(deliveries, 0.95) or 0) / 60,
+    }
@@ -0,0 +1,143 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+# Pub/sub fan-out for live order tracking. Views publish from sync code; the
+# streaming endpoint subscribes from the ASGI event loop. The broker class is
+# chosen with settings.ORDER_EVENTS_BROKER so a multi-node deployment can
+# swap in a Redis (or similar) backend with the same interface.
+
+class Subscription:
+    def __init__(self, broker, channel, maxsize):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    async def get(self, timeout=None):
+        """Wait for the next event; raises TimeoutError after `timeout` seconds."""
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def deliver(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # A stalled client drops events rather than growing memory;
+            # it can always re-sync with GET /orders/<pk>/.
+            pass
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class BaseBroker:
+    def publish(self, channel, event):
+        raise NotImplementedError
+
+    def subscribe(self, channel):
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+
+#Single-process broker: fine for one node and for tests
+class InProcessBroker(BaseBroker):
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # The subscriber's event loop is gone
+                self.unsubscribe(subscription)
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel, self.queue_size)
+        with self._lock:
+            self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscriptions.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscriptions[subscription.channel]
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                broker_class = import_string(getattr(settings, 'ORDER_EVENTS_BROKER', 'Api.events.InProcessBroker'))
+                _broker = broker_class()
+    return _broker
+
+
+def reset_broker():
+    global _broker
+    with _broker_lock:
+        _broker = None
+
+
+def user_channel(user_id):
+    return f"user:{user_id}"
+
+
+def publish_order_status(order, previous_status):
+    """Tell the order's customer and restaurant owner about a status change, after commit."""
+    event = {
+        "type": "order.status",
+        "order": order.pk,
+        "restaurant": order.restaurant_id,
+        "status": order.status,
+        "previous_status": previous_status,
+    }
+    owner_id = order.restaurant.owner_id
+
+    def send():
+        broker = get_broker()
+        for user_id in {order.customer_id, owner_id}:
+            broker.publish(user_channel(user_id), event)
+
+    transaction.on_commit(send)
+
+
+async def order_event_stream(user_id, order_id=None, heartbeat=15):
+    """
+    Server-sent events for one user's orders. Subscribes lazily so the queue
+    lives on the event loop that serves the response.
+    """
+    subscription = get_broker().subscribe(user_channel(user_id))
+    try:
+        yield ": connected\n\n"
+        while True:
+            try:
+                event = await subscription.get(timeout=heartbeat)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if order_id is not None and event["order"] != order_id:
+                continue
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+    finally:
+        subscription.close()
@@ -0,0 +1,190 @@
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db.models import Count, Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+
+# Faceted menu browsing. ?restaurant=, ?category= and ?min_price=/?max_price=
+# narrow the menu item list, and ?facets=1 adds counts next to the page:
+# items per category (ignoring the category filter, so the other categories
+# still show what they'd give) and items per price bucket (ignoring the
+# price range). Both come from one GROUP BY category query with a filtered
+# COUNT per bucket, read off the menuitem_category_price_idx index.
+
+FACETS_PARAM = "facets"
+CENT = Decimal("0.01")
+# BigAutoField's upper bound; larger ids overflow the database driver
+MAX_ID = 9223372036854775807
+
+
+def facet_settings():
+    options = {
+        # Bucket edges; each bucket is [edge, next edge), plus one below and one above
+        "PRICE_BUCKETS": (5, 10, 20, 50, 100),
+    }
+    options.update(getattr(settings, 'MENU_FACETS', None) or {})
+    return options
+
+
+def price_buckets():
+    edges = [Decimal(edge).quantize(CENT) for edge in facet_settings()["PRICE_BUCKETS"]]
+    return list(zip([None, *edges], [*edges, None]))
+
+
+def bucket_q(low, high):
+    condition = Q()
+    if low is not None:
+        condition &= Q(price__gte=low)
+    if high is not None:
+        condition &= Q(price__lt=high)
+    return condition
+
+
+class MenuSelection:
+    """The restaurant, categories and price range a request asked for."""
+
+    def __init__(self, restaurant=None, categories=(), min_price=None, max_price=None):
+        self.restaurant = restaurant
+        self.categories = list(categories)
+        self.min_price = min_price
+        self.max_price = max_price
+
+    def price_q(self):
+        condition = Q()
+        if self.min_price is not None:
+            condition &= Q(price__gte=self.min_price)
+        if self.max_price is not None:
+            condition &= Q(price__lte=self.max_price)
+        return condition
+
+    def category_q(self):
+        return Q(category_id__in=self.categories) if self.categories else Q()
+
+    def scope(self, queryset):
+        # What facets count over: everything but the faceted filters
+        if self.restaurant is not None:
+            queryset = queryset.filter(category__restaurant_id=self.restaurant)
+        return queryset
+
+    def narrow(self, queryset):
+        return queryset.filter(self.category_q(), self.price_q())
+
+
+def facet_query(queryset, selection):
+    """One row per category with its count in range and a count per price bucket."""
+    buckets = {
+        f"bucket_{i}": Count('pk', filter=bucket_q(low, high))
+        for i, (low, high) in enumerate(price_buckets())
+    }
+    return (
+        queryset.order_by()
+        .values('category_id', 'category__name')
+        .annotate(items=Count('pk', filter=selection.price_q()), **buckets)
+    )
+
+
+def build_facets(rows, selection):
+    rows = sorted(rows, key=lambda row: (row['category__name'], row['category_id']))
+    categories = [
+        {"id": row['category_id'], "name": row['category__name'], "count": row['items']}
+        for row in rows if row['items']
+    ]
+    # Price buckets count the selected categories, whatever the price range
+    if selection.categories:
+        chosen = set(selection.categories)
+        rows = [row for row in rows if row['category_id'] in chosen]
+    price = [
+        {
+            "min": None if low is None else str(low),
+            "max": None if high is None else str(high),
+            "count": sum(row[f"bucket_{i}"] for row in rows),
+        }
+        for i, (low, high) in enumerate(price_buckets())
+    ]
+    return {"categories": categories, "price": price}
+
+
+def parse_id(value, name):
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValidationError({name: ["Use a numeric id."]})
+    if not 1 <= number <= MAX_ID:
+        raise ValidationError({name: ["Use a numeric id."]})
+    return number
+
+
+def parse_price(value, name):
+    try:
+        price = Decimal(value)
+    except InvalidOperation:
+        raise ValidationError({name: ["Use a price like 12.50."]})
+    if not price.is_finite() or price < 0:
+        raise ValidationError({name: ["Use a price like 12.50."]})
+    return price
+
+
+#?restaurant=<id>&category=<id>[,<id>...]&min_price=&max_price= on menu items
+class MenuFacetFilter(BaseFilterBackend):
+    restaurant_param = 'restaurant'
+    category_param = 'category'
+    min_price_param = 'min_price'
+    max_price_param = 'max_price'
+
+    def get_selection(self, request):
+        params = request.query_params
+        restaurant = params.get(self.restaurant_param)
+        categories = [
+            parse_id(part, self.category_param)
+            for value in params.getlist(self.category_param)
+            for part in value.split(",") if part.strip()
+        ]
+        min_price = params.get(self.min_price_param)
+        max_price = params.get(self.max_price_param)
+        selection = MenuSelection(
+            restaurant=parse_id(restaurant, self.restaurant_param) if restaurant else None,
+            categories=categories,
+            min_price=parse_price(min_price, self.min_price_param) if min_price else None,
+            max_price=parse_price(max_price, self.max_price_param) if max_price else None,
+        )
+        if None not in (selection.min_price, selection.max_price) and selection.min_price > selection.max_price:
+            raise ValidationError({self.min_price_param: ["min_price is above max_price."]})
+        return selection
+
+    def filter_queryset(self, request, queryset, view):
+        selection = self.get_selection(request)
+        queryset = selection.scope(queryset)
+        # FacetedListMixin counts over this, before the faceted filters apply
+        view.facet_scope = (queryset, selection)
+        return selection.narrow(queryset)
+
+
+class FacetedListMixin:
+    """Adds "facets" to paginated list responses that ask for ?facets=1."""
+
+    facet_scope = None
+
+    def wants_facets(self):
+        return self.request.query_params.get(FACETS_PARAM, "").lower() in ("1", "true", "yes")
+
+    def facet_rows(self):
+        if self.facet_scope is None or not self.wants_facets():
+            return None
+        queryset, selection = self.facet_scope
+        return facet_query(queryset, selection)
+
+    def wants_validators(self):
+        # The page's rows don't version the counts
+        return not self.wants_facets() and super().wants_validators()
+
+    def with_facets(self, response, rows):
+        if isinstance(response.data, dict):
+            response.data["facets"] = build_facets(rows, self.facet_scope[1])
+        return response
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        rows = self.facet_rows()
+        return response if rows is None else self.with_facets(response, list(rows))
@@ -0,0 +1,177 @@
+from functools import cached_property
+
+from django.db.models import Prefetch
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.serializers import ListSerializer
+
+from .models import Restaurant, MenuCategory, MenuItem, Order, OrderItem
+
+
+# Response shaping. ?fields=id,status,order_items.quantity picks the fields a
+# GET returns, dotted paths reaching into nested objects (a bare nested name
+# keeps all of its fields); ?expand=restaurant swaps a related id for the
+# related object. Serializers drop everything else before it is read, and
+# the querysets below only join or prefetch the relations the shape
+# renders, so a sparse order list is one query with no order items in it.
+# Unknown names are ignored. Writes always get the full representation.
+
+FIELDS_PARAM = "fields"
+EXPAND_PARAM = "expand"
+
+
+def parse_paths(value):
+    """'id,order_items.menu_item.name' -> {'id': {}, 'order_items': {'menu_item': {'name': {}}}}"""
+    tree = {}
+    for path in value.split(","):
+        node = tree
+        for name in path.strip().split("."):
+            if name:
+                node = node.setdefault(name, {})
+    return tree
+
+
+class Shape:
+    """
+    `fields` is a parsed ?fields= tree, or None for every field; `expand`
+    a parsed ?expand= tree.
+    """
+
+    def __init__(self, fields=None, expand=None):
+        self.fields = fields or None
+        self.expand = expand or {}
+
+    @property
+    def is_full(self):
+        return self.fields is None and not self.expand
+
+    def includes(self, name):
+        return self.fields is None or name in self.fields
+
+    def expands(self, name):
+        return name in self.expand and self.includes(name)
+
+    def branch(self, name):
+        # The shape of a nested object
+        return Shape(self.fields.get(name) if self.fields else None, self.expand.get(name))
+
+
+FULL = Shape()
+
+
+class ShapedSerializerMixin:
+    """
+    Trims a serializer's fields to the shape in its context, and renders
+    `expandable_fields` (name -> serializer class) as nested objects when
+    expanded. Nested serializers get their branch of the shape.
+    """
+
+    expandable_fields = {}
+
+    @property
+    def shape(self):
+        shape = getattr(self, '_shape', None)
+        return shape if shape is not None else self.context.get('shape', FULL)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        shape = self.shape
+        if shape.is_full:
+            return fields
+        for name, serializer_class in self.expandable_fields.items():
+            if name in fields and shape.expands(name):
+                fields[name] = serializer_class(read_only=True)
+        if shape.fields is not None:
+            fields = {name: field for name, field in fields.items() if name in shape.fields}
+        for name, field in fields.items():
+            nested = field.child if isinstance(field, ListSerializer) else field
+            if isinstance(nested, ShapedSerializerMixin):
+                nested._shape = shape.branch(name)
+        return fields
+
+
+class ShapedViewMixin:
+    """
+    Reads ?fields=/?expand= on safe requests into `shape`, hands it to the
+    serializers, and builds the queryset with `shaped_queryset(shape)` (one
+    of the functions below, as a staticmethod).
+    """
+
+    shaped_queryset = None
+
+    @cached_property
+    def shape(self):
+        params = self.request.query_params
+        if self.request.method not in SAFE_METHODS:
+            return FULL
+        fields, expand = params.get(FIELDS_PARAM), params.get(EXPAND_PARAM)
+        if not fields and not expand:
+            return FULL
+        return Shape(parse_paths(fields or ""), parse_paths(expand or ""))
+
+    def get_queryset(self):
+        if self.shaped_queryset is None or self.shape.is_full:
+            return super().get_queryset()
+        return self.shaped_queryset(self.shape)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['shape'] = self.shape
+        return context
+
+
+# select_related paths each serializer reads for a shape, so nested and
+# expanded objects never trigger per-row lookups (owner.username,
+# order_items -> menu_item, ?expand=category)
+
+def related(name, shape, nested):
+    return [name, *(f"{name}__{path}" for path in nested(shape.branch(name)))]
+
+
+def restaurant_relations(shape):
+    return ['owner'] if shape.includes('owner') else []
+
+
+def menu_category_relations(shape):
+    return related('restaurant', shape, restaurant_relations) if shape.expands('restaurant') else []
+
+
+def menu_item_relations(shape):
+    return related('category', shape, menu_category_relations) if shape.expands('category') else []
+
+
+def order_item_relations(shape):
+    return related('menu_item', shape, menu_item_relations) if shape.includes('menu_item') else []
+
+
+def order_relations(shape):
+    return related('restaurant', shape, restaurant_relations) if shape.expands('restaurant') else []
+
+
+def select(queryset, paths):
+    # select_related() with no paths would follow every foreign key
+    return queryset.select_related(*paths) if paths else queryset
+
+
+def restaurant_queryset(shape=FULL):
+    return select(Restaurant.objects.all(), restaurant_relations(shape))
+
+
+def menu_category_queryset(shape=FULL):
+    return select(MenuCategory.objects.all(), menu_category_relations(shape))
+
+
+def menu_item_queryset(shape=FULL):
+    return select(MenuItem.objects.all(), menu_item_relations(shape))
+
+
+def order_item_queryset(shape=FULL, model=OrderItem):
+    return select(model.objects.all(), order_item_relations(shape))
+
+
+def order_queryset(shape=FULL, model=Order, item_model=OrderItem):
+    queryset = select(model.objects.all(), order_relations(shape))
+    if not shape.includes('order_items'):
+        return queryset
+    return queryset.prefetch_related(
+        Prefetch('order_items', queryset=order_item_queryset(shape.branch('order_items'), item_model))
+    )
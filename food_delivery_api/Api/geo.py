@@ -0,0 +1,127 @@
+import math
+from functools import reduce
+from operator import or_
+
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import ASin, Cos, Least, Power, Radians, Sin, Sqrt
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+
+# "Near me" search without GIS extensions. Every restaurant with
+# coordinates stores its geohash in an indexed column. A nearby query turns
+# its bounding box into a handful of geohash cells, each of which is an
+# index range scan (geohash >= cell AND geohash < cell + '~'). The survivors
+# are trimmed to the exact box and then ranked by great-circle distance.
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+MAX_CELLS = 16
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        interval, coordinate = (lng_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        if coordinate >= middle:
+            value = value * 2 + 1
+            interval[0] = middle
+        else:
+            value *= 2
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def cell_size(precision):
+    """(height, width) in degrees of one geohash cell."""
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** (bits - bits // 2)
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """(south, north, [(west, east), ...]); two lng ranges across the antimeridian."""
+    dlat = radius_km / KM_PER_DEGREE
+    south, north = max(latitude - dlat, -90.0), min(latitude + dlat, 90.0)
+    if south <= -90.0 or north >= 90.0:
+        return south, north, [(-180.0, 180.0)]
+    dlng = min(radius_km / (KM_PER_DEGREE * math.cos(math.radians(latitude))), 180.0)
+    west, east = longitude - dlng, longitude + dlng
+    if west < -180.0:
+        return south, north, [(west + 360.0, 180.0), (-180.0, east)]
+    if east > 180.0:
+        return south, north, [(west, 180.0), (-180.0, east - 360.0)]
+    return south, north, [(west, east)]
+
+
+def covering_cells(south, north, lng_ranges):
+    """The finest geohash cells (at most MAX_CELLS) that cover the box."""
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        rows = range(math.floor((south + 90.0) / height), math.floor((north + 90.0) / height) + 1)
+        columns = [
+            column
+            for west, east in lng_ranges
+            for column in range(math.floor((west + 180.0) / width), math.floor((east + 180.0) / width) + 1)
+        ]
+        if len(rows) * len(columns) <= MAX_CELLS or precision == 1:
+            cells = set()
+            for row in rows:
+                latitude = min(-90.0 + (row + 0.5) * height, 90.0)
+                for column in columns:
+                    longitude = min(-180.0 + (column + 0.5) * width, 180.0)
+                    cells.add(encode_geohash(latitude, longitude, precision))
+            return sorted(cells)
+
+
+def distance_km(latitude, longitude):
+    """Haversine distance from (latitude, longitude) to each row, in km."""
+    lat, lng = math.radians(latitude), math.radians(longitude)
+    row_lat = Radians(F('latitude'))
+    half_dlat = Sin((row_lat - Value(lat)) / Value(2.0))
+    half_dlng = Sin((Radians(F('longitude')) - Value(lng)) / Value(2.0))
+    a = Power(half_dlat, 2) + Value(math.cos(lat)) * Cos(row_lat) * Power(half_dlng, 2)
+    # Rounding can push `a` a hair above 1, outside asin's domain
+    return Value(2 * EARTH_RADIUS_KM) * ASin(Sqrt(Least(a, Value(1.0), output_field=FloatField())))
+
+
+def nearby(queryset, latitude, longitude, radius_km):
+    south, north, lng_ranges = bounding_box(latitude, longitude, radius_km)
+    cells = reduce(or_, (Q(geohash__gte=cell, geohash__lt=cell + "~") for cell in covering_cells(south, north, lng_ranges)))
+    box = reduce(or_, (Q(longitude__gte=west, longitude__lte=east) for west, east in lng_ranges))
+    return (
+        queryset.filter(cells, box, latitude__gte=south, latitude__lte=north)
+        .annotate(distance=distance_km(latitude, longitude))
+        .filter(distance__lte=radius_km)
+    )
+
+
+#?near=<lat>,<lng>[&radius=<km>] limits restaurants to a radius, nearest first
+class NearbyFilter(BaseFilterBackend):
+    near_param = 'near'
+    radius_param = 'radius'
+    default_radius_km = 5.0
+    max_radius_km = 50.0
+
+    def filter_queryset(self, request, queryset, view):
+        near = request.query_params.get(self.near_param)
+        if not near:
+            return queryset
+        try:
+            latitude, longitude = (float(part) for part in near.split(","))
+            radius = float(request.query_params.get(self.radius_param, self.default_radius_km))
+        except ValueError:
+            raise ValidationError({self.near_param: ["Use near=<latitude>,<longitude> and a numeric radius in km."]})
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValidationError({self.near_param: ["Coordinates out of range."]})
+        if not 0 < radius <= self.max_radius_km:
+            raise ValidationError({self.radius_param: [f"Radius must be between 0 and {self.max_radius_km:g} km."]})
+        return nearby(queryset, latitude, longitude, radius)
@@ -0,0 +1,161 @@
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from .models import IdempotencyKey
+from .renderers import FastJSONRenderer
+
+
+# Idempotency-Key support for write endpoints. A keyed request runs in one
+# transaction that first claims (user, key) with a unique row, then does the
+# write, then stores the response on that row. A concurrent duplicate blocks
+# on the unique index until the first commits and then replays its response,
+# so exactly one write happens. Finished responses are also cached for TTL
+# seconds so retries are normally answered without touching the database.
+
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+def idempotency_settings():
+    options = {
+        "TTL": 24 * 3600,
+        "CACHE": "default",
+        "MAX_KEY_LENGTH": 255,
+    }
+    options.update(getattr(settings, 'IDEMPOTENCY', None) or {})
+    return options
+
+
+class IdempotencyKeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = "This Idempotency-Key was already used for a different request."
+    default_code = "idempotency_key_reused"
+
+
+class Replay(Exception):
+    def __init__(self, response):
+        self.response = response
+
+
+def cache_key(user_id, key):
+    return f"idempotency:{user_id}:{hashlib.sha256(key.encode()).hexdigest()}"
+
+
+def fingerprint(request):
+    digest = hashlib.sha256(f"{request.method} {request.get_full_path()}\n".encode())
+    digest.update(request.body)
+    return digest.hexdigest()
+
+
+def replay(stored_fingerprint, status_code, body, request_fingerprint):
+    if stored_fingerprint != request_fingerprint:
+        raise IdempotencyKeyReused()
+    response = HttpResponse(body, status=status_code, content_type="application/json")
+    response[REPLAYED_HEADER] = "true"
+    return response
+
+
+def claim(request, key):
+    """
+    Claim `key` for this request, or raise Replay with the stored response.
+    Must run inside the transaction that performs the write.
+    """
+    options = idempotency_settings()
+    if not 0 < len(key) <= options["MAX_KEY_LENGTH"]:
+        raise ValidationError({HEADER: [f"Must be 1 to {options['MAX_KEY_LENGTH']} characters."]})
+    user_id = request.user.pk
+    request_fingerprint = fingerprint(request)
+
+    cached = caches[options["CACHE"]].get(cache_key(user_id, key))
+    if cached is not None:
+        raise Replay(replay(*cached, request_fingerprint))
+
+    now = timezone.now()
+    row = IdempotencyKey(
+        user_id=user_id, key=key, fingerprint=request_fingerprint, expires_at=now + timedelta(seconds=options["TTL"]),
+    )
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                row.save(force_insert=True)
+            return row
+        except IntegrityError:
+            # The insert blocked until a concurrent claim committed or rolled
+            # back. A locking read sees that commit even where a plain SELECT
+            # would still read this transaction's older snapshot (MySQL's
+            # REPEATABLE READ)
+            existing = IdempotencyKey.objects.select_for_update().filter(user_id=user_id, key=key).first()
+            if existing is None:
+                continue
+            if existing.expires_at <= now:
+                existing.delete()
+                continue
+            raise Replay(replay(existing.fingerprint, existing.status_code, existing.body, request_fingerprint))
+    raise IntegrityError(f"Could not claim idempotency key {key!r}")
+
+
+def complete(row, response):
+    """Store `response` on the claimed row; server errors roll everything back so a retry runs again."""
+    if response.status_code >= 500:
+        transaction.set_rollback(True)
+        return
+    data = getattr(response, 'data', None)
+    row.status_code = response.status_code
+    row.body = FastJSONRenderer().render(data).decode() if data is not None else ""
+    row.save(update_fields=['status_code', 'body'])
+
+    options = idempotency_settings()
+    entry = (row.fingerprint, row.status_code, row.body)
+    transaction.on_commit(lambda: caches[options["CACHE"]].set(
+        cache_key(row.user_id, row.key), entry, options["TTL"],
+    ))
+
+
+def prune_expired_keys(batch_size=1000):
+    pruned = 0
+    while True:
+        ids = list(
+            IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return pruned
+        pruned += IdempotencyKey.objects.filter(pk__in=ids).delete()[0]
+
+
+#Honours Idempotency-Key on POSTs from signed-in users
+class IdempotentViewMixin:
+    idempotent_methods = ('POST',)
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in self.idempotent_methods or HEADER not in request.headers:
+            return super().dispatch(request, *args, **kwargs)
+        with transaction.atomic():
+            return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        self.idempotency_claim = None
+        super().initial(request, *args, **kwargs)
+        key = request.headers.get(HEADER)
+        if key is not None and request.method in self.idempotent_methods and request.user.is_authenticated:
+            self.idempotency_claim = claim(request, key)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, Replay):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        row = getattr(self, 'idempotency_claim', None)
+        if row is not None:
+            self.idempotency_claim = None
+            complete(row, response)
+        return response
@@ -0,0 +1,192 @@
+import hashlib
+import json
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import MenuItem
+
+
+# Resized, recompressed copies of menu item photos. Derivatives are rendered
+# in a process pool after the upload commits, so requests never pay for
+# decoding or resizing, and are stored under names derived from the source
+# bytes and the size spec. A name never changes content, so the web server
+# can serve DERIVED_PREFIX with "Cache-Control: immutable".
+
+DERIVED_PREFIX = "menu_items/derived"
+
+logger = logging.getLogger(__name__)
+
+
+def image_settings():
+    options = {
+        "SIZES": {"thumbnail": (160, 160), "card": (480, 480), "full": (1280, 1280)},
+        "FORMAT": "WEBP",
+        "QUALITY": 80,
+        "WORKERS": 2,
+    }
+    options.update(getattr(settings, 'IMAGE_DERIVATIVES', None) or {})
+    return options
+
+
+def derivative_digest(source, options):
+    spec = json.dumps([options["SIZES"], options["FORMAT"], options["QUALITY"]], sort_keys=True)
+    return hashlib.sha256(spec.encode() + source).hexdigest()
+
+
+def render_derivatives(source_name):
+    """
+    Render every configured size of the image stored at `source_name` and
+    return {"source": ..., "sizes": {size: name}}. Touches only storage, never
+    the database, so it is safe to run in a worker process.
+    """
+    options = image_settings()
+    with default_storage.open(source_name, 'rb') as fileobj:
+        source = fileobj.read()
+    digest = derivative_digest(source, options)
+    extension = options["FORMAT"].lower()
+
+    image = Image.open(BytesIO(source))
+    sizes = sorted(options["SIZES"].items(), key=lambda size: size[1][0] * size[1][1], reverse=True)
+    # Let the JPEG decoder downscale while decoding when the source is much
+    # bigger than the largest derivative
+    image.draft('RGB', tuple(sizes[0][1]))
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+    names = {}
+    # Largest first, each size resampled from the previous one
+    for size_name, size in sizes:
+        image.thumbnail(tuple(size), Image.Resampling.LANCZOS)
+        name = f"{DERIVED_PREFIX}/{digest[:2]}/{digest}/{size_name}.{extension}"
+        if not default_storage.exists(name):
+            output = BytesIO()
+            image.save(output, options["FORMAT"], quality=options["QUALITY"])
+            name = default_storage.save(name, ContentFile(output.getvalue()))
+        names[size_name] = name
+    return {"source": source_name, "sizes": names}
+
+
+def store_derivatives(item_id, result):
+    # Skip results for a source that has since been replaced
+    updated = MenuItem.objects.filter(pk=item_id, image=result["source"]).update(
+        image_derivatives=result, updated_at=timezone.now()
+    )
+    if updated:
+        from .menu import invalidate_menu
+        restaurant_id = MenuItem.objects.filter(pk=item_id).values_list('category__restaurant_id', flat=True).first()
+        invalidate_menu(restaurant_id)
+    return bool(updated)
+
+
+def needs_derivatives(item):
+    return bool(item.image) and (item.image_derivatives or {}).get("source") != item.image.name
+
+
+def init_worker():
+    import django
+    django.setup()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(max_workers=image_settings()["WORKERS"], initializer=init_worker)
+    return _executor
+
+
+def reset_executor():
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def schedule_derivatives(item_id, source_name):
+    """Render derivatives in the background; with WORKERS = 0, render inline."""
+    if not image_settings()["WORKERS"]:
+        store_derivatives(item_id, render_derivatives(source_name))
+        return None
+
+    def done(future):
+        # Runs on the executor's result thread, which has its own connection
+        try:
+            error = future.exception()
+            if error is None:
+                store_derivatives(item_id, future.result())
+            else:
+                # e.g. a corrupt upload; the item keeps serving the original
+                logger.error("Rendering derivatives for menu item %s failed", item_id, exc_info=error)
+        finally:
+            connection.close()
+
+    future = get_executor().submit(render_derivatives, source_name)
+    future.add_done_callback(done)
+    return future
+
+
+def queue_derivatives(item):
+    """Schedule derivatives for `item` once the current transaction commits."""
+    if needs_derivatives(item):
+        item_id, source_name = item.pk, item.image.name
+        transaction.on_commit(lambda: schedule_derivatives(item_id, source_name))
+    elif not item.image and item.image_derivatives:
+        item.image_derivatives, item.updated_at = {}, timezone.now()
+        MenuItem.objects.filter(pk=item.pk).update(image_derivatives={}, updated_at=item.updated_at)
+
+
+def regenerate_derivatives(items, force=False):
+    """
+    Render derivatives for many items through the pool (or inline with
+    WORKERS = 0) and store them. Returns the number of items updated.
+    """
+    pending = [(item.pk, item.image.name) for item in items if item.image and (force or needs_derivatives(item))]
+    if not pending:
+        return 0
+    sources = [source_name for _, source_name in pending]
+    if image_settings()["WORKERS"]:
+        results = get_executor().map(render_derivatives, sources)
+    else:
+        results = map(render_derivatives, sources)
+    return sum(store_derivatives(item_id, result) for (item_id, _), result in zip(pending, results))
+
+
+def image_urls(item, request=None):
+    if not item.image:
+        return None
+    return image_urls_from_values(item.image.name, item.image_derivatives, request)
+
+
+def image_urls_from_values(source_name, derivatives, request=None):
+    """
+    Per-size URLs for a menu item's photo. Sizes that aren't rendered yet
+    (or belong to a replaced source) fall back to the original.
+    """
+    if not source_name:
+        return None
+    storage = MenuItem._meta.get_field('image').storage
+    original = storage.url(source_name)
+    derivatives = derivatives or {}
+    sizes = derivatives.get("sizes", {}) if derivatives.get("source") == source_name else {}
+    urls = {"original": original}
+    for size_name in image_settings()["SIZES"]:
+        urls[size_name] = storage.url(sizes[size_name]) if size_name in sizes else original
+    if request is not None:
+        urls = {size_name: request.build_absolute_uri(url) for size_name, url in urls.items()}
+    return urls
@@ -0,0 +1,399 @@
+import hmac
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+
+# Per-request timing. InstrumentationMiddleware opens a RequestMetrics for
+# each request; a database execute wrapper and `timed(...)` blocks in views,
+# serializers and the renderer add to it. At the end of the request the
+# totals go into a Server-Timing header, the slow/N+1 log, and the
+# in-process histograms served by /metrics. Each phase excludes the DB time
+# spent inside it, so the numbers add up.
+
+logger = logging.getLogger(__name__)
+
+PHASES = ('auth', 'perm', 'db', 'serialize', 'render', 'app')
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+_current = ContextVar('request_metrics', default=None)
+
+
+def instrumentation_settings():
+    options = {
+        "ENABLED": True,
+        "SERVER_TIMING": True,
+        "SLOW_REQUEST_MS": 500,
+        # Per-view thresholds; these views run the password hasher on purpose
+        "SLOW_REQUEST_MS_BY_VIEW": {
+            "LoginAPIView": 2000,
+            "TokenObtainAPIView": 2000,
+            "RegisterAPIView": 2000,
+        },
+        "N_PLUS_ONE_THRESHOLD": 10,
+        # /metrics answers a scraper sending this bearer token, or staff/admin
+        # users; METRICS_PUBLIC opens it to anyone
+        "METRICS_TOKEN": None,
+        "METRICS_PUBLIC": False,
+    }
+    options.update(getattr(settings, 'INSTRUMENTATION', None) or {})
+    return options
+
+
+class RequestMetrics:
+    __slots__ = ('view', 'started', 'durations', 'db_time', 'query_count', 'statements', 'active')
+
+    def __init__(self):
+        self.view = None
+        self.started = time.perf_counter()
+        self.durations = dict.fromkeys(PHASES, 0.0)
+        self.db_time = 0.0
+        self.query_count = 0
+        # SQL text (placeholders, not values) -> executions
+        self.statements = defaultdict(int)
+        self.active = set()
+
+    def record_query(self, sql, elapsed):
+        self.db_time += elapsed
+        self.query_count += 1
+        self.statements[sql] += 1
+
+
+def current_metrics():
+    return _current.get()
+
+
+class timed:
+    """
+    Add the time spent in the block to `phase` of the current request, minus
+    any DB time inside it. Nested blocks for the same phase count once.
+    """
+
+    __slots__ = ('phase', 'metrics', 'started', 'db_started')
+
+    def __init__(self, phase):
+        self.phase = phase
+        self.metrics = None
+
+    def __enter__(self):
+        metrics = _current.get()
+        if metrics is not None and self.phase not in metrics.active:
+            metrics.active.add(self.phase)
+            self.metrics = metrics
+            self.db_started = metrics.db_time
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        metrics = self.metrics
+        if metrics is not None:
+            elapsed = time.perf_counter() - self.started - (metrics.db_time - self.db_started)
+            metrics.durations[self.phase] += elapsed
+            metrics.active.discard(self.phase)
+            self.metrics = None
+        return False
+
+
+def query_timer(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_query(sql, time.perf_counter() - started)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'total', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Process-local aggregates, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.durations = {}
+        self.phases = {}
+        self.queries = {}
+        self.requests = defaultdict(int)
+        self.slow = defaultdict(int)
+        self.n_plus_one = defaultdict(int)
+
+    def observe(self, metrics, method, status, total, slow, repeated):
+        view = metrics.view or "unresolved"
+        with self._lock:
+            self.requests[(view, method, str(status))] += 1
+            histogram = self.durations.get(view)
+            if histogram is None:
+                histogram = self.durations[view] = Histogram(DURATION_BUCKETS)
+            histogram.observe(total)
+            for phase, seconds in metrics.durations.items():
+                key = (view, phase)
+                histogram = self.phases.get(key)
+                if histogram is None:
+                    histogram = self.phases[key] = Histogram(DURATION_BUCKETS)
+                histogram.observe(seconds)
+            histogram = self.queries.get(view)
+            if histogram is None:
+                histogram = self.queries[view] = Histogram(QUERY_BUCKETS)
+            histogram.observe(metrics.query_count)
+            if slow:
+                self.slow[view] += 1
+            if repeated:
+                self.n_plus_one[view] += 1
+
+    def render(self):
+        lines = []
+
+        def histogram(name, help_text, series):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, hist in sorted(series.items()):
+                label_text = ",".join(f'{key}="{escape(value)}"' for key, value in labels)
+                cumulative = 0
+                for bound, count in zip(hist.buckets, hist.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{label_text},le="+Inf"}} {hist.count}')
+                lines.append(f"{name}_sum{{{label_text}}} {hist.total}")
+                lines.append(f"{name}_count{{{label_text}}} {hist.count}")
+
+        def counter(name, help_text, series):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in sorted(series.items()):
+                label_text = ",".join(f'{key}="{escape(value)}"' for key, value in labels)
+                lines.append(f"{name}{{{label_text}}} {value}")
+
+        with self._lock:
+            counter("api_requests_total", "Requests by view, method and status.", {
+                (("view", view), ("method", method), ("status", status)): count
+                for (view, method, status), count in self.requests.items()
+            })
+            histogram("api_request_duration_seconds", "Wall time per request.", {
+                (("view", view),): hist for view, hist in self.durations.items()
+            })
+            histogram("api_request_phase_seconds", "Time per request phase (DB time counted only under db).", {
+                (("view", view), ("phase", phase)): hist for (view, phase), hist in self.phases.items()
+            })
+            histogram("api_request_queries", "SQL queries per request.", {
+                (("view", view),): hist for view, hist in self.queries.items()
+            })
+            counter("api_slow_requests_total", "Requests slower than SLOW_REQUEST_MS.", {
+                (("view", view),): count for view, count in self.slow.items()
+            })
+            counter("api_n_plus_one_total", "Requests that repeated one statement N_PLUS_ONE_THRESHOLD+ times.", {
+                (("view", view),): count for view, count in self.n_plus_one.items()
+            })
+        return "\n".join(lines) + "\n"
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = MetricsRegistry()
+    return _registry
+
+
+def reset_registry():
+    global _registry
+    with _registry_lock:
+        _registry = None
+
+
+def install_query_timer():
+    # Wrappers live on the per-thread connection objects; add ours once
+    for connection in connections.all():
+        if query_timer not in connection.execute_wrappers:
+            connection.execute_wrappers.append(query_timer)
+
+
+def server_timing(metrics, total):
+    entries = [f'{phase};dur={seconds * 1000:.2f}' for phase, seconds in metrics.durations.items() if phase != 'db']
+    entries.insert(2, f'db;dur={metrics.db_time * 1000:.2f};desc="{metrics.query_count} queries"')
+    entries.append(f'total;dur={total * 1000:.2f}')
+    return ", ".join(entries)
+
+
+class InstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        options = instrumentation_settings()
+        if not options["ENABLED"]:
+            return self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            install_query_timer()
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, options)
+
+    async def __acall__(self, request):
+        options = instrumentation_settings()
+        if not options["ENABLED"]:
+            return await self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            # The ORM runs in this request's sync thread, on that thread's connections
+            await sync_to_async(install_query_timer)()
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, options)
+
+    def finish(self, request, response, metrics, options):
+        total = time.perf_counter() - metrics.started
+        metrics.durations['db'] = metrics.db_time
+        accounted = sum(seconds for phase, seconds in metrics.durations.items() if phase != 'app')
+        metrics.durations['app'] = max(total - accounted, 0.0)
+
+        threshold = options["SLOW_REQUEST_MS_BY_VIEW"].get(metrics.view, options["SLOW_REQUEST_MS"])
+        slow = total * 1000 >= threshold
+        repeated = [
+            (sql, count) for sql, count in metrics.statements.items() if count >= options["N_PLUS_ONE_THRESHOLD"]
+        ]
+        if slow:
+            logger.warning(
+                "Slow request %s %s (%s): %.1fms total, %.1fms in %d queries",
+                request.method, request.path, metrics.view, total * 1000, metrics.db_time * 1000, metrics.query_count,
+            )
+        for sql, count in repeated:
+            logger.warning("Possible N+1 in %s: %d executions of %s", metrics.view, count, sql[:300])
+
+        get_registry().observe(metrics, request.method, response.status_code, total, slow, bool(repeated))
+        if options["SERVER_TIMING"]:
+            response["Server-Timing"] = server_timing(metrics, total)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = _current.get()
+        if metrics is not None:
+            view_class = getattr(view_func, 'view_class', None) or getattr(view_func, 'cls', None)
+            metrics.view = view_class.__name__ if view_class is not None else view_func.__name__
+        return None
+
+
+#Times DRF's auth, permission and throttle checks for any APIView
+class InstrumentedViewMixin:
+    def perform_authentication(self, request):
+        with timed('auth'):
+            super().perform_authentication(request)
+
+    def check_permissions(self, request):
+        with timed('perm'):
+            super().check_permissions(request)
+
+    def check_object_permissions(self, request, obj):
+        with timed('perm'):
+            super().check_object_permissions(request, obj)
+
+    def check_throttles(self, request):
+        with timed('perm'):
+            super().check_throttles(request)
+
+    def get_serializer_class(self):
+        return timed_serializer_class(super().get_serializer_class())
+
+
+class TimedSerializerMixin:
+    def to_representation(self, instance):
+        with timed('serialize'):
+            return super().to_representation(instance)
+
+
+_timed_serializers = {}
+
+
+def timed_serializer_class(serializer_class):
+    """A cached subclass of `serializer_class` whose output time counts as serialize."""
+    if serializer_class is None or issubclass(serializer_class, TimedSerializerMixin):
+        return serializer_class
+    timed_class = _timed_serializers.get(serializer_class)
+    if timed_class is None:
+        timed_class = _timed_serializers[serializer_class] = type(
+            serializer_class.__name__, (TimedSerializerMixin, serializer_class),
+            {'__module__': serializer_class.__module__},
+        )
+    return timed_class
+
+
+def metrics_user(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user
+    # API clients sign in with JWTs rather than sessions
+    from rest_framework.exceptions import AuthenticationFailed
+    from rest_framework_simplejwt.exceptions import InvalidToken
+    from .authentication import ClaimsJWTAuthentication
+    try:
+        result = ClaimsJWTAuthentication().authenticate(request)
+    except (AuthenticationFailed, InvalidToken):
+        return None
+    return result[0] if result is not None else None
+
+
+def metrics_allowed(request):
+    options = instrumentation_settings()
+    token = options["METRICS_TOKEN"]
+    # Constant-time, so response timing doesn't leak how much of it matched
+    supplied = request.headers.get("Authorization", "").encode()
+    if token and hmac.compare_digest(supplied, f"Bearer {token}".encode()):
+        return True
+    if options["METRICS_PUBLIC"]:
+        return True
+    user = metrics_user(request)
+    return user is not None and (user.is_staff or getattr(user, 'role', None) == 'admin')
+
+
+def metrics_view(request):
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(get_registry().render(), content_type="text/plain; version=0.0.4; charset=utf-8")
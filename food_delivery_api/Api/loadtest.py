@@ -0,0 +1,250 @@
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import urlsplit
+
+import django
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection
+from django.db.backends.signals import connection_created
+
+from .benchmarks import SCENARIOS, BenchmarkContext, percentile
+
+
+# Concurrent-connection load test, WSGI vs ASGI, against the benchmark
+# dataset (seed_benchmark_data). Each interface runs in its own process so
+# the URLconf picks the sync or async views exactly as that deployment
+# would, and drives Django's real WSGIHandler / ASGIHandler in-process:
+# CONNECTIONS virtual clients each keep one GET in flight. WSGI requests
+# queue for THREADS worker threads, like gunicorn's gthread worker; ASGI
+# requests share one event loop. There are no sockets or HTTP parsing, so
+# this compares the application stacks, not servers. DB_LATENCY_MS adds a
+# sleep to every query to stand in for a database across the network.
+
+INTERFACES = ("wsgi", "asgi")
+DEFAULT_SCENARIOS = (
+    "restaurant_list", "restaurant_detail", "menu_item_list", "menu_item_detail", "order_list", "order_detail",
+)
+HOST = "testserver"
+
+
+def scenario_requests(ctx, names):
+    """(path, WSGI-style headers) for each named GET scenario."""
+    by_name = {
+        name: (method, role, builder)
+        for scenarios in SCENARIOS.values() for name, method, role, builder in scenarios
+    }
+    requests = []
+    for name in names:
+        if name not in by_name:
+            raise ValueError(f"Unknown scenario {name!r}")
+        method, role, builder = by_name[name]
+        if method != "get":
+            raise ValueError(f"{name} is a {method.upper()} scenario; the load test only sends GETs")
+        path, _ = builder(ctx)
+        requests.append((path, ctx.auth(role) if role else {}))
+    return requests
+
+
+def add_db_latency(seconds):
+    def delay(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+
+    def install(sender, connection, **kwargs):
+        # Fires on every reconnect of a thread's connection, too
+        if delay not in connection.execute_wrappers:
+            connection.execute_wrappers.append(delay)
+
+    # Every thread opens its own connection; the ones already open get it too
+    connection_created.connect(install, weak=False)
+    if connection.connection is not None:
+        install(None, connection)
+
+
+def call_wsgi(application, path, headers):
+    parts = urlsplit(path)
+    environ = {
+        "REQUEST_METHOD": "GET",
+        "SCRIPT_NAME": "",
+        "PATH_INFO": parts.path,
+        "QUERY_STRING": parts.query,
+        "SERVER_NAME": HOST,
+        "SERVER_PORT": "80",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "HTTP_HOST": HOST,
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": "http",
+        "wsgi.input": BytesIO(b""),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+        **headers,
+    }
+    statuses = []
+
+    def start_response(status, response_headers, exc_info=None):
+        statuses.append(int(status.split(" ", 1)[0]))
+
+    body = application(environ, start_response)
+    try:
+        for _ in body:
+            pass
+    finally:
+        body.close()
+    return statuses[0]
+
+
+async def call_asgi(application, path, headers):
+    parts = urlsplit(path)
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": parts.path,
+        "raw_path": parts.path.encode(),
+        "query_string": parts.query.encode(),
+        "root_path": "",
+        "headers": [(b"host", HOST.encode())] + [
+            (name[5:].replace("_", "-").lower().encode(), value.encode()) for name, value in headers.items()
+        ],
+        "client": ("127.0.0.1", 50000),
+        "server": (HOST, 80),
+    }
+    finished = asyncio.Event()
+    body_sent = False
+    statuses = []
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # Django listens for a client disconnect while the view runs
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+        elif message["type"] == "http.response.body" and not message.get("more_body"):
+            finished.set()
+
+    await application(scope, receive, send)
+    finished.set()
+    return statuses[0]
+
+
+async def drive(call, requests, connections, total):
+    latencies = []
+    statuses = Counter()
+    issued = 0
+
+    async def client():
+        nonlocal issued
+        while issued < total:
+            path, headers = requests[issued % len(requests)]
+            issued += 1
+            started = time.perf_counter()
+            statuses[await call(path, headers)] += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(connections)))
+    wall = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "connections": connections,
+        "requests": total,
+        "throughput_rps": total / wall if wall else None,
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "max_ms": latencies[-1] if latencies else None,
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+    }
+
+
+def run_load(interface, connections=(1, 10, 50), requests=500, threads=8, scenarios=DEFAULT_SCENARIOS,
+             warmup=20, log=None):
+    """Load one interface in this process; returns a result per connection count."""
+    if interface not in INTERFACES:
+        raise ValueError(f"Unknown interface {interface!r}; choose from {', '.join(INTERFACES)}")
+    log = log or (lambda message: None)
+    targets = scenario_requests(BenchmarkContext(), scenarios)
+
+    async def run():
+        if interface == "asgi":
+            application = ASGIHandler()
+
+            async def call(path, headers):
+                return await call_asgi(application, path, headers)
+        else:
+            application = WSGIHandler()
+            loop = asyncio.get_running_loop()
+            pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="wsgi")
+
+            async def call(path, headers):
+                return await loop.run_in_executor(pool, call_wsgi, application, path, headers)
+
+        try:
+            await drive(call, targets, 1, warmup)
+            results = []
+            for count in connections:
+                log(f"{interface}: {count} connections")
+                results.append(await drive(call, targets, count, requests))
+            return results
+        finally:
+            if interface == "wsgi":
+                pool.shutdown()
+
+    return asyncio.run(run())
+
+
+def compare_interfaces(connections=(1, 10, 50), requests=500, threads=8, scenarios=DEFAULT_SCENARIOS,
+                       db_latency_ms=0, warmup=20, interfaces=INTERFACES, log=None):
+    """
+    Run the load test once per interface, each in a fresh `manage.py
+    load_test --worker` process, and return a JSON-serialisable report.
+    """
+    log = log or (lambda message: None)
+    results = {}
+    for interface in interfaces:
+        log(f"{interface}: starting worker")
+        command = [
+            sys.executable, str(settings.BASE_DIR / "manage.py"), "load_test", "--worker", interface,
+            "--connections", *map(str, connections), "--requests", str(requests), "--threads", str(threads),
+            "--scenarios", *scenarios, "--db-latency-ms", str(db_latency_ms), "--warmup", str(warmup),
+            "--settings", settings.SETTINGS_MODULE,
+        ]
+        env = {**os.environ, "DJANGO_ASYNC_VIEWS": "1" if interface == "asgi" else "0"}
+        worker = subprocess.run(command, env=env, capture_output=True, text=True)
+        if worker.returncode != 0:
+            raise RuntimeError(f"{interface} worker failed:\n{worker.stderr.strip()}")
+        results[interface] = json.loads(worker.stdout)
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "threads": threads,
+            "requests": requests,
+            "db_latency_ms": db_latency_ms,
+            "scenarios": list(scenarios),
+        },
+        "results": results,
+    }
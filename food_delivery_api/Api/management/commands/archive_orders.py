@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Api.archive import archive_orders
+
+
+class Command(BaseCommand):
+    help = "Move old delivered and cancelled orders, with their items, to the archive tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--age-days', type=float, default=None)
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--pause', type=float, default=None, metavar='SECONDS',
+                            help="Sleep between batches.")
+        parser.add_argument('--limit', type=int, default=None,
+                            help="Stop after this many orders; the next run carries on.")
+        parser.add_argument(
+            '--every', type=int, default=None, metavar='SECONDS',
+            help="Keep running and archive every SECONDS seconds.",
+        )
+
+    def handle(self, *args, **options):
+        overrides = {
+            setting: options[option]
+            for setting, option in (("AGE_DAYS", 'age_days'), ("BATCH_SIZE", 'batch_size'), ("PAUSE", 'pause'))
+            if options[option] is not None
+        }
+        if overrides.get("BATCH_SIZE", 1) < 1:
+            raise CommandError("--batch-size must be at least 1")
+        if overrides.get("AGE_DAYS", 0) < 0:
+            raise CommandError("--age-days can't be negative")
+        while True:
+            result = archive_orders(
+                options=overrides,
+                limit=options['limit'],
+                log=self.stderr.write if options['verbosity'] > 1 else None,
+            )
+            self.stdout.write(
+                f"Archived {result['orders']} orders and {result['order_items']} order items "
+                f"in {result['batches']} batches"
+            )
+            if not options['every']:
+                return
+            time.sleep(options['every'])
@@ -0,0 +1,52 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Api.benchmarks import run_archive_benchmark
+
+
+class Command(BaseCommand):
+    help = "Time the order read paths before and after archiving. Archives the benchmark data for real."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        # Seeded orders are all created "now", so archive regardless of age by default
+        parser.add_argument('--age-days', type=float, default=0)
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--output', help="Write the JSON report here.")
+
+    def handle(self, *args, **options):
+        overrides = {"AGE_DAYS": options['age_days']}
+        if options['batch_size'] is not None:
+            overrides["BATCH_SIZE"] = options['batch_size']
+        try:
+            report = run_archive_benchmark(
+                iterations=options['iterations'],
+                warmup=options['warmup'],
+                options=overrides,
+                log=self.stderr.write if options['verbosity'] > 1 else None,
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        if options['output']:
+            with open(options['output'], 'w') as fileobj:
+                json.dump(report, fileobj, indent=2)
+
+        archiving = report['archiving']
+        self.stdout.write(
+            f"Hot orders {report['before']['rows']['orders']} -> {report['after']['rows']['orders']}; "
+            f"archived {archiving['orders']} in {archiving['batches']} batches ({archiving['seconds']:.2f}s)"
+        )
+        self.stdout.write(
+            f"{'scenario':<24}{'queries':>12}{'sql ms':>18}{'p50 ms':>18}{'p95 ms':>18}"
+        )
+        for name, before in report['before']['results'].items():
+            after = report['after']['results'][name]
+            self.stdout.write(
+                f"{name:<24}{before['queries']:>5} -> {after['queries']:<3}"
+                f"{before['sql_ms']:>8.2f} -> {after['sql_ms']:<6.2f}"
+                f"{before['p50_ms'] or 0:>8.2f} -> {after['p50_ms'] or 0:<6.2f}"
+                f"{before['p95_ms'] or 0:>8.2f} -> {after['p95_ms'] or 0:<6.2f}"
+            )
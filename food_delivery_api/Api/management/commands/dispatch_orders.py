@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Api.dispatch import ALGORITHMS, dispatch_batch
+
+
+class Command(BaseCommand):
+    help = "Assign confirmed orders to nearby idle couriers and send them out for delivery."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--max-pickup-km', type=float, default=None)
+        parser.add_argument('--algorithm', choices=ALGORITHMS, default=None)
+        parser.add_argument(
+            '--every', type=int, default=None, metavar='SECONDS',
+            help="Keep running and dispatch a batch every SECONDS seconds.",
+        )
+
+    def handle(self, *args, **options):
+        overrides = {
+            setting: options[option]
+            for setting, option in (
+                ("BATCH_SIZE", 'batch_size'), ("MAX_PICKUP_KM", 'max_pickup_km'), ("ALGORITHM", 'algorithm'),
+            )
+            if options[option] is not None
+        }
+        if overrides.get("BATCH_SIZE", 1) < 1:
+            raise CommandError("--batch-size must be at least 1")
+        while True:
+            result = dispatch_batch(options=overrides)
+            self.stdout.write(
+                f"Assigned {result['assigned']} of {result['orders']} orders "
+                f"to {result['couriers']} idle couriers in {result['solve_ms']:.1f}ms"
+            )
+            if not options['every']:
+                return
+            time.sleep(options['every'])
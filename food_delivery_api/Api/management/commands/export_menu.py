@@ -0,0 +1,37 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Api.bulk import (
+    MENU_EXPORT_FIELDS, ORDER_EXPORT_FIELDS, menu_export_rows, order_export_rows, stream_export,
+)
+from Api.models import Restaurant
+
+
+class Command(BaseCommand):
+    help = "Stream a restaurant's menu (or order history with --orders) as CSV or JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('restaurant', type=int)
+        parser.add_argument('--orders', action='store_true', help="Export order history instead of the menu.")
+        parser.add_argument('--file-format', choices=['csv', 'json'], default='csv')
+        parser.add_argument('--output', help="File to write to (default: stdout).")
+
+    def handle(self, *args, **options):
+        try:
+            restaurant = Restaurant.objects.get(pk=options['restaurant'])
+        except Restaurant.DoesNotExist:
+            raise CommandError(f"Restaurant {options['restaurant']} does not exist")
+
+        if options['orders']:
+            chunks = stream_export(options['file_format'], ORDER_EXPORT_FIELDS, order_export_rows(restaurant))
+        else:
+            chunks = stream_export(options['file_format'], MENU_EXPORT_FIELDS, menu_export_rows(restaurant))
+
+        output = open(options['output'], 'w', newline='') if options['output'] else sys.stdout
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+        finally:
+            if options['output']:
+                output.close()
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from Api.images import regenerate_derivatives
+from Api.models import MenuItem
+
+
+class Command(BaseCommand):
+    help = "Render resized menu item photos for items whose derivatives are missing or stale."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--item', type=int, action='append', dest='items', help="Limit to this menu item id (repeatable).")
+        parser.add_argument('--force', action='store_true', help="Re-render even if derivatives look current.")
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        items = MenuItem.objects.exclude(image='').exclude(image__isnull=True).only('id', 'image', 'image_derivatives')
+        if options['items']:
+            items = items.filter(pk__in=options['items'])
+
+        batch, updated = [], 0
+        for item in items.order_by('pk').iterator(chunk_size=options['batch_size']):
+            batch.append(item)
+            if len(batch) == options['batch_size']:
+                updated += regenerate_derivatives(batch, force=options['force'])
+                batch = []
+        updated += regenerate_derivatives(batch, force=options['force'])
+        self.stdout.write(f"Rendered derivatives for {updated} menu items")
@@ -0,0 +1,37 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Api.bulk import IMPORT_BATCH_SIZE, MenuImport, iter_import_rows
+from Api.models import Restaurant
+
+
+class Command(BaseCommand):
+    help = "Bulk import menu items for a restaurant from a CSV or JSON file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('restaurant', type=int)
+        parser.add_argument('path')
+        parser.add_argument('--file-format', choices=['csv', 'json'])
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+        parser.add_argument('--create-categories', action='store_true')
+
+    def handle(self, *args, **options):
+        try:
+            restaurant = Restaurant.objects.get(pk=options['restaurant'])
+        except Restaurant.DoesNotExist:
+            raise CommandError(f"Restaurant {options['restaurant']} does not exist")
+
+        fmt = options['file_format'] or ('csv' if options['path'].lower().endswith('.csv') else 'json')
+        with open(options['path'], 'rb') as fileobj:
+            result = MenuImport(
+                restaurant,
+                create_categories=options['create_categories'],
+                batch_size=options['batch_size'],
+            ).run(iter_import_rows(fileobj, fmt))
+
+        for error in result.errors:
+            self.stderr.write(f"row {error['row']}: {json.dumps(error['errors'])}")
+        self.stdout.write(
+            f"Created {result.created}, updated {result.updated}, {result.error_count} rows with errors"
+        )
@@ -0,0 +1,76 @@
+import argparse
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from Api.loadtest import DEFAULT_SCENARIOS, INTERFACES, add_db_latency, compare_interfaces, run_load
+
+
+class Command(BaseCommand):
+    help = "Compare WSGI and ASGI throughput under concurrent connections on the benchmark dataset."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, nargs='+', default=[1, 10, 50],
+                            help="Concurrent connections; one run per value.")
+        parser.add_argument('--requests', type=int, default=500, help="Requests per run.")
+        parser.add_argument('--threads', type=int, default=8, help="WSGI worker threads.")
+        parser.add_argument('--scenarios', nargs='+', default=list(DEFAULT_SCENARIOS),
+                            help="GET scenarios from Api/benchmarks.py, sent round-robin.")
+        parser.add_argument('--db-latency-ms', type=float, default=0,
+                            help="Sleep added to every query, to mimic a remote database.")
+        parser.add_argument('--warmup', type=int, default=20)
+        parser.add_argument('--interface', choices=[*INTERFACES, 'both'], default='both')
+        parser.add_argument('--output', help="Write the JSON report here.")
+        # Internal: run one interface in this process and print its results
+        parser.add_argument('--worker', choices=INTERFACES, help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            if options['db_latency_ms']:
+                add_db_latency(options['db_latency_ms'] / 1000)
+            try:
+                levels = run_load(
+                    options['worker'],
+                    connections=options['connections'],
+                    requests=options['requests'],
+                    threads=options['threads'],
+                    scenarios=options['scenarios'],
+                    warmup=options['warmup'],
+                )
+            except ValueError as exc:
+                raise CommandError(str(exc))
+            self.stdout.write(json.dumps({
+                "views": "async" if getattr(settings, 'ASYNC_VIEWS', False) else "sync",
+                "levels": levels,
+            }))
+            return
+
+        try:
+            report = compare_interfaces(
+                connections=options['connections'],
+                requests=options['requests'],
+                threads=options['threads'],
+                scenarios=options['scenarios'],
+                db_latency_ms=options['db_latency_ms'],
+                warmup=options['warmup'],
+                interfaces=INTERFACES if options['interface'] == 'both' else [options['interface']],
+                log=self.stderr.write if options['verbosity'] > 1 else None,
+            )
+        except RuntimeError as exc:
+            raise CommandError(str(exc))
+
+        if options['output']:
+            with open(options['output'], 'w') as fileobj:
+                json.dump(report, fileobj, indent=2)
+
+        self.stdout.write(
+            f"{'interface':<11}{'views':<7}{'conns':>6}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}  statuses"
+        )
+        for interface, result in report['results'].items():
+            for row in result['levels']:
+                statuses = " ".join(f"{code}x{count}" for code, count in row['statuses'].items())
+                self.stdout.write(
+                    f"{interface:<11}{result['views']:<7}{row['connections']:>6}{row['throughput_rps'] or 0:>9.1f}"
+                    f"{row['p50_ms'] or 0:>9.2f}{row['p95_ms'] or 0:>9.2f}{row['p99_ms'] or 0:>9.2f}  {statuses}"
+                )
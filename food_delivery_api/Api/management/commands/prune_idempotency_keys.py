@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from Api.idempotency import prune_expired_keys
+
+
+class Command(BaseCommand):
+    help = "Delete stored Idempotency-Key responses past their TTL."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--every', type=int, default=None, metavar='SECONDS',
+            help="Keep running and prune every SECONDS seconds.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            pruned = prune_expired_keys(options['batch_size'])
+            self.stdout.write(f"Pruned {pruned} expired idempotency keys")
+            if not options['every']:
+                return
+            time.sleep(options['every'])
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from Api.blacklist import blacklist_settings, prune_expired_tokens
+
+
+class Command(BaseCommand):
+    help = "Delete expired outstanding and blacklisted JWT refresh tokens."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument(
+            '--every', type=int, default=None, metavar='SECONDS',
+            help="Keep running and prune every SECONDS seconds.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size'] or blacklist_settings()["PRUNE_BATCH_SIZE"]
+        while True:
+            pruned = prune_expired_tokens(batch_size)
+            self.stdout.write(f"Pruned {pruned} expired tokens")
+            if not options['every']:
+                return
+            time.sleep(options['every'])
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from Api.analytics import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily sales rollups from existing orders, archived ones included."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--restaurant', type=int, action='append', dest='restaurants',
+            help="Only rebuild this restaurant (can be repeated).",
+        )
+
+    def handle(self, *args, **options):
+        orders, items = rebuild_rollups(options['restaurants'])
+        self.stdout.write(f"Wrote {orders} order rollups and {items} menu item rollups")
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from Api.search import SEARCH_INDEXES, install_search_indexes, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search indexes for menu items and restaurants."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        connection = connections[using]
+        install_search_indexes(using)
+        with connection.cursor() as cursor:
+            for index in SEARCH_INDEXES.values():
+                rebuild_search_index(index, cursor, connection)
+                self.stdout.write(f"Rebuilt search index for {index.table}")
@@ -0,0 +1,57 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Api.benchmarks import compare_to_baseline, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = "Time every API route against the current database and report (optionally vs a baseline)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--only', nargs='+', help="Scenario names to run (default: all).")
+        parser.add_argument('--output', help="Write the JSON report here.")
+        parser.add_argument('--baseline', help="JSON report to compare against.")
+        parser.add_argument('--threshold', type=float, default=0.10,
+                            help="Relative p50/p95 slowdown that counts as a regression.")
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        try:
+            report = run_benchmarks(
+                iterations=options['iterations'],
+                warmup=options['warmup'],
+                only=options['only'],
+                log=self.stderr.write if options['verbosity'] > 1 else None,
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        if options['baseline']:
+            with open(options['baseline']) as fileobj:
+                report['regressions'] = compare_to_baseline(report, json.load(fileobj), options['threshold'])
+
+        if options['output']:
+            with open(options['output'], 'w') as fileobj:
+                json.dump(report, fileobj, indent=2)
+
+        self.stdout.write(f"{'scenario':<24}{'status':>7}{'queries':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}")
+        for name, row in report['results'].items():
+            self.stdout.write(
+                f"{name:<24}{row['status']:>7}{row['queries']:>8}{row['p50_ms'] or 0:>9.2f}"
+                f"{row['p95_ms'] or 0:>9.2f}{row['p99_ms'] or 0:>9.2f}{row['throughput_rps'] or 0:>9.1f}"
+            )
+        for route, reason in report['unbenchmarked'].items():
+            if not route.startswith('admin/'):
+                self.stdout.write(f"skipped {route}: {reason}")
+
+        regressions = report.get('regressions', [])
+        for regression in regressions:
+            self.stdout.write(
+                f"REGRESSION {regression['scenario']} {regression['metric']}: "
+                f"{regression['baseline']} -> {regression['current']}"
+            )
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f"{len(regressions)} regressions against {options['baseline']}")
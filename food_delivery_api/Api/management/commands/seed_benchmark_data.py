@@ -0,0 +1,37 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from Api.benchmarks import SCALES, seed_dataset
+
+
+class Command(BaseCommand):
+    help = "Bulk-insert a deterministic synthetic dataset for the benchmark suite."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+        parser.add_argument('--restaurants', type=int)
+        parser.add_argument('--menu-items', type=int)
+        parser.add_argument('--customers', type=int)
+        parser.add_argument('--couriers', type=int)
+        parser.add_argument('--orders', type=int)
+        parser.add_argument('--big-menu', type=int, help="Items on one extra restaurant (0 for none).")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--flush', action='store_true', help="Empty the database first.")
+
+    def handle(self, *args, **options):
+        if options['flush']:
+            call_command('flush', interactive=False, verbosity=0)
+
+        counts = dict(SCALES[options['scale']])
+        for name in counts:
+            if options[name] is not None:
+                counts[name] = options[name]
+
+        created = seed_dataset(
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            log=self.stdout.write if options['verbosity'] > 1 else None,
+            **counts,
+        )
+        self.stdout.write(", ".join(f"{count} {name}" for name, count in created.items()))
@@ -0,0 +1,57 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from Api.dispatch import ALGORITHMS, simulate
+
+
+class Command(BaseCommand):
+    help = "Replay synthetic orders and couriers through the dispatcher in memory and report batch timings."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=5000)
+        parser.add_argument('--couriers', type=int, default=800)
+        parser.add_argument('--restaurants', type=int, default=300)
+        parser.add_argument('--hours', type=float, default=2.0)
+        parser.add_argument('--interval', type=int, default=30, help="Seconds between batches.")
+        parser.add_argument('--max-pickup-km', type=float, default=8.0)
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--speed-kmh', type=float, default=20.0)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--algorithm', choices=ALGORITHMS, action='append', dest='algorithms',
+            help="Algorithm to run (can be repeated; default: all).",
+        )
+        parser.add_argument('--output', help="Write the JSON reports here.")
+
+    def handle(self, *args, **options):
+        reports = [
+            simulate(
+                orders=options['orders'],
+                couriers=options['couriers'],
+                restaurants=options['restaurants'],
+                hours=options['hours'],
+                interval=options['interval'],
+                algorithm=algorithm,
+                max_km=options['max_pickup_km'],
+                batch_size=options['batch_size'],
+                speed_kmh=options['speed_kmh'],
+                seed=options['seed'],
+            )
+            for algorithm in options['algorithms'] or ALGORITHMS
+        ]
+        if options['output']:
+            with open(options['output'], 'w') as fileobj:
+                json.dump(reports, fileobj, indent=2)
+
+        self.stdout.write(
+            f"{'algorithm':<10}{'batches':>8}{'assigned':>9}{'ms/batch':>9}{'p95 ms':>8}{'max ms':>8}"
+            f"{'pickup km':>10}{'wait p95':>9}{'deliv p50':>10}{'deliv p95':>10}"
+        )
+        for report in reports:
+            self.stdout.write(
+                f"{report['algorithm']:<10}{report['batches']:>8}{report['assigned']:>9}"
+                f"{report['batch_ms_mean'] or 0:>9.2f}{report['batch_ms_p95'] or 0:>8.2f}{report['batch_ms_max'] or 0:>8.2f}"
+                f"{report['pickup_km_mean'] or 0:>10.2f}{report['wait_min_p95']:>9.1f}"
+                f"{report['delivery_min_p50']:>10.1f}{report['delivery_min_p95']:>10.1f}"
+            )
@@ -0,0 +1,34 @@
+import sqlite3
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from Api.replicas import replica_settings
+
+
+class Command(BaseCommand):
+    help = "Copy the SQLite primary over each SQLite replica (local stand-in for replication)."
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError("Only SQLite databases can be synced this way")
+        replicas = replica_settings()["REPLICAS"]
+        if not replicas:
+            raise CommandError("DATABASE_REPLICAS has no REPLICAS")
+
+        source = sqlite3.connect(primary.settings_dict['NAME'])
+        try:
+            for alias in replicas:
+                replica = connections[alias]
+                if replica.vendor != 'sqlite':
+                    raise CommandError(f"{alias} is not a SQLite database")
+                replica.close()
+                target = sqlite3.connect(replica.settings_dict['NAME'])
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+                self.stdout.write(f"Copied {primary.settings_dict['NAME']} to {alias}")
+        finally:
+            source.close()
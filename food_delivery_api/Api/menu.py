@@ -0,0 +1,102 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Prefetch
+
+from .models import Restaurant, MenuCategory, MenuItem
+from .replicas import primary_reads
+from .serializers import RestaurantSerializer, MenuItemSerializer
+
+
+# Precomputed restaurant -> categories -> items documents, kept in the cache
+# under a per-restaurant generation that is bumped whenever a row that feeds
+# them changes (see signals.py). A reader that built its document from the
+# old rows can only store it under the old generation, which nobody reads
+# again; MENU_CACHE_TIMEOUT bounds how long any snapshot lives regardless.
+
+def menu_generation_key(restaurant_id):
+    return f"menu-generation:{restaurant_id}"
+
+
+def menu_cache_key(restaurant_id, generation):
+    return f"menu:{restaurant_id}:{generation}"
+
+
+def menu_generation(restaurant_id):
+    key = menu_generation_key(restaurant_id)
+    generation = cache.get(key)
+    if generation is None:
+        # Start from the clock so an evicted counter can't reuse old keys
+        cache.add(key, time.time_ns(), None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump_menu_generation(restaurant_id):
+    key = menu_generation_key(restaurant_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), None)
+
+
+def build_menu_document(restaurant_id):
+    restaurant = (
+        Restaurant.objects.select_related('owner')
+        .prefetch_related(
+            Prefetch(
+                'categories',
+                queryset=MenuCategory.objects.order_by('name', 'id').prefetch_related(
+                    Prefetch('items', queryset=MenuItem.objects.order_by('name', 'id'))
+                ),
+            )
+        )
+        .filter(pk=restaurant_id)
+        .first()
+    )
+    if restaurant is None:
+        return None
+
+    document = RestaurantSerializer(restaurant).data
+    document["categories"] = [
+        {
+            "id": category.id,
+            "name": category.name,
+            "items": MenuItemSerializer(category.items.all(), many=True).data,
+        }
+        for category in restaurant.categories.all()
+    ]
+    return json.loads(json.dumps(document))
+
+
+def get_menu_snapshot(restaurant_id):
+    """
+    Return {"etag": ..., "document": ...} for a restaurant, building and
+    caching it on a miss. Returns None if the restaurant does not exist.
+    """
+    key = menu_cache_key(restaurant_id, menu_generation(restaurant_id))
+    snapshot = cache.get(key)
+    if snapshot is not None:
+        return snapshot
+
+    # A lagging replica could re-cache rows an invalidation just dropped
+    with primary_reads():
+        document = build_menu_document(restaurant_id)
+    if document is None:
+        return None
+
+    body = json.dumps(document, sort_keys=True, separators=(",", ":"))
+    version = hashlib.sha1(body.encode()).hexdigest()
+    document["version"] = version
+    snapshot = {"etag": f'"{version}"', "document": document}
+    cache.set(key, snapshot, getattr(settings, "MENU_CACHE_TIMEOUT", 3600))
+    return snapshot
+
+
+def invalidate_menu(restaurant_id):
+    # Wait for the commit so readers of the new generation see the new rows
+    transaction.on_commit(lambda: bump_menu_generation(restaurant_id))
@@ -0,0 +1,39 @@
+from django.db import migrations
+
+
+# MySQL FULLTEXT indexes for Api/search.py. SQLite's FTS5 tables are created
+# by Api.search.install_search_indexes after every migrate instead, since
+# SQLite drops their triggers whenever a migration rebuilds the base table.
+FULLTEXT_INDEXES = [
+    ('Api_menuitem', 'menuitem_fulltext_idx', ['name', 'description']),
+    ('Api_restaurant', 'restaurant_fulltext_idx', ['name', 'address']),
+]
+
+
+def add_fulltext_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    qn = schema_editor.quote_name
+    for table, name, columns in FULLTEXT_INDEXES:
+        schema_editor.execute(
+            f"CREATE FULLTEXT INDEX {qn(name)} ON {qn(table)} ({', '.join(qn(c) for c in columns)})"
+        )
+
+
+def drop_fulltext_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    qn = schema_editor.quote_name
+    for table, name, _ in FULLTEXT_INDEXES:
+        schema_editor.execute(f"DROP INDEX {qn(name)} ON {qn(table)}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Api', '0002_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_fulltext_indexes, drop_fulltext_indexes),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations
+
+
+# Indexes for Api/blacklist.py on simplejwt's token_blacklist tables: pruning
+# scans OutstandingToken.expires_at and the revocation sync reads
+# BlacklistedToken.blacklisted_at. Runs after simplejwt's last migration so
+# none of its table rebuilds drop them; 0013 ships in simplejwt 5.5.1, the
+# minimum in requirements.txt.
+INDEXES = [
+    ('token_blacklist_outstandingtoken', 'outstandingtoken_expires_idx', 'expires_at'),
+    ('token_blacklist_blacklistedtoken', 'blacklistedtoken_at_idx', 'blacklisted_at'),
+]
+
+
+def add_indexes(apps, schema_editor):
+    qn = schema_editor.quote_name
+    for table, name, column in INDEXES:
+        schema_editor.execute(f"CREATE INDEX {qn(name)} ON {qn(table)} ({qn(column)})")
+
+
+def drop_indexes(apps, schema_editor):
+    qn = schema_editor.quote_name
+    for table, name, _ in INDEXES:
+        if schema_editor.connection.vendor == 'mysql':
+            schema_editor.execute(f"DROP INDEX {qn(name)} ON {qn(table)}")
+        else:
+            schema_editor.execute(f"DROP INDEX {qn(name)}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Api', '0003_fulltext_search'),
+        ('token_blacklist', '0013_alter_blacklistedtoken_options_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_indexes, drop_indexes),
+    ]
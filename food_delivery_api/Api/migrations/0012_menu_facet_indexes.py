@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Api', '0011_ownership_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='menucategory',
+            index=models.Index(fields=['restaurant', 'name'], name='menucategory_restaurant_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='menuitem',
+            index=models.Index(fields=['category', 'price', 'id'], name='menuitem_category_price_idx'),
+        ),
+    ]
@@ -1,12 +1,37 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.core.validators import MaxValueValidator, MinValueValidator
+
+from .geo import encode_geohash
+
+
+# Remembers the column values an instance was loaded with, so signal
+# handlers can tell what a save actually changed without re-reading the row
+class TracksLoadedValues:
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+
+# updated_at (auto_now) is only written when it's among update_fields, so
+# partial saves add it; conditional requests (Api/conditional.py) version
+# representations by it
+class TracksUpdates:
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields:
+            kwargs['update_fields'] = {*update_fields, 'updated_at'}
+        super().save(*args, **kwargs)
 
 
 class User(AbstractUser):
     ROLE_CHOICES =(
         ('admin', 'Admin'),
         ('restaurant_owner', 'Restaurant Owner'),
-        ('customer', 'Customer')
+        ('customer', 'Customer'),
+        ('courier', 'Courier')
     )
 
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='customer')
@@ -17,36 +42,89 @@ class User(AbstractUser):
   
 
 # Restaurant owned by a user
-class Restaurant(models.Model):
+class Restaurant(TracksUpdates, models.Model):
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='restaurant')
     name = models.CharField(max_length=250)
     address = models.TextField()
     phone = models.CharField(max_length=250)
+    latitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-90), MaxValueValidator(90)])
+    longitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-180), MaxValueValidator(180)])
+    # Derived from latitude/longitude on save; indexed for nearby queries (Api/geo.py)
+    geohash = models.CharField(max_length=12, blank=True, default='', editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['name', 'id'], name='restaurant_name_id_idx'),
+            models.Index(fields=['geohash', 'id'], name='restaurant_geohash_id_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        located = self.latitude is not None and self.longitude is not None
+        self.geohash = encode_geohash(self.latitude, self.longitude) if located else ''
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'geohash'}
+        super().save(*args, **kwargs)
     
     def __str__(self):
         return self.name
 
 #Menu category for a restaurant
-class MenuCategory(models.Model):
+class MenuCategory(TracksUpdates, models.Model):
     restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='categories')
     name = models.CharField(max_length=250)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # ?restaurant= menu filtering and facet names (Api/facets.py) without a table lookup
+            models.Index(fields=['restaurant', 'name'], name='menucategory_restaurant_idx'),
+        ]
 
     def __str__(self): 
         return self.name
 
 #Item in a menu category
-class MenuItem(models.Model):
+class MenuItem(TracksLoadedValues, TracksUpdates, models.Model):
     category = models.ForeignKey(MenuCategory, on_delete=models.CASCADE, related_name='items')
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
     price = models.DecimalField(max_digits=8, decimal_places=2)
     image = models.ImageField(upload_to='menu_items/', blank=True, null=True)
+    # {"source": <image name>, "sizes": {size: name}}, written by Api/images.py
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['name', 'id'], name='menuitem_name_id_idx'),
+            models.Index(fields=['price', 'id'], name='menuitem_price_id_idx'),
+            # Category/price range filters and the facet counts (Api/facets.py)
+            models.Index(fields=['category', 'price', 'id'], name='menuitem_category_price_idx'),
+        ]
 
     def __str__(self):
         return self.name
     
+# Delivery courier; the courier app keeps the location and availability fresh
+class Courier(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='courier')
+    latitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-90), MaxValueValidator(90)])
+    longitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-180), MaxValueValidator(180)])
+    is_available = models.BooleanField(default=False)
+    last_seen = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_available', 'last_seen'], name='courier_available_seen_idx'),
+        ]
+
+    def __str__(self):
+        return f'courier {self.user_id}'
+
 #  Customer order
-class Order(models.Model):
+class Order(TracksLoadedValues, TracksUpdates, models.Model):
     STATUS_CHOICES = [
         ('PENDING','Pending'),
         ('CONFIRMED','Confirmed'),
@@ -56,15 +134,31 @@ class Order(models.Model):
     ]
     customer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders')
     restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='orders')
-    created_at = models.DateField(auto_now=True)
+    created_at = models.DateTimeField(auto_now_add=True)
     total_price = models.DecimalField(max_digits=8, decimal_places=2)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    # Set by the dispatcher (Api/dispatch.py) when it sends the order out
+    courier = models.ForeignKey(Courier, on_delete=models.SET_NULL, null=True, blank=True, related_name='deliveries')
+    assigned_at = models.DateTimeField(null=True, blank=True)
+    # Also bumped when the order's items change (signals.py)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='order_created_at_id_idx'),
+            models.Index(fields=['total_price', 'id'], name='order_total_price_id_idx'),
+            # The dispatch queue: oldest orders in a status first
+            models.Index(fields=['status', 'created_at', 'id'], name='order_status_created_at_idx'),
+            # Customers' and couriers' own order lists (Api/scoping.py), in keyset order
+            models.Index(fields=['customer', 'created_at', 'id'], name='order_customer_created_idx'),
+            models.Index(fields=['courier', 'created_at', 'id'], name='order_courier_created_idx'),
+        ]
 
     def __str__(self):
         return f'order {self.id}'
 
 #Specific item in an order
-class OrderItem(models.Model):
+class OrderItem(TracksLoadedValues, models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='order_items')
     menu_item = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField()
@@ -73,3 +167,92 @@ class OrderItem(models.Model):
     def __str__(self):
         return f'{self.menu_item.name} x {self.quantity}'
 
+
+# Delivered/cancelled orders moved out of the hot tables by Api/archive.py.
+# Same columns and ids as Order/OrderItem, so OrderSerializer renders both.
+class ArchivedOrder(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    customer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_orders')
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='archived_orders')
+    created_at = models.DateTimeField()
+    total_price = models.DecimalField(max_digits=8, decimal_places=2)
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    courier = models.ForeignKey(Courier, on_delete=models.SET_NULL, null=True, blank=True, related_name='archived_deliveries')
+    assigned_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='archived_order_created_id_idx'),
+            models.Index(fields=['total_price', 'id'], name='archived_order_price_id_idx'),
+            models.Index(fields=['customer', 'created_at', 'id'], name='archived_order_customer_idx'),
+        ]
+
+    def __str__(self):
+        return f'archived order {self.id}'
+
+
+class ArchivedOrderItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='order_items')
+    menu_item = models.ForeignKey(MenuItem, on_delete=models.CASCADE, related_name='archived_order_items')
+    quantity = models.PositiveIntegerField()
+    price = models.DecimalField(max_digits=8, decimal_places=2)
+
+    def __str__(self):
+        return f'{self.menu_item.name} x {self.quantity}'
+
+
+# Outcome of a write sent with an Idempotency-Key (Api/idempotency.py)
+class IdempotencyKey(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    # sha256 of method, path and body; a reused key must match it
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    body = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} {self.key}'
+
+
+# Sales rollups, kept up to date incrementally by Api/analytics.py
+class DailyOrderRollup(models.Model):
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='daily_order_rollups')
+    day = models.DateField()
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    order_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['restaurant', 'day', 'status'], name='unique_daily_order_rollup'),
+        ]
+
+    def __str__(self):
+        return f'{self.restaurant_id} {self.day} {self.status}: {self.order_count}'
+
+
+class DailyMenuItemRollup(models.Model):
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='daily_menu_item_rollups')
+    menu_item = models.ForeignKey(MenuItem, on_delete=models.CASCADE, related_name='daily_rollups')
+    day = models.DateField()
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['restaurant', 'day', 'menu_item'], name='unique_daily_menu_item_rollup'),
+        ]
+
+    def __str__(self):
+        return f'{self.restaurant_id} {self.day} item {self.menu_item_id}: {self.quantity}'
+
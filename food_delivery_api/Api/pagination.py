@@ -0,0 +1,212 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import date, datetime, time
+from decimal import Decimal, InvalidOperation
+from functools import reduce
+from operator import or_
+from uuid import UUID
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def cursor_value(value):
+    # Lossless, unlike DjangoJSONEncoder, which cuts datetimes to milliseconds
+    # and would seek past (or back onto) rows in the same millisecond
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, (Decimal, UUID)):
+        return str(value)
+    return value
+
+
+def ordering_field(model, path):
+    field = None
+    for name in path.split('__'):
+        field = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+        model = field.related_model
+    return field.target_field if field.is_relation else field
+
+
+def cursor_to_python(model, path, value):
+    if value is None:
+        raise ValueError("Cursor values are never null")
+    try:
+        field = ordering_field(model, path)
+    except FieldDoesNotExist:
+        # Annotations such as search_rank are numbers
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError("Annotation cursor values are numbers")
+        return value
+    if isinstance(value, (dict, list)):
+        raise TypeError("Cursor values are scalars")
+    return field.to_python(value)
+
+
+# Keyset ("seek") pagination: each page is `WHERE (sort key, pk) > last seen`
+# on an indexed ordering, so there is no COUNT(*) and no OFFSET, and rows
+# inserted while a client is paging never shift what it sees next.
+class KeysetPagination(BasePagination):
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    ordering = '-pk'
+
+    # Admin tooling can still ask for numbered pages with ?page=N
+    page_number_query_param = 'page'
+    page_number_class = PageNumberPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.seek_queryset(queryset, request, view)
+        if self.page_number_paginator is not None:
+            return self.page_number_paginator.paginate_queryset(queryset, request, view)
+        return self.take_page(list(queryset[:self.page_size + 1]))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        queryset = self.seek_queryset(queryset, request, view)
+        if self.page_number_paginator is not None:
+            # Numbered pages COUNT(*) through Django's sync-only Paginator
+            return await sync_to_async(self.page_number_paginator.paginate_queryset)(queryset, request, view)
+        return self.take_page([row async for row in queryset[:self.page_size + 1]])
+
+    def seek_queryset(self, queryset, request, view):
+        self.page_number_paginator = None
+        if self.use_page_numbers(request):
+            self.page_number_paginator = self.page_number_class()
+            return queryset
+
+        self.base_url = request.build_absolute_uri()
+        self.terms = self.get_ordering(request, queryset, view)
+        self.cursor_values, self.reverse = self.decode_cursor(request, queryset.model)
+
+        terms = [(field, not desc) for field, desc in self.terms] if self.reverse else self.terms
+        queryset = queryset.order_by(*[f"-{field}" if desc else field for field, desc in terms])
+        if self.cursor_values is not None:
+            queryset = queryset.filter(self.seek(terms, self.cursor_values))
+        return queryset
+
+    def take_page(self, rows):
+        # `rows` holds up to one row past the page, which tells us if there is more
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        if self.reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor_values is not None
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        if self.page_number_paginator is not None:
+            return self.page_number_paginator.get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.position(self.page[-1]), reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.position(self.page[0]), reverse=True)
+
+    def use_page_numbers(self, request):
+        user = request.user
+        return (
+            self.page_number_query_param in request.query_params
+            and user.is_authenticated
+            and (user.is_staff or getattr(user, 'role', None) == 'admin')
+        )
+
+    def get_ordering(self, request, queryset, view):
+        # Honour OrderingFilter (?ordering=price) the same way CursorPagination does
+        ordering = None
+        for backend in getattr(view, 'filter_backends', []):
+            if hasattr(backend, 'get_ordering'):
+                ordering = backend().get_ordering(request, queryset, view)
+                break
+        if not ordering:
+            ordering = getattr(view, 'ordering', None) or self.ordering
+        if isinstance(ordering, str):
+            ordering = [ordering]
+
+        terms = [(term.lstrip('-'), term.startswith('-')) for term in ordering]
+        # Always finish on the primary key so every position is unique
+        if not any(field in ('pk', 'id') for field, _ in terms):
+            terms.append(('pk', terms[-1][1]))
+        return terms
+
+    @staticmethod
+    def seek(terms, values):
+        # (a, b) > (x, y)  ==  a > x OR (a = x AND b > y), spelled per direction
+        conditions = []
+        for i, (field, desc) in enumerate(terms):
+            condition = Q(**{f"{field}__{'lt' if desc else 'gt'}": values[i]})
+            for (prior, _), value in zip(terms[:i], values[:i]):
+                condition &= Q(**{prior: value})
+            conditions.append(condition)
+        return reduce(or_, conditions)
+
+    def position(self, instance):
+        if isinstance(instance, dict):
+            # .values() rows from the fast read path
+            return [instance[field] for field, _ in self.terms]
+        values = []
+        for field, _ in self.terms:
+            value = instance
+            for attr in field.split('__'):
+                value = getattr(value, attr)
+            values.append(value)
+        return values
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            values, reverse = cursor['v'], bool(cursor.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeEncodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.terms):
+            raise NotFound(self.invalid_cursor_message)
+        # Cursors come back from clients; anything the ordering field can't hold is a 404, not a 500
+        try:
+            values = [cursor_to_python(model, field, value) for (field, _), value in zip(self.terms, values)]
+        except (ValidationError, TypeError, ValueError, InvalidOperation):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    def encode_cursor(self, values, reverse):
+        cursor = {'v': [cursor_value(value) for value in values]}
+        if reverse:
+            cursor['r'] = 1
+        payload = json.dumps(cursor, separators=(',', ':'))
+        encoded = urlsafe_b64encode(payload.encode()).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
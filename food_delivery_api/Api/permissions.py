@@ -12,6 +12,10 @@ class IsRestaurantOwner(BasePermission):
     def has_permission(self, request, view):
         return bool(request.user and request.user.is_authenticated and request.user.role == 'restaurant_owner')
 
+class IsCourier(BasePermission):
+    def has_permission(self, request, view):
+        return bool(request.user and request.user.is_authenticated and request.user.role == 'courier')
+
 class IsCustomer(BasePermission):
     def has_permission(self, request, view):
         if request.method in SAFE_METHODS:
@@ -27,10 +31,15 @@ class IsOwnerOrReadOnly(BasePermission):
         if request.method in SAFE_METHODS:
             return True
 
-        if hasattr(obj, "owner"):
-            return obj.owner == request.user
+        # Worked out in SQL by Api/scoping.py's with_ownership()
+        owned = getattr(obj, "owned", None)
+        if owned is not None:
+            return owned
+
+        if hasattr(obj, "owner_id"):
+            return obj.owner_id == request.user.pk
 
-        if hasattr(obj, "customer"):
-            return obj.customer == request.user
+        if hasattr(obj, "customer_id"):
+            return obj.customer_id == request.user.pk
 
         return False
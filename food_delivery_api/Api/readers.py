@@ -0,0 +1,194 @@
+import copy
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import serializers
+from rest_framework.response import Response
+
+from .fieldsets import FULL
+from .images import image_urls_from_values
+from .instrumentation import timed
+from .serializers import MenuItemSerializer, RestaurantSerializer, format_distance
+
+
+# High-throughput GET path for list/detail endpoints. A RowReader looks at a
+# ModelSerializer once, works out which columns its output needs, and then
+# turns `.values()` rows straight into the same dicts the serializer would
+# produce, skipping model instances and per-field serializer machinery.
+
+PASS_THROUGH = (
+    serializers.CharField, serializers.IntegerField, serializers.BooleanField,
+    serializers.ReadOnlyField, serializers.PrimaryKeyRelatedField,
+)
+
+
+def file_url(storage):
+    # FileField.to_representation, working from the stored name
+    def convert(name, request):
+        if not name:
+            return None
+        url = storage.url(name)
+        return request.build_absolute_uri(url) if request is not None else url
+    return convert
+
+
+class RowReader:
+    """
+    `extra` maps method fields to (columns, function); the function receives
+    those column values and the request and returns the field's output.
+    `annotations` are columns that only exist when a filter annotated them
+    (None otherwise). `carry` columns come along in each row without being
+    output.
+    """
+
+    def __init__(self, serializer_class, extra=None, annotations=(), carry=()):
+        self.serializer_class = serializer_class
+        self.extra = extra or {}
+        self.annotations = frozenset(annotations)
+        self.carry = tuple(carry)
+        self._plan = None
+        self._narrowed = {}
+
+    @property
+    def plan(self):
+        if self._plan is None:
+            self._plan = self.compile()
+        return self._plan
+
+    def compile(self):
+        model = self.serializer_class.Meta.model
+        plan = []
+        for key, field in self.serializer_class().fields.items():
+            if field.write_only:
+                continue
+            if key in self.extra:
+                columns, function = self.extra[key]
+                plan.append((key, tuple(columns), function, True))
+                continue
+            if field.source == '*' or isinstance(field, serializers.BaseSerializer):
+                raise ImproperlyConfigured(f"{self.serializer_class.__name__}.{key} needs an `extra` entry")
+
+            column = '__'.join(field.source_attrs)
+            if len(field.source_attrs) == 1:
+                model_field = model._meta.get_field(column)
+                if model_field.is_relation:
+                    column = model_field.attname
+            if isinstance(field, serializers.FileField):
+                plan.append((key, (column,), file_url(model._meta.get_field(column).storage), True))
+            elif isinstance(field, PASS_THROUGH):
+                plan.append((key, column, None, False))
+            else:
+                plan.append((key, column, field.to_representation, False))
+        return plan
+
+    def narrowed(self, fields):
+        # A reader for a ?fields= subset; it only selects those columns
+        key = frozenset(fields)
+        if key not in self._narrowed:
+            reader = copy.copy(self)
+            reader._plan = [entry for entry in self.plan if entry[0] in key]
+            reader._narrowed = {}
+            self._narrowed[key] = reader
+        return self._narrowed[key]
+
+    @property
+    def columns(self):
+        columns = []
+        for _, column, _, multi in self.plan:
+            for name in (column if multi else (column,)):
+                if name not in columns and name not in self.annotations:
+                    columns.append(name)
+        return columns
+
+    def rows(self, queryset):
+        # Annotations (e.g. search_rank), ordering columns and pk come along for pagination cursors
+        columns = [*self.columns, *self.carry, *queryset.query.annotations]
+        for term in queryset.query.order_by:
+            name = term.lstrip('-') if isinstance(term, str) else 'pk'
+            if name != 'pk' and name not in columns:
+                columns.append(name)
+        return queryset.values(*columns, 'pk')
+
+    def serialize_row(self, row, request=None):
+        data = {}
+        for key, column, convert, multi in self.plan:
+            if multi:
+                data[key] = convert(*[row.get(name) for name in column], request)
+            else:
+                value = row[column]
+                data[key] = value if convert is None or value is None else convert(value)
+        return data
+
+    def serialize(self, rows, request=None):
+        serialize_row = self.serialize_row
+        with timed('serialize'):
+            return [serialize_row(row, request) for row in rows]
+
+
+MENU_ITEM_READER = RowReader(
+    MenuItemSerializer,
+    extra={'image_urls': (('image', 'image_derivatives'), image_urls_from_values)},
+    # ETags (Api/conditional.py)
+    carry=('updated_at',),
+)
+RESTAURANT_READER = RowReader(
+    RestaurantSerializer,
+    extra={'distance_km': (('distance',), lambda distance, request: format_distance(distance))},
+    annotations=('distance',),
+    carry=('updated_at',),
+)
+
+
+def instance_from_row(model, row):
+    # Object permissions see an unsaved instance carrying the row's columns
+    concrete = {field.attname for field in model._meta.concrete_fields}
+    return model(**{k: v for k, v in row.items() if k in concrete})
+
+
+def fast_reads_enabled():
+    return getattr(settings, 'FAST_READ_PATH', True)
+
+
+class FastReadMixin:
+    """
+    Serve list and retrieve with `row_reader` instead of `serializer_class`.
+    Output is identical; set FAST_READ_PATH = False to switch it off.
+    """
+
+    row_reader = None
+
+    def get_row_reader(self):
+        if self.row_reader is None or not fast_reads_enabled():
+            return None
+        shape = getattr(self, 'shape', FULL)
+        if shape.expand:
+            # Expanded relations are nested objects; the serializers render those
+            return None
+        return self.row_reader if shape.fields is None else self.row_reader.narrowed(shape.fields)
+
+    def list(self, request, *args, **kwargs):
+        reader = self.get_row_reader()
+        if reader is None:
+            return super().list(request, *args, **kwargs)
+
+        rows = reader.rows(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(reader.serialize(page, request))
+        return Response(reader.serialize(rows, request))
+
+    def retrieve(self, request, *args, **kwargs):
+        reader = self.get_row_reader()
+        if reader is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset())
+        row = reader.rows(queryset).filter(**{self.lookup_field: kwargs[lookup_url_kwarg]}).first()
+        if row is None:
+            # Same 404 as get_object()
+            return super().retrieve(request, *args, **kwargs)
+        self.check_object_permissions(request, instance_from_row(queryset.model, row))
+        with timed('serialize'):
+            data = reader.serialize_row(row, request)
+        return Response(data)
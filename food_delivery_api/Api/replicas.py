@@ -0,0 +1,247 @@
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils.functional import LazyObject, empty
+
+
+# Read replicas. ReplicaRoutingMiddleware marks GET/HEAD/OPTIONS requests as
+# replica-eligible and ReplicaRouter sends their reads to one healthy
+# replica, picked once per request. Everything else uses the primary: writes,
+# reads in requests that wrote, requests from users who wrote in the last
+# STICKY_SECONDS (read-your-writes), and code outside a request (management
+# commands, workers, streaming bodies).
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_state = ContextVar('replica_routing', default=None)
+
+
+def replica_settings():
+    options = {
+        "REPLICAS": [],
+        "STICKY_SECONDS": 10,
+        "CHECK_INTERVAL": 5,
+        "EJECT_SECONDS": 30,
+        "CACHE": "default",
+    }
+    options.update(getattr(settings, 'DATABASE_REPLICAS', None) or {})
+    return options
+
+
+class RoutingState:
+    __slots__ = ('request', 'read_only', 'replica', 'wrote', 'pinned', 'resolving')
+
+    def __init__(self, request, read_only):
+        self.request = request
+        self.read_only = read_only
+        self.replica = None
+        self.wrote = False
+        self.pinned = None
+        self.resolving = False
+
+
+class ReplicaPool:
+    """Replica aliases with a cheap per-process health check and ejection."""
+
+    def __init__(self, aliases, check_interval=5, eject_seconds=30):
+        self.aliases = list(aliases)
+        self.check_interval = check_interval
+        self.eject_seconds = eject_seconds
+        self._lock = threading.Lock()
+        self._checked = {}
+        self._ejected_until = {}
+
+    def check(self, alias):
+        with connections[alias].cursor() as cursor:
+            cursor.execute("SELECT 1")
+
+    def eject(self, alias, reason=None):
+        with self._lock:
+            self._ejected_until[alias] = time.monotonic() + self.eject_seconds
+        logger.warning("Ejected read replica %s for %ss: %s", alias, self.eject_seconds, reason)
+
+    def healthy(self):
+        now = time.monotonic()
+        healthy = []
+        for alias in self.aliases:
+            if self._ejected_until.get(alias, 0) > now:
+                continue
+            if now - self._checked.get(alias, -self.check_interval) >= self.check_interval:
+                try:
+                    self.check(alias)
+                except DatabaseError as exc:
+                    self.eject(alias, exc)
+                    continue
+                self._checked[alias] = now
+            healthy.append(alias)
+        return healthy
+
+    def choose(self):
+        healthy = self.healthy()
+        return random.choice(healthy) if healthy else None
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                options = replica_settings()
+                _pool = ReplicaPool(options["REPLICAS"], options["CHECK_INTERVAL"], options["EJECT_SECONDS"])
+    return _pool
+
+
+def reset_pool():
+    global _pool
+    with _pool_lock:
+        _pool = None
+
+
+def pin_key(user_id):
+    return f"replica-pin:{user_id}"
+
+
+def authenticated_user(request):
+    # Don't evaluate Django's lazy session user from inside the router; DRF
+    # replaces it with the real user once it has authenticated the request
+    user = getattr(request, 'user', None)
+    if isinstance(user, LazyObject):
+        user = None if user._wrapped is empty else user._wrapped
+    if user is None or not user.is_authenticated:
+        return None
+    return user
+
+
+def is_pinned(state):
+    if state.pinned is None and not state.resolving:
+        user = authenticated_user(state.request)
+        if user is None:
+            # Not authenticated yet; decide again on the next read
+            return False
+        state.resolving = True
+        try:
+            options = replica_settings()
+            state.pinned = caches[options["CACHE"]].get(pin_key(user.pk)) is not None
+        finally:
+            state.resolving = False
+    return bool(state.pinned)
+
+
+def pin_to_primary(user):
+    options = replica_settings()
+    caches[options["CACHE"]].set(pin_key(user.pk), 1, options["STICKY_SECONDS"])
+
+
+@contextmanager
+def primary_reads():
+    """
+    Send reads inside the block to the primary. For code that fills a
+    cache which outlives replica lag (menu snapshots, the user cache).
+    """
+    state = _state.get()
+    read_only = state.read_only if state is not None else None
+    if state is not None:
+        state.read_only = False
+    try:
+        yield
+    finally:
+        if state is not None:
+            state.read_only = read_only
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.read_only or state.wrote or state.resolving or is_pinned(state):
+            return DEFAULT_DB_ALIAS
+        if state.replica is None:
+            state.replica = get_pool().choose() or DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas are copies of the primary
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db in replica_settings()["REPLICAS"]:
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not replica_settings()["REPLICAS"]:
+            return self.get_response(request)
+
+        state = RoutingState(request, read_only=request.method in SAFE_METHODS)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        if state.wrote:
+            user = authenticated_user(request)
+            if user is not None:
+                pin_to_primary(user)
+        return response
+
+    async def __acall__(self, request):
+        if not replica_settings()["REPLICAS"]:
+            return await self.get_response(request)
+
+        # Sync code called through sync_to_async sees this state too
+        state = RoutingState(request, read_only=request.method in SAFE_METHODS)
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        if state.wrote:
+            user = authenticated_user(request)
+            if user is not None:
+                await sync_to_async(pin_to_primary)(user)
+        return response
+
+    def process_exception(self, request, exception):
+        # A database error in a replica-served request ejects the replica if
+        # it also fails a health check (the error may have come from the primary)
+        state = _state.get()
+        if state is not None and state.replica not in (None, DEFAULT_DB_ALIAS) and isinstance(exception, DatabaseError):
+            pool = get_pool()
+            try:
+                pool.check(state.replica)
+            except DatabaseError as exc:
+                pool.eject(state.replica, exc)
+        return None
@@ -0,0 +1,90 @@
+from django.db.models import BooleanField, ExpressionWrapper, Q, Value
+from rest_framework.permissions import SAFE_METHODS
+
+from .models import (
+    Restaurant, MenuCategory, MenuItem, Order, OrderItem, ArchivedOrder, ArchivedOrderItem,
+)
+
+
+# Row ownership as SQL. For each model and role, the foreign-key path from
+# a row to the user who owns it: a customer owns their orders, a restaurant
+# owner their restaurants, menus and the orders placed with them, a courier
+# the orders they deliver. Admins own everything. Paths end in `_id`, so the
+# last hop compares a column instead of joining the user table.
+
+ORDER_OWNERS = {
+    "customer": "customer_id",
+    "restaurant_owner": "restaurant__owner_id",
+    "courier": "courier__user_id",
+}
+ORDER_ITEM_OWNERS = {role: f"order__{path}" for role, path in ORDER_OWNERS.items()}
+
+OWNERSHIP = {
+    Restaurant: {"restaurant_owner": "owner_id"},
+    MenuCategory: {"restaurant_owner": "restaurant__owner_id"},
+    MenuItem: {"restaurant_owner": "category__restaurant__owner_id"},
+    Order: ORDER_OWNERS,
+    ArchivedOrder: ORDER_OWNERS,
+    OrderItem: ORDER_ITEM_OWNERS,
+    ArchivedOrderItem: ORDER_ITEM_OWNERS,
+}
+
+
+def is_admin(user):
+    return getattr(user, 'role', None) == 'admin'
+
+
+def ownership_q(model, user):
+    """Q for the rows `user` owns; None if they own none of them."""
+    if user is None or not user.is_authenticated:
+        return None
+    if is_admin(user):
+        return Q()
+    path = OWNERSHIP.get(model, {}).get(user.role)
+    return Q(**{path: user.pk}) if path is not None else None
+
+
+def owned_by(queryset, user):
+    condition = ownership_q(queryset.model, user)
+    return queryset.none() if condition is None else queryset.filter(condition)
+
+
+def with_ownership(queryset, user):
+    """Every row, with an `owned` flag that IsOwnerOrReadOnly reads."""
+    condition = ownership_q(queryset.model, user)
+    if condition is None:
+        owned = Value(False)
+    elif not condition:
+        # Admins: an empty Q() can't be selected as a column
+        owned = Value(True)
+    else:
+        owned = ExpressionWrapper(condition, output_field=BooleanField())
+    return queryset.annotate(owned=owned)
+
+
+class ScopedQuerysetMixin:
+    """
+    `private` views only ever see the caller's rows, so lists and lookups
+    filter in SQL and someone else's row is a 404. Public views (the
+    catalogue) show every row, and flag ownership for writes. Related
+    fields in `scoped_fields` only accept the caller's rows on writes.
+    """
+
+    private = True
+    scoped_fields = ()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.private:
+            return owned_by(queryset, self.request.user)
+        if self.request.method not in SAFE_METHODS:
+            return with_ownership(queryset, self.request.user)
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        if self.scoped_fields and self.request.method not in SAFE_METHODS:
+            for name in self.scoped_fields:
+                field = serializer.fields[name]
+                field.queryset = owned_by(field.queryset, self.request.user)
+        return serializer
@@ -0,0 +1,149 @@
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import OrderingFilter, SearchFilter
+
+from .models import Restaurant, MenuItem
+
+
+# Full-text search backed by the database's own inverted index: an FTS5
+# table kept in sync by triggers on SQLite, a FULLTEXT index on MySQL
+# (migration 0003). Both are updated incrementally by the database on every
+# insert/update/delete, including bulk writes that bypass model signals.
+
+class SearchIndex:
+    def __init__(self, model, fields, weights):
+        self.model = model
+        self.fields = fields
+        self.weights = weights
+
+    @property
+    def table(self):
+        return self.model._meta.db_table
+
+    @property
+    def fts_table(self):
+        return f"{self.table}_fts"
+
+    @property
+    def columns(self):
+        return [self.model._meta.get_field(name).column for name in self.fields]
+
+    def sqlite_statements(self, connection):
+        qn = connection.ops.quote_name
+        fts, table, pk = qn(self.fts_table), qn(self.table), qn(self.model._meta.pk.column)
+        columns = ", ".join(qn(column) for column in self.columns)
+        new = ", ".join(f"new.{qn(column)}" for column in self.columns)
+        old = ", ".join(f"old.{qn(column)}" for column in self.columns)
+        delete = f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.{pk}, {old});"
+        insert = f"INSERT INTO {fts}(rowid, {columns}) VALUES (new.{pk}, {new});"
+        return [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({columns}, content={table}, "
+            f"content_rowid={pk}, tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+            f"CREATE TRIGGER IF NOT EXISTS {qn(self.fts_table + '_ai')} AFTER INSERT ON {table} BEGIN {insert} END",
+            f"CREATE TRIGGER IF NOT EXISTS {qn(self.fts_table + '_ad')} AFTER DELETE ON {table} BEGIN {delete} END",
+            f"CREATE TRIGGER IF NOT EXISTS {qn(self.fts_table + '_au')} AFTER UPDATE ON {table} BEGIN {delete} {insert} END",
+        ]
+
+    def rank_sql(self, vendor, connection):
+        qn = connection.ops.quote_name
+        if vendor == 'sqlite':
+            # bm25 is "lower is better"; negate so every backend sorts rank DESC
+            fts = qn(self.fts_table)
+            weights = ", ".join(str(weight) for weight in self.weights)
+            return (
+                f"SELECT -bm25({fts}, {weights}) FROM {fts} "
+                f"WHERE {fts} MATCH %s AND {fts}.rowid = {qn(self.table)}.{qn(self.model._meta.pk.column)}"
+            )
+        columns = ", ".join(qn(column) for column in self.columns)
+        return f"MATCH ({columns}) AGAINST (%s IN BOOLEAN MODE)"
+
+    def search(self, queryset, tokens):
+        connection = connections[queryset.db]
+        vendor = connection.vendor
+        if vendor == 'sqlite':
+            # Every token is a prefix match so the box can search as you type
+            query = " AND ".join(f'"{token}"*' for token in tokens)
+            fts = connection.ops.quote_name(self.fts_table)
+            matches = RawSQL(f"SELECT rowid FROM {fts} WHERE {fts} MATCH %s", (query,))
+            return queryset.filter(pk__in=matches).annotate(
+                search_rank=RawSQL(self.rank_sql(vendor, connection), (query,), output_field=FloatField())
+            )
+
+        query = " ".join(f"+{token}*" for token in tokens)
+        return queryset.filter(
+            RawSQL(self.rank_sql(vendor, connection), (query,), output_field=BooleanField())
+        ).annotate(
+            search_rank=RawSQL(self.rank_sql(vendor, connection), (query,), output_field=FloatField())
+        )
+
+
+SEARCH_INDEXES = {
+    MenuItem: SearchIndex(MenuItem, ['name', 'description'], weights=[10.0, 1.0]),
+    Restaurant: SearchIndex(Restaurant, ['name', 'address'], weights=[10.0, 1.0]),
+}
+
+SUPPORTED_VENDORS = ('sqlite', 'mysql')
+
+
+def install_search_indexes(using='default'):
+    """
+    Create the SQLite FTS5 tables and their sync triggers if missing, and
+    populate any table that was just created. Runs after every migrate
+    because SQLite drops triggers when a migration rebuilds a table.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        existing = set(connection.introspection.table_names(cursor))
+        for index in SEARCH_INDEXES.values():
+            if index.table not in existing:
+                continue
+            for statement in index.sqlite_statements(connection):
+                cursor.execute(statement)
+            if index.fts_table not in existing:
+                rebuild_search_index(index, cursor, connection)
+
+
+def rebuild_search_index(index, cursor, connection):
+    qn = connection.ops.quote_name
+    if connection.vendor == 'sqlite':
+        fts = qn(index.fts_table)
+        cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+    elif connection.vendor == 'mysql':
+        cursor.execute(f"OPTIMIZE TABLE {qn(index.table)}")
+
+
+def search_tokens(terms):
+    # Keep only word characters so user input can't inject FTS/boolean syntax
+    return [token for term in terms for token in re.findall(r"\w+", term)]
+
+
+#Replaces SearchFilter's LIKE '%term%' scans with the full-text index
+class FullTextSearchFilter(SearchFilter):
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+
+        index = SEARCH_INDEXES.get(queryset.model)
+        tokens = search_tokens(terms)
+        if index is None or not tokens or connections[queryset.db].vendor not in SUPPORTED_VENDORS:
+            return super().filter_queryset(request, queryset, view)
+        return index.search(queryset, tokens)
+
+
+#Orders nearby results by distance and search results by relevance, unless
+#the client asks for an ordering
+class SearchRankOrderingFilter(OrderingFilter):
+    ranked_orderings = (('distance', 'distance'), ('search_rank', '-search_rank'))
+
+    def get_ordering(self, request, queryset, view):
+        if not request.query_params.get(self.ordering_param):
+            for annotation, ordering in self.ranked_orderings:
+                if annotation in queryset.query.annotations:
+                    return [ordering]
+        return super().get_ordering(request, queryset, view)
@@ -1,6 +1,12 @@
+from decimal import Decimal
+
 from rest_framework import serializers
-from .models import Restaurant, MenuCategory, MenuItem, Order, OrderItem, User
+from .models import Restaurant, MenuCategory, MenuItem, Order, OrderItem, User, Courier
 from django.contrib.auth import authenticate
+from django.db import transaction
+from .analytics import record_order_items_added
+from .fieldsets import ShapedSerializerMixin
+from .images import image_urls
 from .models import User
 
 
@@ -41,27 +47,57 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ["id", "username", "email", "role"]
 
 
-class RestaurantSerializer(serializers.ModelSerializer):
+class RestaurantSerializer(ShapedSerializerMixin, serializers.ModelSerializer):
     owner = serializers.ReadOnlyField(source='owner.username')
+    # Only set on ?near= queries
+    distance_km = serializers.SerializerMethodField()
     
     class Meta:
         model = Restaurant
-        fields = ['id', 'name', 'address', 'phone', 'owner']
+        fields = ['id', 'name', 'address', 'phone', 'owner', 'latitude', 'longitude', 'distance_km']
+
+    def get_distance_km(self, obj):
+        return format_distance(getattr(obj, 'distance', None))
+
+    def validate(self, data):
+        return validate_coordinates(data, self.instance)
+
+
+def validate_coordinates(data, instance=None):
+    latitude = data.get('latitude', getattr(instance, 'latitude', None))
+    longitude = data.get('longitude', getattr(instance, 'longitude', None))
+    if (latitude is None) != (longitude is None):
+        raise serializers.ValidationError("Set both latitude and longitude, or neither.")
+    return data
+
+
+def format_distance(distance):
+    return None if distance is None else round(distance, 3)
 
 
-class MenuCategorySerializer(serializers.ModelSerializer):
+# updated_at reaches clients as ETag/Last-Modified (Api/conditional.py).
+# ?expand= (Api/fieldsets.py) renders `expandable_fields` as nested objects
+class MenuCategorySerializer(ShapedSerializerMixin, serializers.ModelSerializer):
+    expandable_fields = {'restaurant': RestaurantSerializer}
+
     class Meta:
         model = MenuCategory
-        fields = '__all__'
+        exclude = ['updated_at']
 
 
-class MenuItemSerializer(serializers.ModelSerializer):
+class MenuItemSerializer(ShapedSerializerMixin, serializers.ModelSerializer):
+    image_urls = serializers.SerializerMethodField()
+    expandable_fields = {'category': MenuCategorySerializer}
+
     class Meta:
         model = MenuItem
-        fields = '__all__'
+        exclude = ['image_derivatives', 'updated_at']
+
+    def get_image_urls(self, obj):
+        return image_urls(obj, self.context.get('request'))
     
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(ShapedSerializerMixin, serializers.ModelSerializer):
     menu_item = MenuItemSerializer(read_only=True)
 
     class Meta:
@@ -69,9 +105,83 @@ class OrderItemSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(ShapedSerializerMixin, serializers.ModelSerializer):
     order_items = OrderItemSerializer(many=True, read_only=True)
+    expandable_fields = {'restaurant': RestaurantSerializer}
+
     class Meta:
         model = Order
-        fields = '__all__'
+        exclude = ['updated_at']
+        # Only the dispatcher assigns couriers
+        read_only_fields = ['courier', 'assigned_at']
+
 
+# A courier's own location/availability feed
+class CourierSerializer(serializers.ModelSerializer):
+    active_order = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Courier
+        fields = ['id', 'latitude', 'longitude', 'is_available', 'last_seen', 'active_order']
+        read_only_fields = ['last_seen']
+
+    def validate(self, data):
+        return validate_coordinates(data, self.instance)
+
+    def get_active_order(self, obj):
+        return obj.deliveries.filter(status='OUT_FOR_DELIVERY').values_list('pk', flat=True).first()
+
+
+class CheckoutItemSerializer(serializers.Serializer):
+    menu_item = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1)
+
+
+# Whole basket in one payload; prices come from the menu, never the client
+class CheckoutSerializer(serializers.Serializer):
+    restaurant = serializers.PrimaryKeyRelatedField(queryset=Restaurant.objects.all())
+    items = CheckoutItemSerializer(many=True, allow_empty=False)
+
+    MAX_TOTAL = Decimal("999999.99")
+
+    def validate(self, data):
+        restaurant = data["restaurant"]
+        ids = {line["menu_item"] for line in data["items"]}
+
+        # One query for the whole basket, scoped to the chosen restaurant
+        menu_items = MenuItem.objects.filter(pk__in=ids, category__restaurant=restaurant).in_bulk()
+        missing = sorted(ids - menu_items.keys())
+        if missing:
+            raise serializers.ValidationError(
+                {"items": f"Menu items not available at this restaurant: {missing}"}
+            )
+
+        total = Decimal("0.00")
+        for line in data["items"]:
+            line["menu_item"] = menu_items[line["menu_item"]]
+            total += line["menu_item"].price * line["quantity"]
+        if total > self.MAX_TOTAL:
+            raise serializers.ValidationError({"items": "Order total is too large"})
+
+        data["total_price"] = total
+        return data
+
+    def create(self, validated_data):
+        with transaction.atomic():
+            order = Order.objects.create(
+                customer=validated_data["customer"],
+                restaurant=validated_data["restaurant"],
+                total_price=validated_data["total_price"],
+            )
+            items = OrderItem.objects.bulk_create([
+                OrderItem(
+                    order=order,
+                    menu_item=line["menu_item"],
+                    quantity=line["quantity"],
+                    price=line["menu_item"].price,
+                )
+                for line in validated_data["items"]
+            ])
+            # bulk_create sends no signals, so feed the sales rollups directly
+            record_order_items_added(order, items)
+        return order
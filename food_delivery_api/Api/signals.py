@@ -0,0 +1,107 @@
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import analytics
+from .authentication import CLAIM_FIELDS, get_user_cache
+from .images import queue_derivatives
+from .menu import invalidate_menu
+from .models import User, Restaurant, MenuCategory, MenuItem, Order, OrderItem
+
+
+@receiver([post_save, post_delete], sender=Restaurant)
+def restaurant_changed(sender, instance, **kwargs):
+    invalidate_menu(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=MenuCategory)
+def menu_category_changed(sender, instance, **kwargs):
+    invalidate_menu(instance.restaurant_id)
+
+
+@receiver([post_save, post_delete], sender=MenuItem)
+def menu_item_changed(sender, instance, **kwargs):
+    # An item moved to another restaurant's category leaves the old menu too
+    loaded = getattr(instance, '_loaded_values', None) or {}
+    category_ids = {instance.category_id, loaded.get('category_id', instance.category_id)}
+    if 'category_id' in loaded:
+        loaded['category_id'] = instance.category_id
+    if len(category_ids) == 1 and MenuItem.category.is_cached(instance):
+        restaurant_ids = {instance.category.restaurant_id}
+    else:
+        restaurant_ids = set(
+            MenuCategory.objects.filter(pk__in=category_ids).values_list('restaurant_id', flat=True)
+        )
+    for restaurant_id in restaurant_ids:
+        invalidate_menu(restaurant_id)
+
+
+@receiver(post_save, sender=MenuItem)
+def menu_item_saved(sender, instance, raw=False, **kwargs):
+    # New or replaced photos get their resized copies rendered after commit
+    if not raw:
+        queue_derivatives(instance)
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created=False, update_fields=None, **kwargs):
+    # New users have no tokens yet, and e.g. last_login updates don't affect
+    # the claims in issued tokens
+    if created:
+        return
+    if update_fields is not None and not set(update_fields) & {*CLAIM_FIELDS, 'is_active', 'password'}:
+        return
+    get_user_cache().invalidate(str(instance.pk))
+    if update_fields is None or 'username' in update_fields:
+        # Restaurants and their menus show the owner's username; update()
+        # sends no signals, so the menus are dropped here
+        restaurant_ids = list(Restaurant.objects.filter(owner=instance).values_list('pk', flat=True))
+        if restaurant_ids:
+            Restaurant.objects.filter(pk__in=restaurant_ids).update(updated_at=timezone.now())
+        for restaurant_id in restaurant_ids:
+            invalidate_menu(restaurant_id)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    get_user_cache().invalidate(str(instance.pk))
+
+
+def deleted_via(origin, model):
+    if isinstance(origin, QuerySet):
+        return origin.model is model
+    return isinstance(origin, model)
+
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, created=False, raw=False, **kwargs):
+    if not raw:
+        analytics.record_order_saved(instance, created)
+
+
+@receiver(pre_delete, sender=Order)
+def order_deleted(sender, instance, origin=None, **kwargs):
+    # A deleted restaurant takes its rollups with it
+    if not deleted_via(origin, Restaurant):
+        analytics.record_order_deleted(instance)
+
+
+def touch_order(order_id):
+    # Orders embed their items, so an item change is a new order version
+    Order.objects.filter(pk=order_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=OrderItem)
+def order_item_saved(sender, instance, created=False, raw=False, **kwargs):
+    if not raw:
+        analytics.record_order_item_saved(instance, created)
+        touch_order(instance.order_id)
+
+
+@receiver(post_delete, sender=OrderItem)
+def order_item_deleted(sender, instance, origin=None, **kwargs):
+    # Items removed along with their order are handled by order_deleted
+    if deleted_via(origin, OrderItem):
+        analytics.record_order_item_deleted(instance)
+        touch_order(instance.order_id)
@@ -1,3 +1,2328 @@
-from django.test import TestCase
+import asyncio
+import hmac
+import json
+import shutil
+import tempfile
+import uuid
+from base64 import urlsafe_b64encode
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.contrib.auth.models import AnonymousUser
+from django.db import OperationalError, connections
+from django.db.models import QuerySet
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.permissions import BasePermission
+from rest_framework.test import APIRequestFactory, APITestCase, force_authenticate
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import async_views, views
+from .archive import TieredQuerySet, archive_orders
+from .authentication import RoleRefreshToken, UserCache, reset_user_cache
+from .benchmarks import SCENARIOS, SKIPPED_ROUTES, compare_to_baseline, iter_routes, run_archive_benchmark, run_benchmarks
+from .bulk import iter_json_rows
+from .dispatch import assign, dispatch_batch, simulate
+from .instrumentation import InstrumentationMiddleware, current_metrics, get_registry, reset_registry
+from .geo import KM_PER_DEGREE, encode_geohash
+from .idempotency import prune_expired_keys
+from .images import get_executor, render_derivatives, reset_executor, schedule_derivatives
+from .loadtest import call_asgi, call_wsgi, scenario_requests
+from .pagination import KeysetPagination
+from .renderers import FastJSONRenderer
+from .throttling import CacheBackend, MemoryBackend, parse_rate, reset_backend
+from .replicas import ReplicaPool, ReplicaRouter, ReplicaRoutingMiddleware, get_pool, primary_reads, reset_pool
+from .blacklist import RevocationList, get_revocation_list, reset_revocation_list
+from .events import BaseBroker, InProcessBroker, get_broker, reset_broker, user_channel
+from .models import (
+    User, Restaurant, MenuCategory, MenuItem, Order, OrderItem, Courier, IdempotencyKey, DailyOrderRollup,
+    DailyMenuItemRollup, ArchivedOrder, ArchivedOrderItem,
+)
+
+
+class QueryBudgetMixin:
+    # Reusable guard: fails the test when the block runs more queries than budgeted
+    @contextmanager
+    def assertQueryBudget(self, budget, using='default'):
+        with CaptureQueriesContext(connections[using]) as ctx:
+            yield ctx
+        executed = len(ctx.captured_queries)
+        if executed > budget:
+            queries = "\n".join(
+                f"{i}. {q['sql']}" for i, q in enumerate(ctx.captured_queries, start=1)
+            )
+            self.fail(f"{executed} queries executed, budget was {budget}:\n{queries}")
+
+
+class ApiTestData:
+    @staticmethod
+    def create_user(username, role):
+        return User.objects.create_user(
+            username=username, email=f"{username}@example.com", password="pass1234", role=role
+        )
+
+    @classmethod
+    def create_menu(cls, owner, items=5, name="Mama's Kitchen"):
+        restaurant = Restaurant.objects.create(owner=owner, name=name, address="1 Main St", phone="0200000000")
+        category = MenuCategory.objects.create(restaurant=restaurant, name="Mains")
+        menu_items = [
+            MenuItem.objects.create(category=category, name=f"Dish {i}", price=Decimal("10.00") + i)
+            for i in range(items)
+        ]
+        return restaurant, category, menu_items
+
+    @staticmethod
+    def create_order(customer, restaurant, menu_items):
+        order = Order.objects.create(
+            customer=customer, restaurant=restaurant, total_price=Decimal("0.00")
+        )
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, menu_item=item, quantity=1, price=item.price)
+            for item in menu_items
+        )
+        return order
+
+
+class QueryBudgetTests(QueryBudgetMixin, ApiTestData, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = cls.create_user("owner", "restaurant_owner")
+        cls.customer = cls.create_user("customer", "customer")
+        cls.restaurant, cls.category, cls.menu_items = cls.create_menu(cls.owner)
+
+    def setUp(self):
+        self.client.force_authenticate(self.customer)
+
+    def test_order_list_query_count_is_independent_of_page_size(self):
+        self.create_order(self.customer, self.restaurant, self.menu_items)
+        with self.assertQueryBudget(2) as single:
+            response = self.client.get("/api/orders/")
+        self.assertEqual(response.status_code, 200)
+
+        for _ in range(9):
+            self.create_order(self.customer, self.restaurant, self.menu_items)
+        with self.assertQueryBudget(2) as full:
+            response = self.client.get("/api/orders/")
+        self.assertEqual(len(response.data["results"]), 10)
+        self.assertEqual(len(response.data["results"][0]["order_items"]), 5)
+        self.assertEqual(len(single.captured_queries), len(full.captured_queries))
+
+    def test_order_detail_within_budget(self):
+        order = self.create_order(self.customer, self.restaurant, self.menu_items)
+        with self.assertQueryBudget(2):
+            response = self.client.get(f"/api/orders/{order.pk}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["order_items"][0]["menu_item"]["name"], "Dish 0")
+
+    def test_order_item_list_within_budget(self):
+        for _ in range(3):
+            self.create_order(self.customer, self.restaurant, self.menu_items)
+        with self.assertQueryBudget(2):
+            response = self.client.get("/api/order-items/")
+        self.assertEqual(len(response.data["results"]), 10)
+
+    def test_restaurant_list_within_budget(self):
+        for i in range(5):
+            owner = self.create_user(f"owner{i}", "restaurant_owner")
+            self.create_menu(owner, items=0, name=f"Restaurant {i}")
+        with self.assertQueryBudget(2):
+            response = self.client.get("/api/restaurants/")
+        self.assertEqual(response.data["results"][0]["owner"], "owner")
+
+
+class CheckoutTests(QueryBudgetMixin, ApiTestData, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = cls.create_user("owner", "restaurant_owner")
+        cls.customer = cls.create_user("customer", "customer")
+        cls.restaurant, cls.category, cls.menu_items = cls.create_menu(cls.owner)
+
+    def setUp(self):
+        self.client.force_authenticate(self.customer)
+
+    def test_checkout_prices_basket_on_server(self):
+        payload = {
+            "restaurant": self.restaurant.pk,
+            "total_price": "0.01",
+            "items": [
+                {"menu_item": self.menu_items[0].pk, "quantity": 2},
+                {"menu_item": self.menu_items[3].pk, "quantity": 1},
+            ],
+        }
+        with self.assertQueryBudget(10):
+            response = self.client.post("/api/checkout/", payload, format="json")
+        self.assertEqual(response.status_code, 201)
+
+        order = Order.objects.get(pk=response.data["data"]["id"])
+        self.assertEqual(order.customer, self.customer)
+        self.assertEqual(order.total_price, Decimal("33.00"))
+        self.assertEqual(
+            sorted(order.order_items.values_list("price", "quantity")),
+            [(Decimal("10.00"), 2), (Decimal("13.00"), 1)],
+        )
+
+    def test_checkout_query_count_is_independent_of_basket_size(self):
+        def checkout(items):
+            payload = {
+                "restaurant": self.restaurant.pk,
+                "items": [{"menu_item": item.pk, "quantity": 1} for item in items],
+            }
+            with self.assertQueryBudget(10) as ctx:
+                self.client.post("/api/checkout/", payload, format="json")
+            return len(ctx.captured_queries)
+
+        self.assertEqual(checkout(self.menu_items[:1]), checkout(self.menu_items))
+
+    def test_checkout_rejects_items_from_another_restaurant(self):
+        other_owner = self.create_user("other", "restaurant_owner")
+        _, _, other_items = self.create_menu(other_owner, items=1, name="Elsewhere")
+        payload = {
+            "restaurant": self.restaurant.pk,
+            "items": [
+                {"menu_item": self.menu_items[0].pk, "quantity": 1},
+                {"menu_item": other_items[0].pk, "quantity": 1},
+            ],
+        }
+        response = self.client.post("/api/checkout/", payload, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_checkout_requires_customer(self):
+        self.client.force_authenticate(self.owner)
+        payload = {"restaurant": self.restaurant.pk, "items": [{"menu_item": self.menu_items[0].pk, "quantity": 1}]}
+        response = self.client.post("/api/checkout/", payload, format="json")
+        self.assertEqual(response.status_code, 403)
+
+
+class RestaurantMenuTests(QueryBudgetMixin, ApiTestData, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = cls.create_user("owner", "restaurant_owner")
+        cls.restaurant, cls.category, cls.menu_items = cls.create_menu(cls.owner, items=3)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.owner)
+        self.url = f"/api/restaurants/{self.restaurant.pk}/menu/"
+
+    def test_menu_document_shape(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["name"], "Mama's Kitchen")
+        self.assertEqual(response.data["owner"], "owner")
+        [category] = response.data["categories"]
+        self.assertEqual([item["name"] for item in category["items"]], ["Dish 0", "Dish 1", "Dish 2"])
+        self.assertEqual(category["items"][0]["price"], "10.00")
+        self.assertEqual(response["ETag"], f'"{response.data["version"]}"')
+
+    def test_cached_menu_and_not_modified_skip_the_database(self):
+        etag = self.client.get(self.url)["ETag"]
+        with self.assertQueryBudget(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        with self.assertQueryBudget(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_menu_item_change_invalidates_snapshot(self):
+        etag = self.client.get(self.url)["ETag"]
+        item = self.menu_items[0]
+        item.price = Decimal("99.00")
+        with self.captureOnCommitCallbacks(execute=True):
+            item.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.data["categories"][0]["items"][0]["price"], "99.00")
+
+    def test_snapshot_built_before_a_change_commits_is_not_served(self):
+        from .menu import build_menu_document
+
+        def racing_build(restaurant_id):
+            # The writer commits and invalidates while this reader still holds the old rows
+            document = build_menu_document(restaurant_id)
+            item = MenuItem.objects.get(pk=self.menu_items[0].pk)
+            item.price = Decimal("99.00")
+            with self.captureOnCommitCallbacks(execute=True):
+                item.save()
+            return document
+
+        with mock.patch("Api.menu.build_menu_document", racing_build):
+            self.assertEqual(self.client.get(self.url).data["categories"][0]["items"][0]["price"], "10.00")
+        response = self.client.get(self.url)
+        self.assertEqual(response.data["categories"][0]["items"][0]["price"], "99.00")
+
+    def test_moving_an_item_invalidates_both_restaurants(self):
+        other, other_category, _ = self.create_menu(self.owner, items=0, name="Other Place")
+        other_url = f"/api/restaurants/{other.pk}/menu/"
+        self.client.get(self.url)
+        self.client.get(other_url)
+        item = MenuItem.objects.get(pk=self.menu_items[0].pk)
+        item.category = other_category
+        with self.captureOnCommitCallbacks(execute=True):
+            item.save()
+
+        [category] = self.client.get(self.url).data["categories"]
+        self.assertEqual([entry["name"] for entry in category["items"]], ["Dish 1", "Dish 2"])
+        [category] = self.client.get(other_url).data["categories"]
+        self.assertEqual([entry["name"] for entry in category["items"]], ["Dish 0"])
+
+    def test_owner_rename_invalidates_their_menus(self):
+        self.client.get(self.url)
+        owner = User.objects.get(pk=self.owner.pk)
+        owner.username = "renamed"
+        with self.captureOnCommitCallbacks(execute=True):
+            owner.save()
+        self.assertEqual(self.client.get(self.url).data["owner"], "renamed")
+
+    def test_unknown_restaurant(self):
+        response = self.client.get("/api/restaurants/999/menu/")
+        self.assertEqual(response.status_code, 404)
+
+
+class KeysetPaginationTests(QueryBudgetMixin, ApiTestData, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = cls.create_user("owner", "restaurant_owner")
+        cls.restaurant, cls.category, _ = cls.create_menu(cls.owner, items=0)
+        # 25 items over 5 distinct prices, so every page boundary has ties
+        MenuItem.objects.bulk_create(
+            MenuItem(category=cls.category, name=f"Item {i:02d}", price=Decimal(10 + i % 5))
+            for i in range(25)
+        )
+
+    def setUp(self):
+        reset_backend()
+        self.client.force_authenticate(self.owner)
+
+    def walk(self, url):
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(item["id"] for item in response.data["results"])
+            url = response.data["next"]
+        return seen
+
+    def test_pages_follow_ordering_without_duplicates(self):
+        seen = self.walk("/api/menu-items/?ordering=-price")
+        expected = list(MenuItem.objects.order_by("-price", "-pk").values_list("pk", flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_no_count_query(self):
+        with self.assertQueryBudget(1) as ctx:
+            self.client.get("/api/menu-items/?ordering=price")
+        self.assertNotIn("COUNT", ctx.captured_queries[0]["sql"].upper())
+
+    def test_previous_link_returns_prior_page(self):
+        first = self.client.get("/api/menu-items/?ordering=price")
+        second = self.client.get(first.data["next"])
+        back = self.client.get(second.data["previous"])
+        self.assertEqual(back.data["results"], first.data["results"])
+        self.assertIsNone(first.data["previous"])
+
+    def test_inserts_do_not_shift_following_pages(self):
+        first = self.client.get("/api/menu-items/?ordering=name")
+        MenuItem.objects.create(category=self.category, name="Aaa new", price=Decimal("1.00"))
+        second = self.client.get(first.data["next"])
+        self.assertEqual(second.data["results"][0]["name"], "Item 10")
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/api/menu-items/?cursor=not-a-cursor")
+        self.assertEqual(response.status_code, 404)
+
+    def test_cursors_keep_microseconds_and_ties(self):
+        customer = self.create_user("customer", "customer")
+        orders = [self.create_order(customer, self.restaurant, []) for _ in range(25)]
+        base = timezone.now().replace(microsecond=0)
+        # Several rows per millisecond, and runs of identical timestamps across each page boundary
+        for i, order in enumerate(orders):
+            Order.objects.filter(pk=order.pk).update(created_at=base + timedelta(microseconds=100 * (i // 3)))
+        self.client.force_authenticate(customer)
+        for query, ordering in [("", ["created_at", "pk"]), ("?ordering=-created_at", ["-created_at", "-pk"])]:
+            with self.subTest(query=query):
+                expected = list(Order.objects.order_by(*ordering).values_list("pk", flat=True))
+                self.assertEqual(self.walk(f"/api/orders/{query}"), expected)
+        ArchivedOrder.objects.bulk_create(
+            ArchivedOrder(
+                id=10_000 + i, customer=customer, restaurant=self.restaurant, created_at=base,
+                total_price=Decimal("1.00"), status="DELIVERED", updated_at=base,
+            )
+            for i in range(15)
+        )
+        seen = self.walk("/api/orders/?history=1")
+        self.assertEqual(len(seen), 40)
+        self.assertEqual(len(set(seen)), 40)
+
+    def test_tampered_cursor_values_are_404s(self):
+        def cursor(values):
+            return urlsafe_b64encode(json.dumps({"v": values}).encode()).decode()
+
+        self.client.force_authenticate(self.create_user("customer", "customer"))
+        for url, values in [
+            ("/api/orders/", ["abc", 1]),
+            ("/api/orders/", [{"a": 1}, 1]),
+            ("/api/orders/", [None, 1]),
+            ("/api/orders/?ordering=total_price", ["xyz", 1]),
+            ("/api/menu-items/?ordering=price", ["10.00", "one"]),
+        ]:
+            with self.subTest(url=url, values=values):
+                response = self.client.get(url, {"cursor": cursor(values)})
+                self.assertEqual(response.status_code, 404)
+
+    def test_page_numbers_are_admin_only(self):
+        response = self.client.get("/api/menu-items/?page=2")
+        self.assertIn("next", response.data)
+        self.assertNotIn("count", response.data)
+
+        self.client.force_authenticate(self.create_user("admin", "admin"))
+        response = self.client.get("/api/menu-items/?page=2")
+        self.assertEqual(response.data["count"], 25)
+        self.assertEqual(response.data["results"][0]["name"], "Item 10")
+
+
+class FullTextSearchTests(ApiTestData, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = cls.create_user("owner", "restaurant_owner")
+        cls.restaurant, cls.category, _ = cls.create_menu(cls.owner, items=0)
+        cls.jollof = MenuItem.objects.create(
+            category=cls.category, name="Jollof Rice", description="Smoky party rice", price=Decimal("12.00")
+        )
+        cls.waakye = MenuItem.objects.create(
+            category=cls.category, name="Waakye", description="Rice and beans", price=Decimal("9.00")
+        )
+        MenuItem.objects.create(category=cls.category, name="Kelewele", description="Spicy plantain", price=Decimal("5.00"))
+
+    def setUp(self):
+        self.client.force_authenticate(self.owner)
+
+    def search(self, term, url="/api/menu-items/"):
+        response = self.client.get(url, {"search": term})
+        self.assertEqual(response.status_code, 200)
+        return [row["name"] for row in response.data["results"]]
+
+    def test_ranks_name_matches_above_description_matches(self):
+        self.assertEqual(self.search("rice"), ["Jollof Rice", "Waakye"])
+
+    def test_prefix_matching_for_type_ahead(self):
+        self.assertEqual(self.search("jol"), ["Jollof Rice"])
+        self.assertEqual(self.search("spi plan"), ["Kelewele"])
+
+    def test_explicit_ordering_overrides_rank(self):
+        response = self.client.get("/api/menu-items/", {"search": "rice", "ordering": "price"})
+        self.assertEqual([row["name"] for row in response.data["results"]], ["Waakye", "Jollof Rice"])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.jollof.name = "Fried Rice"
+        self.jollof.save()
+        self.waakye.delete()
+        self.assertEqual(self.search("jollof"), [])
+        self.assertEqual(self.search("fried"), ["Fried Rice"])
+        self.assertEqual(self.search("beans"), [])
+
+    def test_paging_through_ranked_results(self):
+        MenuItem.objects.bulk_create(
+            MenuItem(category=self.category, name=f"Rice bowl {i}", description="rice " * (i % 3), price=Decimal("7.00"))
+            for i in range(15)
+        )
+        response = self.client.get("/api/menu-items/", {"search": "rice"})
+        names = [row["name"] for row in response.data["results"]]
+        names += [row["name"] for row in self.client.get(response.data["next"]).data["results"]]
+        self.assertEqual(len(names), 17)
+        self.assertEqual(len(set(names)), 17)
+
+    def test_search_syntax_is_not_interpreted(self):
+        self.assertEqual(self.search('rice" OR "x'), [])
+
+    def test_restaurant_search_on_address(self):
+        self.assertEqual(self.search("main", url="/api/restaurants/"), ["Mama's Kitchen"])
+
+
+class RecordingBroker(BaseBroker):
+    def __init__(self):
+        self.published = []
+
+    def publish(self, channel, event):
+        self.published.append((channel, event))
+
+
+class OrderEventTests(ApiTestData, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = cls.create_user("owner", "restaurant_owner")
+        cls.customer = cls.create_user("customer", "customer")
+        cls.restaurant, _, cls.menu_items = cls.create_menu(cls.owner, items=1)
+        cls.order = cls.create_order(cls.customer, cls.restaurant, cls.menu_items)
+
+    def setUp(self):
+        reset_broker()
+        self.addCleanup(reset_broker)
+
+    @override_settings(ORDER_EVENTS_BROKER="Api.tests.RecordingBroker")
+    def test_status_change_is_published_to_customer_and_owner(self):
+        self.client.force_authenticate(self.customer)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f"/api/orders/{self.order.pk}/", {"status": "CANCELLED"}, format="json")
+        self.assertEqual(response.status_code, 200)
+
+        published = get_broker().published
+        self.assertEqual(
+            sorted(channel for channel, _ in published),
+            sorted([user_channel(self.customer.pk), user_channel(self.owner.pk)]),
+        )
+        self.assertEqual(published[0][1]["status"], "CANCELLED")
+        self.assertEqual(published[0][1]["previous_status"], "PENDING")
+
+    @override_settings(ORDER_EVENTS_BROKER="Api.tests.RecordingBroker")
+    def test_unchanged_status_is_not_published(self):
+        self.client.force_authenticate(self.customer)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f"/api/orders/{self.order.pk}/", {"total_price": "1.00"}, format="json")
+        self.assertEqual(get_broker().published, [])
+
+    def test_in_process_broker_delivers_across_threads(self):
+        async def scenario():
+            broker = InProcessBroker()
+            subscription = broker.subscribe("user:1")
+            publisher = threading.Thread(target=broker.publish, args=("user:1", {"order": 1}))
+            publisher.start()
+            event = await subscription.get(timeout=1)
+            publisher.join()
+            subscription.close()
+            return event, broker._subscriptions
+
+        event, subscriptions = asyncio.run(scenario())
+        self.assertEqual(event, {"order": 1})
+        self.assertEqual(dict(subscriptions), {})
+
+    def test_stream_needs_asgi(self):
+        self.client.force_authenticate(self.customer)
+        response = self.client.get("/api/orders/stream/")
+        self.assertEqual(response.status_code, 501)
+        self.assertFalse(response.streaming)
+
+    async def test_stream_rejects_order_values_that_are_not_ids(self):
+        token = str(AccessToken.for_user(self.customer))
+        for order in ("abc", "\u00b2", "0", "99999999999999999999999"):
+            with self.subTest(order=order):
+                response = await AsyncClient().get(
+                    "/api/orders/stream/", {"order": order}, headers={"Authorization": f"Bearer {token}"}
+                )
+                self.assertEqual(response.status_code, 400)
+
+    async def test_stream_pushes_status_changes(self):
+        token = str(AccessToken.for_user(self.customer))
+        response = await AsyncClient().get(
+            "/api/orders/stream/", {"order": self.order.pk}, headers={"Authorization": f"Bearer {token}"}
+        )
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b": connected\n\n")
+
+        channel = user_channel(self.customer.pk)
+        get_broker().publish(channel, {"type": "order.status", "order": 0})
+        get_broker().publish(channel, {"type": "order.status", "order": self.order.pk, "status": "CONFIRMED"})
+        chunk = (await asyncio.wait_for(anext(stream), 1)).decode()
+        await stream.aclose()
+
+        self.assertTrue(chunk.startswith("event: order.status\n"))
+        self.assertEqual(json.loads(chunk.split("data: ")[1])["status"], "CONFIRMED")
+
+
+class ClaimsAuthenticationTests(QueryBudgetMixin, ApiTestData, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = cls.create_user("owner", "restaurant_owner")
+        cls.restaurant, _, _ = cls.create_menu(cls.owner, items=1)
+
+    def setUp(self):
+        cache.clear()
+        reset_user_cache()
+        self.addCleanup(reset_user_cache)
+
+    def login(self, username="owner"):
+        response = self.client.post("/api/auth/login/", {"username": username, "password": "pass1234"})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_authenticated_request_does_not_load_user(self):
+        access = self.login()["access"]
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        url = f"/api/restaurants/{self.restaurant.pk}/menu/"
+        self.client.get(url)
+        with self.assertQueryBudget(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_writes_use_the_claims_user(self):
+        access = self.login()["access"]
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        response = self.client.post("/api/restaurants/", {"name": "Second", "address": "2 Main St", "phone": "1"})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Restaurant.objects.get(name="Second").owner, self.owner)
+
+    def test_role_change_invalidates_embedded_claims(self):
+        tokens = self.login()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        self.owner.role = "customer"
+        self.owner.save()
+
+        response = self.client.post("/api/restaurants/", {"name": "Nope", "address": "x", "phone": "1"})
+        self.assertEqual(response.status_code, 403)
+
+        refreshed = self.client.post("/api/auth/token/refresh/", {"refresh": tokens["refresh"]})
+        self.assertEqual(AccessToken(refreshed.data["access"])["role"], "customer")
+
+    def test_changes_reach_workers_that_did_not_save_them(self):
+        access = self.login()["access"]
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        url = f"/api/restaurants/{self.restaurant.pk}/menu/"
+        self.assertEqual(self.client.get(url).status_code, 200)
+        # Another worker cached the user before the change
+        other_worker = UserCache(shared=cache)
+        other_worker.set(str(self.owner.pk), User.objects.get(pk=self.owner.pk))
+
+        self.owner.role = "customer"
+        self.owner.save()
+        reset_user_cache()  # this worker's memory is gone; only the shared stamp remains
+        self.assertTrue(other_worker.changed_since(str(self.owner.pk), AccessToken(access)["iat"]))
+        self.assertIsNone(other_worker.get(str(self.owner.pk), fresh_after=other_worker.changed_at(str(self.owner.pk))))
+        response = self.client.post("/api/restaurants/", {"name": "Nope", "address": "x", "phone": "1"})
+        self.assertEqual(response.status_code, 403)
+
+        self.owner.is_active = False
+        self.owner.save(update_fields=["is_active"])
+        reset_user_cache()
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+    def test_tokens_without_claims_use_the_user_cache(self):
+        access = AccessToken.for_user(self.owner)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        url = f"/api/restaurants/{self.restaurant.pk}/menu/"
+        self.client.get(url)
+        with self.assertQueryBudget(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_user_cache_is_bounded_lru_with_ttl(self):
+        user_cache = UserCache(max_size=2, ttl=60)
+        user_cache.set("1", self.owner)
+        user_cache.set("2", self.owner)
+        user_cache.get("1")
+        user_cache.set("3", self.owner)
+        self.assertIsNone(user_cache.get("2"))
+        self.assertIsNotNone(user_cache.get("1"))
+
+        expired = UserCache(ttl=-1)
+        expired.set("1", self.owner)
+        self.assertIsNone(expired.get("1"))
+
+
+@override_settings(TOKEN_BLACKLIST={"SYNC_INTERVAL": 60, "PRUNE_INTERVAL": 0})
+class TokenBlacklistTests(QueryBudgetMixin, ApiTestData, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = cls.create_user("customer", "customer")
+
+    def setUp(self):
+        cache.clear()
+        reset_revocation_list()
+        self.addCleanup(reset_revocation_list)
+
+    def test_logged_out_token_cannot_refresh(self):
+        refresh = RoleRefreshToken.for_user(self.customer)
+        self.client.force_authenticate(self.customer)
+        response = self.client.post("/api/auth/logout/", {"refresh": str(refresh)})
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.post("/api/auth/token/refresh/", {"refresh": str(refresh)})
+        self.assertEqual(response.status_code, 401)
+
+    def test_membership_is_answered_from_memory(self):
+        revoked = RoleRefreshToken.for_user(self.customer)
+        revoked.blacklist()
+        reset_revocation_list()
+        valid = RoleRefreshToken.for_user(self.customer)
+
+        # One sync loads the blacklist, after which checks are free
+        with self.assertQueryBudget(1):
+            self.assertTrue(get_revocation_list().is_revoked(revoked["jti"]))
+        with self.assertQueryBudget(0):
+            self.assertFalse(get_revocation_list().is_revoked(valid["jti"]))
+            self.assertTrue(get_revocation_list().is_revoked(revoked["jti"]))
+
+    def test_revocations_from_other_processes_are_synced(self):
+        revocations = RevocationList(sync_interval=0)
+        self.assertFalse(revocations.is_revoked("abc"))
+        token = RoleRefreshToken.for_user(self.customer)
+        token.blacklist()
+        self.assertTrue(revocations.is_revoked(token["jti"]))
+
+    def test_revocations_reach_other_workers_before_their_sync(self):
+        other_worker = RevocationList(sync_interval=60, shared=cache)
+        refresh = RoleRefreshToken.for_user(self.customer)
+        self.assertFalse(other_worker.is_revoked(refresh["jti"]))
+
+        self.client.force_authenticate(self.customer)
+        self.assertEqual(self.client.post("/api/auth/logout/", {"refresh": str(refresh)}).status_code, 200)
+        with self.assertQueryBudget(0):
+            self.assertTrue(other_worker.is_revoked(refresh["jti"]))
+
+    def test_prune_removes_only_expired_tokens(self):
+        live = RoleRefreshToken.for_user(self.customer)
+        live.blacklist()
+        expired = RoleRefreshToken.for_user(self.customer)
+        expired.blacklist()
+        OutstandingToken.objects.filter(jti=expired["jti"]).update(expires_at=timezone.now() - timedelta(days=1))
+
+        call_command("prune_token_blacklist", batch_size=1, stdout=StringIO())
+        self.assertEqual(list(OutstandingToken.objects.values_list("jti", flat=True)), [live["jti"]])
+        self.assertEqual(BlacklistedToken.objects.count(), 1)
+
+
+class SalesRollupTests(QueryBudgetMixin, ApiTestData, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = cls.create_user("owner", "restaurant_owner")
+        cls.customer = cls.create_user("customer", "customer")
+        cls.restaurant, _, cls.menu_items = cls.create_menu(cls.owner, items=3)
+
+    def checkout(self, *lines):
+        self.client.force_authenticate(self.customer)
+        payload = {
+            "restaurant": self.restaurant.pk,
+            "items": [{"menu_item": self.menu_items[i].pk, "quantity": qty} for i, qty in lines],
+        }
+        response = self.client.post("/api/checkout/", payload, format="json")
+        self.assertEqual(response.status_code, 201)
+        return Order.objects.get(pk=response.data["data"]["id"])
+
+    def analytics(self, name):
+        self.client.force_authenticate(self.owner)
+        response = self.client.get(f"/api/restaurants/{self.restaurant.pk}/analytics/{name}/")
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_rollups_follow_orders_and_status_changes(self):
+        self.checkout((0, 2), (1, 1))
+        cancelled = self.checkout((0, 1))
+        self.client.force_authenticate(self.customer)
+        self.client.patch(f"/api/orders/{cancelled.pk}/", {"status": "CANCELLED"}, format="json")
+
+        [today] = self.analytics("revenue")["days"]
+        self.assertEqual(today["orders"], 2)
+        self.assertEqual(today["revenue"], "31.00")
+        counts = self.analytics("status")["counts"]
+        self.assertEqual((counts["PENDING"], counts["CANCELLED"]), (1, 1))
+        items = self.analytics("top-items")["items"]
+        self.assertEqual([(row["name"], row["quantity"]) for row in items], [("Dish 0", 2), ("Dish 1", 1)])
+
+    def test_incremental_rollups_match_a_rebuild(self):
+        first = self.checkout((0, 2), (1, 1), (2, 4))
+        self.checkout((1, 3))
+        first.status = "CANCELLED"
+        first.save()
+        self.checkout((2, 1)).delete()
+
+        def snapshot():
+            return (
+                sorted(DailyOrderRollup.objects.filter(order_count__gt=0).values_list("status", "order_count", "revenue")),
+                sorted(DailyMenuItemRollup.objects.filter(quantity__gt=0).values_list("menu_item_id", "quantity", "revenue")),
+            )
+
+        incremental = snapshot()
+        call_command("rebuild_sales_rollups", stdout=StringIO())
+        self.assertEqual(snapshot(), incremental)
+
+    def test_order_writes_lock_the_row_their_deltas_come_from(self):
+        order = self.checkout((0, 1))
+        self.client.force_authenticate(self.customer)
+        with mock.patch("Api.conditional.lock_for_write", side_effect=lambda queryset: queryset) as lock:
+            response = self.client.patch(f"/api/orders/{order.pk}/", {"status": "CANCELLED"}, format="json")
+        self.assertEqual(response.status_code, 200)
+        lock.assert_called_once()
+        counts = self.analytics("status")["counts"]
+        self.assertEqual((counts["PENDING"], counts["CANCELLED"]), (0, 1))
+
+    def test_dashboards_read_only_rollups(self):
+        self.checkout((0, 1))
+        self.client.force_authenticate(self.owner)
+        # restaurant ownership check + one rollup query
+        with self.assertQueryBudget(2):
+            self.client.get(f"/api/restaurants/{self.restaurant.pk}/analytics/revenue/")
+
+    def test_bad_date_ranges_are_400s(self):
+        self.client.force_authenticate(self.owner)
+        for params in [
+            {"from": "2024-13-45"},
+            {"to": "2024-02-30"},
+            {"from": "yesterday"},
+            {"from": "2024-03-02", "to": "2024-03-01"},
+            {"from": "2020-01-01", "to": "2024-01-01"},
+        ]:
+            for name in ("revenue", "status", "top-items"):
+                with self.subTest(params=params, name=name):
+                    response = self.client.get(f"/api/restaurants/{self.restaurant.pk}/analytics/{name}/", params)
+                    self.assertEqual(response.status_code, 400)
+        response = self.client.get(
+            f"/api/restaurants/{self.restaurant.pk}/analytics/revenue/", {"from": "2024-01-01", "to": "2024-12-31"}
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_other_owners_are_refused(self):
+        self.client.force_authenticate(self.create_user("rival", "restaurant_owner"))
+        response = self.client.get(f"/api/restaurants/{self.restaurant.pk}/analytics/revenue/")
+        self.assertEqual(response.status_code, 403)
+
+    def test_created_at_is_not_touched_by_updates(self):
+        order = self.checkout((0, 1))
+        placed = order.created_at
+        order.status = "CONFIRMED"
+        order.save()
+        order.refresh_from_db()
+        self.assertEqual(order.created_at, placed)
+
+
+class BulkMenuTests(QueryBudgetMixin, ApiTestData, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = cls.create_user("owner", "restaurant_owner")
+        cls.customer = cls.create_user("customer", "customer")
+        cls.restaurant, cls.category, cls.menu_items = cls.create_menu(cls.owner, items=2)
+
+    def setUp(self):
+        self.client.force_authenticate(self.owner)
+
+    def upload(self, name, content, **extra):
+        return self.client.post(
+            f"/api/restaurants/{self.restaurant.pk}/menu/import/",
+            {"file": SimpleUploadedFile(name, content.encode()), **extra},
+            format="multipart",
+        )
+
+    def test_csv_import_creates_updates_and_reports_bad_rows(self):
+        content = (
+            "id,category,name,description,price\n"
+            f"{self.menu_items[0].pk},Mains,Dish 0,Now spicier,12.50\n"
+            ",Mains,Jollof,,8.00\n"
+            ",Mains,Waakye,,not-a-price\n"
+            ",Drinks,Sobolo,,3.00\n"
+        )
+        response = self.upload("menu.csv", content)
+        self.assertEqual(response.status_code, 200)
+        data = response.data["data"]
+        self.assertEqual((data["created"], data["updated"], data["error_count"]), (1, 1, 2))
+        self.assertEqual([error["row"] for error in data["errors"]], [3, 4])
+
+        self.menu_items[0].refresh_from_db()
+        self.assertEqual((self.menu_items[0].description, self.menu_items[0].price), ("Now spicier", Decimal("12.50")))
+        self.assertTrue(MenuItem.objects.filter(category=self.category, name="Jollof").exists())
+
+    def test_json_lines_import_can_create_categories_in_few_queries(self):
+        lines = [json.dumps({"category": "Drinks", "name": f"Drink {i}", "price": "2.00"}) for i in range(50)]
+        # validation, category lookup + create, item lookup + insert, savepoints
+        with self.assertQueryBudget(10):
+            response = self.upload("menu.jsonl", "\n".join(lines), create_categories="true")
+        self.assertEqual(response.data["data"]["created"], 50)
+        self.assertEqual(MenuItem.objects.filter(category__name="Drinks").count(), 50)
+
+    def test_category_references_by_id_or_name(self):
+        numbered = MenuCategory.objects.create(restaurant=self.restaurant, name="2024")
+        content = (
+            "category,name,price\n"
+            f"{self.category.pk},By id,1.00\n"
+            "2024,Named with digits,2.00\n"
+            "\u00b2,Superscript,3.00\n"
+            "99999999999999999999999,Too big,4.00\n"
+            "Mains,By name,5.00\n"
+        )
+        response = self.upload("menu.csv", content)
+        self.assertEqual(response.status_code, 200)
+        data = response.data["data"]
+        self.assertEqual((data["created"], data["error_count"]), (3, 2))
+        self.assertEqual([error["row"] for error in data["errors"]], [3, 4])
+        self.assertEqual(MenuItem.objects.get(name="Named with digits").category, numbered)
+        self.assertEqual(MenuItem.objects.get(name="By id").category, self.category)
+
+    def test_streaming_json_parser_handles_arrays_and_json_lines(self):
+        rows = [{"name": f"Dish {i}", "price": 10 + i} for i in range(20)]
+        for content in (json.dumps(rows, indent=2), "\n".join(json.dumps(row) for row in rows)):
+            self.assertEqual(list(iter_json_rows(BytesIO(content.encode()), chunk_size=7)), rows)
+        with self.assertRaises(ValueError):
+            list(iter_json_rows(BytesIO(b'[{"name": "Dish"'), chunk_size=7))
+
+    def test_menu_and_order_exports_stream(self):
+        self.create_order(self.customer, self.restaurant, self.menu_items)
+        response = self.client.get(f"/api/restaurants/{self.restaurant.pk}/menu/export/")
+        self.assertTrue(response.streaming)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], "id,category,name,description,price")
+        self.assertEqual(len(lines), 3)
+
+        response = self.client.get(f"/api/restaurants/{self.restaurant.pk}/orders/export/", {"file_format": "json"})
+        rows = json.loads(b"".join(response.streaming_content))
+        self.assertEqual([row["menu_item_name"] for row in rows], ["Dish 0", "Dish 1"])
+        self.assertEqual(rows[0]["customer"], "customer")
+
+    def test_only_the_owner_can_import(self):
+        self.client.force_authenticate(self.customer)
+        self.assertEqual(self.upload("menu.csv", "category,name,price\nMains,X,1\n").status_code, 403)
+
+
+@override_settings(IMAGE_DERIVATIVES={"SIZES": {"thumbnail": (40, 40), "card": (120, 120)}, "WORKERS": 0})
+class ImageDerivativeTests(ApiTestData, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = cls.create_user("owner", "restaurant_owner")
+        cls.restaurant, cls.category, cls.menu_items = cls.create_menu(cls.owner, items=1)
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def photo(self, color="red", size=(800, 600)):
+        output = BytesIO()
+        Image.new("RGB", size, color).save(output, "JPEG")
+        return SimpleUploadedFile("photo.jpg", output.getvalue(), content_type="image/jpeg")
+
+    def attach_photo(self, item, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            item.image = self.photo(**kwargs)
+            item.save()
+        item.refresh_from_db()
+        return item
+
+    def test_upload_renders_content_hashed_derivatives(self):
+        item = self.attach_photo(self.menu_items[0])
+        sizes = item.image_derivatives["sizes"]
+        self.assertEqual(item.image_derivatives["source"], item.image.name)
+        self.assertEqual(set(sizes), {"thumbnail", "card"})
+        with item.image.storage.open(sizes["card"]) as fileobj:
+            self.assertEqual(Image.open(fileobj).size, (120, 90))
+
+        # Same bytes, same names: derivatives can be cached forever
+        other = MenuItem.objects.create(category=self.category, name="Twin", price=Decimal("5.00"))
+        other = self.attach_photo(other)
+        self.assertEqual(other.image_derivatives["sizes"], sizes)
+
+    def test_replacing_the_photo_regenerates_and_serializers_expose_urls(self):
+        item = self.attach_photo(self.menu_items[0])
+        first = item.image_derivatives["sizes"]["thumbnail"]
+        item = self.attach_photo(item, color="blue")
+        self.assertNotEqual(item.image_derivatives["sizes"]["thumbnail"], first)
+
+        self.client.force_authenticate(self.owner)
+        response = self.client.get(f"/api/menu-items/{item.pk}/")
+        urls = response.data["image_urls"]
+        self.assertTrue(urls["thumbnail"].endswith(item.image_derivatives["sizes"]["thumbnail"]))
+        self.assertNotIn("image_derivatives", response.data)
+
+    def test_backfill_command_renders_missing_derivatives(self):
+        item = self.menu_items[0]
+        item.image = self.photo()
+        item.save()  # on_commit never runs here, so nothing is rendered
+        self.assertEqual(MenuItem.objects.get(pk=item.pk).image_derivatives, {})
+
+        out = StringIO()
+        call_command("generate_image_derivatives", stdout=out)
+        self.assertIn("for 1 menu items", out.getvalue())
+        self.assertIn("card", MenuItem.objects.get(pk=item.pk).image_derivatives["sizes"])
+
+    @override_settings(IMAGE_DERIVATIVES={"SIZES": {"thumbnail": (40, 40)}, "WORKERS": 1})
+    def test_rendering_runs_in_a_worker_process(self):
+        self.addCleanup(reset_executor)
+        name = self.menu_items[0].image.storage.save("menu_items/photo.jpg", self.photo())
+        result = get_executor().submit(render_derivatives, name).result(timeout=60)
+        self.assertEqual(result, render_derivatives(name))
+
+
+    @override_settings(IMAGE_DERIVATIVES={"WORKERS": 1})
+    def test_failed_renders_are_logged_with_the_item(self):
+        future = Future()
+        executor = mock.Mock(**{"submit.return_value": future})
+        with mock.patch("Api.images.get_executor", return_value=executor):
+            schedule_derivatives(self.menu_items[0].pk, "menu_items/corrupt.jpg")
+        with self.assertLogs("Api.images", "ERROR") as logs:
+            # Callbacks run where the result is set; the pool uses its own thread too
+            worker = threading.Thread(target=future.set_exception, args=(OSError("cannot identify image file"),))
+            worker.start()
+            worker.join()
+        self.assertIn(f"menu item {self.menu_items[0].pk} failed", logs.output[0])
+        self.assertIn("cannot identify image file", logs.output[0])
+
+class FastReadPathTests(QueryBudgetMixin, ApiTestData, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = cls.create_user("owner", "restaurant_owner")
+        cls.restaurant, cls.category, cls.menu_items = cls.create_menu(cls.owner, items=12)
+        cls.create_menu(cls.create_user("chef", "restaurant_owner"), items=1, name="Caf\u00e9 \u2028 \"Quotes\"")
+        MenuItem.objects.filter(pk=cls.menu_items[0].pk).update(
+            description="Spicy \U0001f336\n<b>tab\t</b>", price=Decimal("7.5"), image="menu_items/jollof.jpg",
+            image_derivatives={"source": "menu_items/jollof.jpg", "sizes": {"thumbnail": "menu_items/derived/t.webp"}},
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.owner)
+
+    def assertSameAsSerializer(self, url, params=None):
+        fast = self.client.get(url, params)
+        with override_settings(FAST_READ_PATH=False):
+            slow = self.client.get(url, params)
+        self.assertEqual(fast.status_code, slow.status_code)
+        expected = JSONRenderer().render(slow.data)
+        self.assertEqual(slow.content, expected)
+        self.assertEqual(fast.content, expected)
+        return fast
+
+    def test_lists_and_details_match_the_serializers_byte_for_byte(self):
+        for url, params in [
+            ("/api/restaurants/", None),
+            ("/api/restaurants/", {"search": "caf\u00e9"}),
+            ("/api/menu-items/", None),
+            ("/api/menu-items/", {"ordering": "-price"}),
+            ("/api/menu-items/", {"search": "dish"}),
+            (f"/api/menu-items/{self.menu_items[0].pk}/", None),
+            (f"/api/restaurants/{self.restaurant.pk}/", None),
+            ("/api/menu-items/999999/", None),
+        ]:
+            with self.subTest(url=url, params=params):
+                self.assertSameAsSerializer(url, params)
+
+    def test_cursor_pages_match(self):
+        response = self.assertSameAsSerializer("/api/menu-items/", {"ordering": "price"})
+        while response.data["next"]:
+            response = self.assertSameAsSerializer(response.data["next"])
+
+    def test_list_is_one_values_query(self):
+        with self.assertQueryBudget(1) as ctx:
+            self.client.get("/api/restaurants/")
+        # owner username joined in; no other User columns selected
+        self.assertNotIn("password", ctx.captured_queries[0]["sql"])
+
+    def test_renderer_matches_drf(self):
+        data = {
+            "price": Decimal("12.50"),
+            "when": timezone.now(),
+            "id": uuid.uuid4(),
+            "text": "line\u2028break\u2029 \u00e9 \x00 </script>",
+            "nested": [{"a": None, "b": True}, (1, 2)],
+            "big": 2 ** 70,
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(FastJSONRenderer().render({1: "int key"}), JSONRenderer().render({1: "int key"}))
+
+
+class BenchmarkSuiteTests(APITestCase):
+    def test_every_route_has_a_scenario(self):
+        missing = [
+            route for route in iter_routes()
+            if route not in SCENARIOS and route not in SKIPPED_ROUTES and not route.startswith("admin/")
+        ]
+        self.assertEqual(missing, [])
+
+    def test_seed_and_run_produce_a_comparable_report(self):
+        call_command(
+            "seed_benchmark_data", restaurants=3, menu_items=30, customers=5, orders=40, stdout=StringIO()
+        )
+        self.assertEqual(Order.objects.count(), 40)
+        self.assertEqual(
+            set(Order.objects.values_list("restaurant_id", flat=True)) - set(Restaurant.objects.values_list("id", flat=True)),
+            set(),
+        )
+
+        report = run_benchmarks(iterations=2, warmup=0, only=["menu_item_list", "order_detail", "checkout"])
+        self.assertEqual(set(report["results"]), {"menu_item_list", "order_detail", "checkout"})
+        for row in report["results"].values():
+            self.assertLess(row["status"], 300)
+            self.assertGreater(row["queries"], 0)
+        json.dumps(report)
+        self.assertEqual(Order.objects.count(), 40)  # checkout was rolled back
+
+        slower = json.loads(json.dumps(report))
+        slower["results"]["checkout"]["queries"] += 3
+        slower["results"]["menu_item_list"]["p50_ms"] *= 2
+        regressions = compare_to_baseline(slower, report)
+        self.assertIn(("checkout", "queries"), [(r["scenario"], r["metric"]) for r in regressions])
+        self.assertIn(("menu_item_list", "p50_ms"), [(r["scenario"], r["metric"]) for r in regressions])
+        self.assertEqual(compare_to_baseline(report, report), [])
+
+
+class InstrumentationTests(ApiTestData, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = cls.create_user("owner", "restaurant_owner")
+        cls.customer = cls.create_user("customer", "customer")
+        cls.restaurant, cls.category, cls.menu_items = cls.create_menu(cls.owner)
+
+    def setUp(self):
+        reset_registry()
+        self.addCleanup(reset_registry)
+
+    def test_server_timing_breaks_down_the_request(self):
+        self.create_order(self.customer, self.restaurant, self.menu_items)
+        self.client.force_authenticate(self.customer)
+        response = self.client.get("/api/orders/")
+        timing = dict(
+            (entry.split(";")[0], entry) for entry in response["Server-Timing"].split(", ")
+        )
+        self.assertEqual(set(timing), {"auth", "perm", "db", "serialize", "render", "app", "total"})
+        self.assertIn('desc="2 queries"', timing["db"])
+
+    def test_metrics_endpoint_reports_per_view_histograms(self):
+        self.client.force_authenticate(self.customer)
+        self.client.get("/api/menu-items/")
+        self.client.get("/api/menu-items/")
+        self.client.force_login(self.create_user("admin", "admin"))
+        body = self.client.get("/metrics").content.decode()
+        self.assertIn('api_request_duration_seconds_count{view="MenuItemListCreateAPIView"} 2', body)
+        self.assertIn('api_request_phase_seconds_count{view="MenuItemListCreateAPIView",phase="db"} 2', body)
+        self.assertIn('api_requests_total{view="MenuItemListCreateAPIView",method="GET",status="200"} 2', body)
+
+    @override_settings(INSTRUMENTATION={"METRICS_TOKEN": "scrape-me"})
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        for wrong in ("Bearer scrape-m", "Bearer scrape-me-too", "Bearer scr\u00e4pe-me"):
+            self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION=wrong).status_code, 403)
+        with mock.patch("Api.instrumentation.hmac.compare_digest", wraps=hmac.compare_digest) as compare:
+            response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer scrape-me")
+        self.assertEqual(response.status_code, 200)
+        compare.assert_called_once()
+
+    def test_metrics_are_private_by_default(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer nonsense").status_code, 403)
+        customer = RoleRefreshToken.for_user(self.customer).access_token
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION=f"Bearer {customer}").status_code, 403)
+        admin = RoleRefreshToken.for_user(self.create_user("admin", "admin")).access_token
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION=f"Bearer {admin}").status_code, 200)
+        with override_settings(INSTRUMENTATION={"METRICS_PUBLIC": True}):
+            self.assertEqual(self.client.get("/metrics").status_code, 200)
+
+    def test_password_hashing_views_have_their_own_threshold(self):
+        with override_settings(INSTRUMENTATION={"SLOW_REQUEST_MS": 0}):
+            with self.assertNoLogs("Api.instrumentation", "WARNING"):
+                self.client.post("/api/auth/login/", {"username": "owner", "password": "pass1234"})
+            with self.assertLogs("Api.instrumentation", "WARNING"):
+                self.client.get("/api/menu-items/")
+
+    @override_settings(INSTRUMENTATION={"N_PLUS_ONE_THRESHOLD": 3, "SLOW_REQUEST_MS": 0})
+    def test_repeated_queries_and_slow_requests_are_logged(self):
+        def n_plus_one(request):
+            for item in MenuItem.objects.all():
+                item.category.name
+            return HttpResponse("ok")
+
+        middleware = InstrumentationMiddleware(n_plus_one)
+        with self.assertLogs("Api.instrumentation", "WARNING") as logs:
+            middleware(RequestFactory().get("/"))
+        self.assertTrue(any("Possible N+1" in line for line in logs.output))
+        self.assertTrue(any("Slow request" in line for line in logs.output))
+        self.assertIn('api_n_plus_one_total{view="unresolved"} 1', get_registry().render())
+
+
+class NearbyRestaurantTests(QueryBudgetMixin, ApiTestData, APITestCase):
+    # (name, latitude, longitude, km from the search point, roughly)
+    PLACES = [
+        ("Osu", 5.5560, -0.1820, 5.3),
+        ("Airport", 5.6050, -0.1710, 1.8),
+        ("Makola", 5.5490, -0.2080, 6.5),
+        ("Legon", 5.6500, -0.1860, 5.1),
+        ("Kumasi", 6.6885, -1.6244, 199.0),
+        ("Nowhere", None, None, None),
+    ]
+    CENTRE = (5.6037, -0.1870)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = cls.create_user("owner", "restaurant_owner")
+        for name, latitude, longitude, _ in cls.PLACES:
+            Restaurant.objects.create(
+                owner=cls.owner, name=name, address=name, phone="0200000000", latitude=latitude, longitude=longitude
+            )
+
+    def setUp(self):
+        self.client.force_authenticate(self.owner)
+
+    def nearby(self, radius, **params):
+        return self.client.get(
+            "/api/restaurants/", {"near": "%s,%s" % self.CENTRE, "radius": radius, **params}
+        )
+
+    def test_geohash_matches_the_reference_encoding(self):
+        self.assertEqual(encode_geohash(57.64911, 10.40744, 11), "u4pruydqqvj")
+        self.assertEqual(Restaurant.objects.get(name="Osu").geohash, encode_geohash(5.5560, -0.1820))
+        self.assertEqual(Restaurant.objects.get(name="Nowhere").geohash, "")
+
+    def test_results_are_limited_to_the_radius_and_ranked_by_distance(self):
+        response = self.nearby(6)
+        results = response.data["results"]
+        self.assertEqual([row["name"] for row in results], ["Airport", "Legon", "Osu"])
+        distances = [row["distance_km"] for row in results]
+        self.assertEqual(distances, sorted(distances))
+        self.assertAlmostEqual(distances[0], 1.82, delta=0.05)
+        self.assertIsNone(self.client.get("/api/restaurants/").data["results"][0]["distance_km"])
+
+    def test_pages_follow_distance_order(self):
+        seen = []
+        with mock.patch.object(KeysetPagination, "page_size", 2):
+            response = self.nearby(50)
+            while True:
+                seen.extend(row["name"] for row in response.data["results"])
+                if not response.data["next"]:
+                    break
+                response = self.client.get(response.data["next"])
+        self.assertEqual(seen, ["Airport", "Legon", "Osu", "Makola"])
+
+    def test_nearby_is_one_query(self):
+        with self.assertQueryBudget(1):
+            self.nearby(10)
+
+    def test_bad_coordinates_are_rejected(self):
+        self.assertEqual(self.client.get("/api/restaurants/", {"near": "91,0"}).status_code, 400)
+        self.assertEqual(self.nearby(500).status_code, 400)
+        self.assertEqual(self.client.get("/api/restaurants/", {"near": "abc"}).status_code, 400)
+
+
+class DispatchTests(ApiTestData, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = cls.create_user("owner", "restaurant_owner")
+        cls.customer = cls.create_user("customer", "customer")
+        cls.restaurant, cls.category, cls.menu_items = cls.create_menu(cls.owner)
+        cls.restaurant.latitude, cls.restaurant.longitude = 5.6037, -0.1870
+        cls.restaurant.save()
+
+    def courier(self, name, km_north, available=True, seen=timedelta(0)):
+        user = self.create_user(name, "courier")
+        return Courier.objects.create(
+            user=user,
+            latitude=self.restaurant.latitude + km_north / KM_PER_DEGREE,
+            longitude=self.restaurant.longitude,
+            is_available=available,
+            last_seen=timezone.now() - seen,
+        )
+
+    def confirmed_order(self):
+        order = self.create_order(self.customer, self.restaurant, self.menu_items[:1])
+        order.status = "CONFIRMED"
+        order.save()
+        return order
+
+    def test_optimal_assignment_serves_more_orders_than_greedy(self):
+        # Greedy gives the 0.5km pair to the second order and strands the first
+        orders = [(0.0, 0.0), (1.5 / KM_PER_DEGREE, 0.0)]
+        couriers = [(1.0 / KM_PER_DEGREE, 0.0), (3.0 / KM_PER_DEGREE, 0.0)]
+        self.assertEqual([(o, c) for o, c, _ in assign(orders, couriers, 2.0, "greedy")], [(1, 0)])
+        optimal = assign(orders, couriers, 2.0, "optimal")
+        self.assertEqual([(o, c) for o, c, _ in optimal], [(0, 0), (1, 1)])
+        self.assertAlmostEqual(sum(km for _, _, km in optimal), 2.5, places=2)
+        with self.assertRaises(ValueError):
+            assign(orders, couriers, 2.0, "fastest")
+
+    def test_batch_sends_oldest_orders_out_with_nearby_idle_couriers(self):
+        first, second = self.confirmed_order(), self.confirmed_order()
+        self.create_order(self.customer, self.restaurant, self.menu_items[:1])  # still pending
+        near = self.courier("near", 1)
+        self.courier("far", 30)
+        self.courier("stale", 0.5, seen=timedelta(hours=1))
+        self.courier("off-shift", 0.5, available=False)
+        busy = self.courier("busy", 0.2)
+        Order.objects.filter(pk=self.create_order(self.customer, self.restaurant, []).pk).update(
+            status="OUT_FOR_DELIVERY", courier=busy
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            result = dispatch_batch()
+        self.assertEqual((result["orders"], result["couriers"], result["assigned"]), (2, 2, 1))
+
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.courier_id), ("OUT_FOR_DELIVERY", near.pk))
+        self.assertIsNotNone(first.assigned_at)
+        self.assertEqual(Order.objects.get(pk=second.pk).status, "CONFIRMED")
+        rollups = dict(DailyOrderRollup.objects.values_list("status", "order_count"))
+        self.assertEqual((rollups["CONFIRMED"], rollups["OUT_FOR_DELIVERY"]), (1, 1))
+
+        # The near courier is busy now, so nothing else goes out
+        self.assertEqual(dispatch_batch()["assigned"], 0)
+
+    def test_courier_updates_location_and_delivers(self):
+        courier_user = self.create_user("rider", "courier")
+        self.client.force_authenticate(courier_user)
+        response = self.client.patch("/api/couriers/me/", {"latitude": 5.6, "longitude": -0.18, "is_available": True})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.data["data"]["last_seen"])
+        self.assertEqual(self.client.patch("/api/couriers/me/", {"latitude": None}, format="json").status_code, 400)
+
+        order = self.confirmed_order()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(dispatch_batch()["assigned"], 1)
+        self.assertEqual(self.client.get("/api/couriers/me/").data["active_order"], order.pk)
+
+        response = self.client.post(f"/api/couriers/me/orders/{order.pk}/delivered/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["data"]["status"], "DELIVERED")
+        self.assertEqual(self.client.post(f"/api/couriers/me/orders/{order.pk}/delivered/").status_code, 400)
+        self.assertIsNone(self.client.get("/api/couriers/me/").data["active_order"])
+
+        self.client.force_authenticate(self.customer)
+        self.assertEqual(self.client.get("/api/couriers/me/").status_code, 403)
+        self.client.patch(f"/api/orders/{order.pk}/", {"courier": None}, format="json")
+        self.assertIsNotNone(Order.objects.get(pk=order.pk).courier_id)
+
+    def test_simulation_reports_batch_timings(self):
+        for algorithm in ("optimal", "greedy"):
+            report = simulate(orders=200, couriers=80, restaurants=20, hours=0.25, algorithm=algorithm)
+            self.assertEqual(report["assigned"] + report["unassigned"], 200)
+            self.assertGreater(report["assigned"], 150)
+            self.assertGreater(report["batches"], 0)
+            self.assertIsNotNone(report["batch_ms_p95"])
+
+
+class IdempotencyTests(ApiTestData, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = cls.create_user("owner", "restaurant_owner")
+        cls.customer = cls.create_user("customer", "customer")
+        cls.restaurant, cls.category, cls.menu_items = cls.create_menu(cls.owner)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.customer)
+
+    def checkout(self, key, quantity=2):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                "/api/checkout/",
+                {"restaurant": self.restaurant.pk, "items": [{"menu_item": self.menu_items[0].pk, "quantity": quantity}]},
+                format="json",
+                HTTP_IDEMPOTENCY_KEY=key,
+            )
+
+    def test_retries_replay_the_first_response(self):
+        first = self.checkout("retry-1")
+        self.assertEqual(first.status_code, 201)
+        with CaptureQueriesContext(connections["default"]) as queries:
+            retry = self.checkout("retry-1")
+        # Only the transaction's savepoint; the replay comes from the cache
+        self.assertEqual([q["sql"] for q in queries if "SAVEPOINT" not in q["sql"]], [])
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(json.loads(retry.content), json.loads(first.content))
+        self.assertEqual(Order.objects.count(), 1)
+
+        # A new key is a new order
+        self.assertEqual(self.checkout("retry-2").status_code, 201)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_database_answers_when_the_cache_has_forgotten(self):
+        first = self.checkout("durable")
+        cache.clear()
+        retry = self.checkout("durable")
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(json.loads(retry.content), json.loads(first.content))
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_concurrent_duplicate_replays_the_row_it_waited_for(self):
+        first = self.checkout("raced")
+        cache.clear()  # the duplicate arrived before the first response was cached
+        real_first = QuerySet.first
+
+        def snapshot_first(queryset):
+            # A REPEATABLE READ snapshot taken before the first request
+            # committed: only a locking read sees its claim
+            if queryset.model is IdempotencyKey and not queryset.query.select_for_update:
+                return None
+            return real_first(queryset)
+
+        with mock.patch.object(QuerySet, "first", snapshot_first):
+            retry = self.checkout("raced")
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(json.loads(retry.content), json.loads(first.content))
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_menu_item_creates_are_idempotent(self):
+        self.client.force_authenticate(self.owner)
+        payload = {"category": self.category.pk, "name": "Kenkey", "price": "6.00"}
+        for _ in range(2):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post("/api/menu-items/", payload, format="json", HTTP_IDEMPOTENCY_KEY="kenkey")
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(response["Idempotent-Replayed"], "true")
+        self.assertEqual(MenuItem.objects.filter(name="Kenkey").count(), 1)
+
+    def test_reusing_a_key_for_another_request_is_rejected(self):
+        self.checkout("reused")
+        self.assertEqual(self.checkout("reused", quantity=3).status_code, 422)
+        self.assertEqual(self.checkout("x" * 300).status_code, 400)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_keys_are_per_user_and_expire(self):
+        self.checkout("shared")
+        other = self.create_user("other", "customer")
+        self.client.force_authenticate(other)
+        self.assertNotIn("Idempotent-Replayed", self.checkout("shared"))
+        self.assertEqual(Order.objects.count(), 2)
+
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        cache.clear()
+        self.assertNotIn("Idempotent-Replayed", self.checkout("shared"))
+        self.assertEqual(Order.objects.count(), 3)
+        self.assertEqual(prune_expired_keys(), 1)
+
+    def test_validation_errors_are_replayed_and_server_errors_are_not(self):
+        response = self.client.post("/api/order-items/", {}, format="json", HTTP_IDEMPOTENCY_KEY="bad")
+        self.assertEqual(response.status_code, 400)
+        retry = self.client.post("/api/order-items/", {}, format="json", HTTP_IDEMPOTENCY_KEY="bad")
+        self.assertEqual((retry.status_code, retry["Idempotent-Replayed"]), (400, "true"))
+
+        with mock.patch("Api.serializers.CheckoutSerializer.create", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.checkout("crash")
+        self.assertFalse(IdempotencyKey.objects.filter(key="crash").exists())
+        self.assertEqual(self.checkout("crash").status_code, 201)
+
+
+@override_settings(DATABASE_REPLICAS={"REPLICAS": ["replica1", "replica2"], "STICKY_SECONDS": 10, "EJECT_SECONDS": 30})
+class ReplicaRoutingTests(ApiTestData, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = cls.create_user("customer", "customer")
+
+    def setUp(self):
+        cache.clear()
+        reset_pool()
+        self.addCleanup(reset_pool)
+        # No real replica connections in tests; health checks pass unless a test says otherwise
+        self.down = set()
+        patcher = mock.patch.object(ReplicaPool, "check", side_effect=self.check)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.router = ReplicaRouter()
+
+    def check(self, alias):
+        if alias in self.down:
+            raise OperationalError(f"{alias} is down")
+
+    def route(self, method="get", user=None, write=False):
+        """Run a request through the middleware; return the aliases its reads went to."""
+        seen = []
+
+        def view(request):
+            request.user = user or AnonymousUser()
+            seen.append(self.router.db_for_read(Restaurant))
+            if write:
+                self.router.db_for_write(Order)
+            seen.append(self.router.db_for_read(Restaurant))
+            return HttpResponse()
+
+        ReplicaRoutingMiddleware(view)(getattr(RequestFactory(), method)("/api/restaurants/"))
+        return seen
+
+    def test_safe_requests_read_from_one_replica(self):
+        reads = self.route(user=self.customer)
+        self.assertIn(reads[0], {"replica1", "replica2"})
+        self.assertEqual(reads[0], reads[1])
+        self.assertEqual(self.route("post", user=self.customer), ["default", "default"])
+        # Outside a request (commands, workers) everything uses the primary
+        self.assertEqual(self.router.db_for_read(Restaurant), "default")
+        self.assertEqual(self.router.allow_migrate("replica1", "Api"), False)
+
+    def test_writers_read_their_writes_for_the_sticky_window(self):
+        self.assertEqual(self.route(user=self.customer, write=True)[1], "default")
+        self.assertEqual(self.route(user=self.customer), ["default", "default"])
+        other = self.create_user("other", "customer")
+        self.assertIn(self.route(user=other)[0], {"replica1", "replica2"})
+
+        cache.delete(f"replica-pin:{self.customer.pk}")  # the window passed
+        self.assertIn(self.route(user=self.customer)[0], {"replica1", "replica2"})
+
+    def test_unhealthy_replicas_are_ejected(self):
+        self.down.add("replica1")
+        with self.assertLogs("Api.replicas", "WARNING"):
+            self.assertEqual({self.route()[0] for _ in range(10)}, {"replica2"})
+        self.down.clear()
+        # Still ejected until EJECT_SECONDS pass
+        self.assertEqual({self.route()[0] for _ in range(10)}, {"replica2"})
+
+        self.down.add("replica2")
+        get_pool()._checked.clear()
+        with self.assertLogs("Api.replicas", "WARNING"):
+            self.assertEqual(self.route(), ["default", "default"])
+
+    def test_primary_reads_block(self):
+        seen = []
+
+        def view(request):
+            with primary_reads():
+                seen.append(self.router.db_for_read(Restaurant))
+            seen.append(self.router.db_for_read(Restaurant))
+            return HttpResponse()
+
+        ReplicaRoutingMiddleware(view)(RequestFactory().get("/"))
+        self.assertEqual(seen[0], "default")
+        self.assertIn(seen[1], {"replica1", "replica2"})
+
+    def test_api_writes_pin_the_user(self):
+        owner = self.create_user("owner", "restaurant_owner")
+        restaurant, _, menu_items = self.create_menu(owner)
+        self.client.force_authenticate(self.customer)
+        response = self.client.post(
+            "/api/checkout/",
+            {"restaurant": restaurant.pk, "items": [{"menu_item": menu_items[0].pk, "quantity": 1}]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertIsNotNone(cache.get(f"replica-pin:{self.customer.pk}"))
+        self.assertEqual(self.route(user=self.customer), ["default", "default"])
+
+
+class AsyncViewTests(QueryBudgetMixin, ApiTestData, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = cls.create_user("owner", "restaurant_owner")
+        cls.customer = cls.create_user("customer", "customer")
+        cls.admin = cls.create_user("admin", "admin")
+        cls.restaurant, cls.category, cls.menu_items = cls.create_menu(cls.owner, items=12)
+        cls.orders = [cls.create_order(cls.customer, cls.restaurant, cls.menu_items[:3]) for _ in range(12)]
+
+    def setUp(self):
+        cache.clear()
+        self.factory = APIRequestFactory()
+
+    def call(self, view_class, method, path, user, data=None, **kwargs):
+        request = getattr(self.factory, method)(path, data, format="json" if data is not None else None)
+        if user is not None:
+            force_authenticate(request, user)
+        view = view_class.as_view()
+        response = async_to_sync(view)(request, **kwargs) if view_class.view_is_async else view(request, **kwargs)
+        return response.render()
+
+    def assertSameAsSync(self, name, path, user, **kwargs):
+        sync = self.call(getattr(views, name), "get", path, user, **kwargs)
+        native = self.call(getattr(async_views, f"Async{name}"), "get", path, user, **kwargs)
+        self.assertEqual((native.status_code, native.content), (sync.status_code, sync.content))
+        return native
+
+    def test_reads_match_the_sync_views(self):
+        for name, path, user, kwargs in [
+            ("RestaurantListCreateAPIView", "/api/restaurants/", self.customer, {}),
+            ("RestaurantListCreateAPIView", "/api/restaurants/?search=mama", self.customer, {}),
+            ("RestaurantRetrieveUpdateDestroyAPIView", "/", self.owner, {"pk": self.restaurant.pk}),
+            ("RestaurantRetrieveUpdateDestroyAPIView", "/", self.customer, {"pk": self.restaurant.pk}),
+            ("MenuItemListCreateAPIView", "/api/menu-items/?ordering=-price", self.customer, {}),
+            ("MenuItemListCreateAPIView", "/api/menu-items/?page=2", self.admin, {}),
+            ("MenuItemRetrieveUpdateDestroyAPIView", "/", self.customer, {"pk": self.menu_items[0].pk}),
+            ("MenuItemRetrieveUpdateDestroyAPIView", "/", self.customer, {"pk": 999999}),
+            ("OrderListCreateAPIView", "/api/orders/", self.customer, {}),
+            ("OrderListCreateAPIView", "/api/orders/", None, {}),
+            ("OrderRetrieveUpdateDestroyAPIView", "/", self.customer, {"pk": self.orders[0].pk}),
+            ("OrderRetrieveUpdateDestroyAPIView", "/", self.customer, {"pk": 999999}),
+        ]:
+            with self.subTest(view=name, path=path, kwargs=kwargs):
+                self.assertSameAsSync(name, path, user, **kwargs)
+
+        with override_settings(FAST_READ_PATH=False):
+            self.assertSameAsSync("MenuItemListCreateAPIView", "/api/menu-items/", self.customer)
+
+    def test_cursor_pages_match(self):
+        path = "/api/orders/?ordering=-created_at"
+        pages = 0
+        while path:
+            response = self.assertSameAsSync("OrderListCreateAPIView", path, self.customer)
+            path = json.loads(response.content)["next"]
+            pages += 1
+        self.assertEqual(pages, 2)
+
+    def test_list_runs_the_same_queries(self):
+        with CaptureQueriesContext(connections["default"]) as sync:
+            self.call(views.OrderListCreateAPIView, "get", "/api/orders/", self.customer)
+        with CaptureQueriesContext(connections["default"]) as native:
+            self.call(async_views.AsyncOrderListCreateAPIView, "get", "/api/orders/", self.customer)
+        self.assertEqual([q["sql"] for q in native], [q["sql"] for q in sync])
+
+    def test_writes_run_the_sync_handlers(self):
+        view = async_views.AsyncRestaurantListCreateAPIView
+        data = {"name": "Night Market", "address": "2 Main St", "phone": "0200000001"}
+        self.assertEqual(self.call(view, "post", "/api/restaurants/", self.customer, data).status_code, 403)
+
+        request = self.factory.post("/api/restaurants/", data, format="json", HTTP_IDEMPOTENCY_KEY="async-1")
+        force_authenticate(request, self.owner)
+        with self.captureOnCommitCallbacks(execute=True):
+            first = async_to_sync(view.as_view())(request).render()
+        self.assertEqual(first.status_code, 201)
+        retry = self.call(view, "post", "/api/restaurants/", self.owner, data)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(Restaurant.objects.filter(name="Night Market").count(), 2)
+
+        request = self.factory.post("/api/restaurants/", data, format="json", HTTP_IDEMPOTENCY_KEY="async-1")
+        force_authenticate(request, self.owner)
+        replay = async_to_sync(view.as_view())(request)
+        self.assertEqual(replay["Idempotent-Replayed"], "true")
+        self.assertEqual(Restaurant.objects.filter(name="Night Market").count(), 2)
+
+        detail = async_views.AsyncOrderRetrieveUpdateDestroyAPIView
+        response = self.call(detail, "patch", "/", self.customer, {"status": "CANCELLED"}, pk=self.orders[0].pk)
+        self.assertEqual(response.status_code, 200)
+        self.orders[0].refresh_from_db()
+        self.assertEqual(self.orders[0].status, "CANCELLED")
+
+    def test_async_permission_classes_are_awaited(self):
+        class AsyncDenied(BasePermission):
+            async def has_permission(self, request, view):
+                return False
+
+        view = type("Denied", (async_views.AsyncMenuItemListCreateAPIView,), {
+            "get_permissions": lambda self: [AsyncDenied()],
+        })
+        self.assertEqual(self.call(view, "get", "/api/menu-items/", self.customer).status_code, 403)
+
+    def test_middleware_runs_natively_under_asgi(self):
+        seen = {}
+
+        async def view(request):
+            seen["metrics"] = current_metrics()
+            seen["db"] = await sync_to_async(ReplicaRouter().db_for_read)(Restaurant)
+            return HttpResponse()
+
+        stack = InstrumentationMiddleware(ReplicaRoutingMiddleware(view))
+        self.assertTrue(iscoroutinefunction(stack))
+        with override_settings(DATABASE_REPLICAS={"REPLICAS": ["replica1"]}), \
+                mock.patch.object(ReplicaPool, "check"):
+            reset_pool()
+            self.addCleanup(reset_pool)
+            response = asyncio.run(stack(RequestFactory().get("/api/restaurants/")))
+        self.assertIsNotNone(seen["metrics"])
+        self.assertEqual(seen["db"], "replica1")
+        self.assertIn("total;dur=", response["Server-Timing"])
+
+    def test_load_test_drives_both_interfaces(self):
+        ctx = mock.Mock(restaurant=self.restaurant, menu_item=self.menu_items[0], order=self.orders[0])
+        ctx.auth.return_value = {"HTTP_AUTHORIZATION": f"Bearer {RoleRefreshToken.for_user(self.customer).access_token}"}
+        requests = scenario_requests(ctx, ["restaurant_list", "order_detail"])
+        self.assertEqual(requests[1][0], f"/api/orders/{self.orders[0].pk}/")
+        with self.assertRaises(ValueError):
+            scenario_requests(ctx, ["checkout"])
+
+        path, headers = requests[0]
+        self.assertEqual(call_wsgi(WSGIHandler(), path, headers), 200)
+        # Each ASGI request gets its own DB thread, which can't see this test's
+        # uncommitted rows; an unauthenticated request needs no database
+        self.assertEqual(asyncio.run(call_asgi(ASGIHandler(), path, {})), 401)
+        self.assertEqual(call_wsgi(WSGIHandler(), path, {}), 401)
+
+
+RATE_LIMITS_UNDER_TEST = {
+    "ROLES": {"anon": "50/m", "customer": "5/m", "restaurant_owner": "50/m", "admin": None},
+    "SCOPES": {"login": {"*": "3/m"}, "orders": {"customer": "2/m"}},
+}
+
+
+@override_settings(RATE_LIMITS=RATE_LIMITS_UNDER_TEST)
+class RateLimitTests(ApiTestData, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = cls.create_user("customer", "customer")
+        cls.admin = cls.create_user("admin", "admin")
+        owner = cls.create_user("owner", "restaurant_owner")
+        cls.restaurant, _, cls.menu_items = cls.create_menu(owner, items=1)
+
+    def setUp(self):
+        reset_backend()
+        self.addCleanup(reset_backend)
+
+    def test_login_attempts_are_limited_per_client_ip(self):
+        for _ in range(3):
+            response = self.client.post("/api/auth/login/", {"username": "customer", "password": "wrong"})
+            self.assertEqual(response.status_code, 400)
+        blocked = self.client.post("/api/auth/login/", {"username": "customer", "password": "pass1234"})
+        self.assertEqual(blocked.status_code, 429)
+        # Up to two windows: the burst keeps weighing in after its window ends
+        self.assertTrue(0 < int(blocked["Retry-After"]) <= 120)
+        # The token endpoint shares the login scope
+        self.assertEqual(self.client.post("/api/auth/token/", {"username": "customer", "password": "pass1234"}).status_code, 429)
+
+        other = self.client.post(
+            "/api/auth/login/", {"username": "customer", "password": "pass1234"}, REMOTE_ADDR="10.0.0.2"
+        )
+        self.assertEqual(other.status_code, 200)
+
+    def test_role_limits_apply_per_user(self):
+        self.client.force_authenticate(self.customer)
+        for _ in range(5):
+            self.assertEqual(self.client.get("/api/restaurants/").status_code, 200)
+        self.assertEqual(self.client.get("/api/menu-items/").status_code, 429)
+
+        self.client.force_authenticate(self.admin)
+        for _ in range(10):
+            self.assertEqual(self.client.get("/api/restaurants/").status_code, 200)
+
+    def test_order_scope_counts_creates_only(self):
+        self.client.force_authenticate(self.customer)
+        self.client.get("/api/orders/")
+        checkout = {"restaurant": self.restaurant.pk, "items": [{"menu_item": self.menu_items[0].pk, "quantity": 1}]}
+        self.assertEqual(self.client.post("/api/checkout/", checkout, format="json").status_code, 201)
+        self.assertEqual(self.client.post("/api/checkout/", checkout, format="json").status_code, 201)
+        self.assertEqual(self.client.post("/api/checkout/", checkout, format="json").status_code, 429)
+        self.assertEqual(self.client.get("/api/orders/").status_code, 200)
+
+    def test_sliding_window(self):
+        for backend in (MemoryBackend(), CacheBackend("default")):
+            cache.clear()
+            with self.subTest(backend=type(backend).__name__):
+                for i in range(10):
+                    self.assertEqual(backend.hit("k", 10, 60, 120.0 + i), 0)
+                self.assertGreater(backend.hit("k", 10, 60, 179.0), 0)
+                # Early in the next window the previous one still weighs in full...
+                wait = backend.hit("k", 10, 60, 180.0)
+                self.assertAlmostEqual(wait, 6.0)
+                self.assertGreater(backend.hit("k", 10, 60, 185.0), 0)
+                # ...and a request fits once enough of it has slid out
+                self.assertEqual(backend.hit("k", 10, 60, 186.0), 0)
+                self.assertEqual(backend.hit("k", 10, 60, 400.0), 0)
+
+    def test_memory_backend_stays_bounded(self):
+        backend = MemoryBackend(max_keys=4)
+        for i in range(20):
+            self.assertEqual(backend.hit(f"k{i}", 1, 60, 0.0), 0)
+        self.assertLessEqual(len(backend._counters), 4)
+        self.assertEqual(parse_rate("100/15m"), (100, 900))
+        self.assertIsNone(parse_rate(None))
+        with self.assertRaises(ImproperlyConfigured):
+            parse_rate("ten/m")
+
+
+class OrderArchiveTests(QueryBudgetMixin, ApiTestData, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = cls.create_user("owner", "restaurant_owner")
+        cls.customer = cls.create_user("customer", "customer")
+        cls.admin = cls.create_user("admin", "admin")
+        cls.restaurant, _, cls.menu_items = cls.create_menu(cls.owner, items=3)
+        now = timezone.now()
+        statuses = ["DELIVERED", "CANCELLED", "PENDING", "DELIVERED", "DELIVERED", "CANCELLED", "CONFIRMED", "DELIVERED"]
+        cls.orders = []
+        for i, status in enumerate(statuses):
+            order = cls.create_order(cls.customer, cls.restaurant, cls.menu_items[:i % 3 + 1])
+            # The first six are old enough to archive, unless still in progress
+            age = timedelta(days=200 - i) if i < 6 else timedelta(days=1, minutes=-i)
+            Order.objects.filter(pk=order.pk).update(
+                status=status, created_at=now - age, total_price=Decimal("5.00") * (i % 4 + 1)
+            )
+            cls.orders.append(order)
+        cls.archivable = [cls.orders[i].pk for i in (0, 1, 3, 4, 5)]
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, path, user=None):
+        self.client.force_authenticate(user or self.customer)
+        return self.client.get(path)
+
+    def walk(self, path, user=None):
+        # Every page of a cursor-paginated list, as raw responses
+        pages = []
+        while path:
+            response = self.get(path, user)
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.content)
+            path = response.data["next"]
+        return pages
+
+    def test_moves_old_finished_orders_with_their_items(self):
+        before = {
+            row["id"]: row for row in Order.objects.filter(pk__in=self.archivable).values(
+                "id", "customer_id", "restaurant_id", "created_at", "total_price", "status"
+            )
+        }
+        items = sorted(OrderItem.objects.filter(order_id__in=self.archivable).values_list("id", "order_id", "menu_item_id", "price"))
+
+        result = archive_orders(options={"BATCH_SIZE": 2})
+
+        self.assertEqual(result, {"orders": 5, "order_items": len(items), "batches": 3})
+        self.assertEqual(
+            set(Order.objects.values_list("pk", flat=True)), {self.orders[i].pk for i in (2, 6, 7)}
+        )
+        self.assertFalse(OrderItem.objects.filter(order_id__in=self.archivable).exists())
+        archived = ArchivedOrder.objects.values("id", "customer_id", "restaurant_id", "created_at", "total_price", "status")
+        self.assertEqual({row["id"]: row for row in archived}, before)
+        self.assertEqual(
+            sorted(ArchivedOrderItem.objects.values_list("id", "order_id", "menu_item_id", "price")), items
+        )
+        self.assertEqual(archive_orders(), {"orders": 0, "order_items": 0, "batches": 0})
+
+    def test_limited_runs_resume_where_they_stopped(self):
+        self.assertEqual(archive_orders(limit=3, options={"BATCH_SIZE": 2})["orders"], 3)
+        self.assertEqual(Order.objects.filter(pk__in=self.archivable).count(), 2)
+        out = StringIO()
+        call_command("archive_orders", stdout=out)
+        self.assertIn("Archived 2 orders", out.getvalue())
+        self.assertEqual(ArchivedOrder.objects.count(), 5)
+
+    def test_a_failed_batch_leaves_both_tiers_untouched(self):
+        from . import archive
+        copy_rows = archive.copy_rows
+
+        def fail_on_items(using, source, *args, **kwargs):
+            if source is OrderItem:
+                raise OperationalError("disk I/O error")
+            return copy_rows(using, source, *args, **kwargs)
+
+        with mock.patch("Api.archive.copy_rows", side_effect=fail_on_items):
+            with self.assertRaises(OperationalError):
+                archive_orders()
+        self.assertEqual(ArchivedOrder.objects.count(), 0)
+        self.assertEqual(Order.objects.count(), 8)
+        self.assertEqual(archive_orders()["orders"], 5)
+
+    def test_rollups_are_unchanged_and_rebuild_from_both_tiers(self):
+        call_command("rebuild_sales_rollups", stdout=StringIO())
+
+        def snapshot():
+            return (
+                sorted(DailyOrderRollup.objects.values_list("day", "status", "order_count", "revenue")),
+                sorted(DailyMenuItemRollup.objects.values_list("day", "menu_item_id", "quantity", "revenue")),
+            )
+
+        rollups = snapshot()
+        archive_orders()
+        self.assertEqual(snapshot(), rollups)
+        call_command("rebuild_sales_rollups", stdout=StringIO())
+        self.assertEqual(snapshot(), rollups)
+
+    @mock.patch.object(KeysetPagination, "page_size", 3)
+    def test_history_lists_read_both_tiers_in_order(self):
+        paths = ["/api/orders/?history=1", "/api/orders/?history=1&ordering=-total_price"]
+        hot_only = [self.walk(path) for path in paths]
+        archive_orders()
+
+        # The same pages, cursors included, once half the orders moved
+        self.assertEqual([self.walk(path) for path in paths], hot_only)
+        listed = [row["id"] for page in self.walk("/api/orders/") for row in json.loads(page)["results"]]
+        self.assertEqual(listed, [self.orders[i].pk for i in (2, 6, 7)])
+
+        # Numbered pages for admins count and slice across both tiers
+        response = self.get("/api/orders/?history=1&page=1", self.admin)
+        self.assertEqual(response.data["count"], 8)
+        self.assertEqual([row["id"] for row in response.data["results"]], [order.pk for order in self.orders])
+
+    def test_history_detail_falls_back_to_the_archive(self):
+        order = self.orders[0]
+        path = f"/api/orders/{order.pk}/"
+        hot = self.get(path).content
+        archive_orders()
+
+        self.assertEqual(self.get(path).status_code, 404)
+        # Hot tier miss, then the archived order and its items
+        with self.assertQueryBudget(3):
+            response = self.get(path + "?history=1")
+        self.assertEqual(response.content, hot)
+        self.assertEqual(self.get(f"/api/orders/{self.orders[2].pk}/?history=1").data["status"], "PENDING")
+        self.assertEqual(self.get("/api/orders/999999/?history=1").status_code, 404)
+
+        # Archived orders are read-only
+        self.client.force_authenticate(self.customer)
+        response = self.client.patch(path + "?history=1", {"status": "PENDING"}, format="json")
+        self.assertEqual(response.status_code, 404)
+
+    def test_async_views_serve_history_like_the_sync_views(self):
+        archive_orders()
+        factory = APIRequestFactory()
+        for name, path, kwargs in [
+            ("OrderListCreateAPIView", "/api/orders/?history=1", {}),
+            ("OrderListCreateAPIView", "/api/orders/?history=1&ordering=-total_price", {}),
+            ("OrderRetrieveUpdateDestroyAPIView", "/?history=1", {"pk": self.orders[0].pk}),
+            ("OrderRetrieveUpdateDestroyAPIView", "/", {"pk": self.orders[0].pk}),
+        ]:
+            with self.subTest(view=name, path=path):
+                responses = []
+                for view_class in (getattr(views, name), getattr(async_views, f"Async{name}")):
+                    request = factory.get(path)
+                    force_authenticate(request, self.customer)
+                    view = view_class.as_view()
+                    response = async_to_sync(view)(request, **kwargs) if view_class.view_is_async else view(request, **kwargs)
+                    responses.append((response.status_code, response.render().content))
+                self.assertEqual(responses[0], responses[1])
+
+    def test_tiered_queryset_merges_slices(self):
+        archive_orders()
+        tiers = TieredQuerySet(
+            Order.objects.all(), ArchivedOrder.objects.all()
+        ).order_by("-total_price", "pk")
+        everything = sorted(
+            [*Order.objects.all(), *ArchivedOrder.objects.all()], key=lambda order: (-order.total_price, order.pk)
+        )
+        self.assertEqual(tiers.count(), 8)
+        self.assertEqual([order.pk for order in tiers], [order.pk for order in everything])
+        self.assertEqual([order.pk for order in tiers[2:5]], [order.pk for order in everything[2:5]])
+        self.assertEqual(tiers[7].pk, everything[7].pk)
+        self.assertEqual(tiers.get(pk=self.orders[0].pk).__class__, ArchivedOrder)
+        with self.assertRaises(Order.DoesNotExist):
+            tiers.get(pk=999999)
+
+    def test_archive_benchmark_reports_both_stages(self):
+        call_command(
+            "seed_benchmark_data", restaurants=2, menu_items=10, customers=3, orders=30, stdout=StringIO()
+        )
+        report = run_archive_benchmark(iterations=1, warmup=0, options={"AGE_DAYS": 0})
+        json.dumps(report)
+        self.assertGreater(report["archiving"]["orders"], 0)
+        self.assertEqual(
+            report["after"]["rows"]["orders"], report["before"]["rows"]["orders"] - report["archiving"]["orders"]
+        )
+        for stage in ("before", "after"):
+            for name, row in report[stage]["results"].items():
+                self.assertEqual(row["status"], 200, (stage, name))
+
+
+class OwnershipScopingTests(QueryBudgetMixin, ApiTestData, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = cls.create_user("owner", "restaurant_owner")
+        cls.rival = cls.create_user("rival", "restaurant_owner")
+        cls.customer = cls.create_user("customer", "customer")
+        cls.other_customer = cls.create_user("other", "customer")
+        cls.courier_user = cls.create_user("courier", "courier")
+        cls.admin = cls.create_user("admin", "admin")
+        cls.courier = Courier.objects.create(user=cls.courier_user)
+        cls.restaurant, cls.category, cls.menu_items = cls.create_menu(cls.owner, items=2)
+        cls.rival_restaurant, cls.rival_category, cls.rival_items = cls.create_menu(cls.rival, items=2, name="Rival")
+        cls.mine = cls.create_order(cls.customer, cls.restaurant, cls.menu_items)
+        cls.at_rival = cls.create_order(cls.customer, cls.rival_restaurant, cls.rival_items)
+        cls.theirs = cls.create_order(cls.other_customer, cls.restaurant, cls.menu_items[:1])
+        Order.objects.filter(pk=cls.theirs.pk).update(courier=cls.courier, status="OUT_FOR_DELIVERY")
+
+    def setUp(self):
+        cache.clear()
+
+    def order_ids(self, user, path="/api/orders/"):
+        self.client.force_authenticate(user)
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return {row["id"] for row in response.data["results"]}
+
+    def test_order_lists_only_show_the_callers_orders(self):
+        self.assertEqual(self.order_ids(self.customer), {self.mine.pk, self.at_rival.pk})
+        self.assertEqual(self.order_ids(self.other_customer), {self.theirs.pk})
+        self.assertEqual(self.order_ids(self.owner), {self.mine.pk, self.theirs.pk})
+        self.assertEqual(self.order_ids(self.rival), {self.at_rival.pk})
+        self.assertEqual(self.order_ids(self.courier_user), {self.theirs.pk})
+        self.assertEqual(self.order_ids(self.admin), {self.mine.pk, self.at_rival.pk, self.theirs.pk})
+        self.assertEqual(self.order_ids(self.customer, "/api/order-items/"), set(
+            OrderItem.objects.filter(order__customer=self.customer).values_list("pk", flat=True)
+        ))
+
+    def test_scoping_is_a_where_clause(self):
+        self.client.force_authenticate(self.customer)
+        with CaptureQueriesContext(connections["default"]) as ctx:
+            self.client.get("/api/orders/")
+        self.assertIn('"customer_id" = %s' % self.customer.pk, ctx.captured_queries[0]["sql"])
+
+    def test_other_peoples_orders_are_not_found(self):
+        self.client.force_authenticate(self.other_customer)
+        self.assertEqual(self.client.get(f"/api/orders/{self.mine.pk}/").status_code, 404)
+        response = self.client.patch(f"/api/orders/{self.mine.pk}/", {"status": "CANCELLED"}, format="json")
+        self.assertEqual(response.status_code, 404)
+        self.client.force_authenticate(self.rival)
+        self.assertEqual(self.client.get(f"/api/orders/{self.mine.pk}/").status_code, 404)
+        self.client.force_authenticate(self.owner)
+        self.assertEqual(self.client.get(f"/api/orders/{self.mine.pk}/").status_code, 200)
+
+    def test_history_is_scoped_too(self):
+        Order.objects.filter(pk__in=[self.mine.pk, self.theirs.pk]).update(
+            status="DELIVERED", created_at=timezone.now() - timedelta(days=365)
+        )
+        archive_orders()
+        self.assertEqual(self.order_ids(self.customer, "/api/orders/?history=1"), {self.mine.pk, self.at_rival.pk})
+        self.assertEqual(self.order_ids(self.owner, "/api/orders/?history=1"), {self.mine.pk, self.theirs.pk})
+        self.client.force_authenticate(self.other_customer)
+        self.assertEqual(self.client.get(f"/api/orders/{self.mine.pk}/?history=1").status_code, 404)
+
+    def test_owners_edit_their_own_menu_items_only(self):
+        item, rival_item = self.menu_items[0], self.rival_items[0]
+        self.client.force_authenticate(self.owner)
+        with CaptureQueriesContext(connections["default"]) as ctx:
+            response = self.client.patch(f"/api/menu-items/{item.pk}/", {"price": "12.50"}, format="json")
+        self.assertEqual(response.status_code, 200)
+        # The ownership check rides on the lookup; nothing is loaded lazily
+        lookup = ctx.captured_queries[0]["sql"]
+        self.assertIn('"owner_id" = %s' % self.owner.pk, lookup)
+        self.assertFalse(any('FROM "Api_user"' in query["sql"] for query in ctx.captured_queries))
+
+        self.assertEqual(
+            self.client.patch(f"/api/menu-items/{rival_item.pk}/", {"price": "1.00"}, format="json").status_code, 403
+        )
+        self.client.force_authenticate(self.customer)
+        self.assertEqual(
+            self.client.patch(f"/api/menu-items/{item.pk}/", {"price": "1.00"}, format="json").status_code, 403
+        )
+        self.assertEqual(self.client.get(f"/api/menu-items/{rival_item.pk}/").status_code, 200)
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(
+            self.client.patch(f"/api/menu-items/{rival_item.pk}/", {"price": "9.00"}, format="json").status_code, 200
+        )
+
+    def test_restaurant_writes_check_ownership_in_the_lookup(self):
+        self.client.force_authenticate(self.rival)
+        with self.assertQueryBudget(1):
+            response = self.client.patch(f"/api/restaurants/{self.restaurant.pk}/", {"name": "Mine now"}, format="json")
+        self.assertEqual(response.status_code, 403)
+        self.client.force_authenticate(self.owner)
+        response = self.client.patch(f"/api/restaurants/{self.restaurant.pk}/", {"name": "Renamed"}, format="json")
+        self.assertEqual(response.status_code, 200)
+
+    def test_writes_only_reference_the_callers_rows(self):
+        self.client.force_authenticate(self.owner)
+        response = self.client.post(
+            "/api/menu-items/", {"category": self.rival_category.pk, "name": "Sneaky", "price": "1.00"}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("category", response.data["errors"])
+        response = self.client.post(
+            "/api/menu-items/", {"category": self.category.pk, "name": "Special", "price": "1.00"}, format="json"
+        )
+        self.assertEqual(response.status_code, 201)
+
+        self.client.force_authenticate(self.other_customer)
+        payload = {"order": self.mine.pk, "menu_item": self.menu_items[0].pk, "quantity": 5, "price": "0.01"}
+        response = self.client.post("/api/order-items/", payload, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("order", response.data)
+
+    def test_async_views_apply_the_same_scope(self):
+        factory = APIRequestFactory()
+        for name, user, kwargs in [
+            ("OrderListCreateAPIView", self.owner, {}),
+            ("OrderListCreateAPIView", self.courier_user, {}),
+            ("OrderRetrieveUpdateDestroyAPIView", self.other_customer, {"pk": self.mine.pk}),
+            ("OrderRetrieveUpdateDestroyAPIView", self.owner, {"pk": self.mine.pk}),
+        ]:
+            with self.subTest(view=name, user=user.username):
+                responses = []
+                for view_class in (getattr(views, name), getattr(async_views, f"Async{name}")):
+                    request = factory.get("/api/orders/")
+                    force_authenticate(request, user)
+                    view = view_class.as_view()
+                    response = async_to_sync(view)(request, **kwargs) if view_class.view_is_async else view(request, **kwargs)
+                    responses.append((response.status_code, response.render().content))
+                self.assertEqual(responses[0], responses[1])
+
+
+class MenuFacetTests(QueryBudgetMixin, ApiTestData, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = cls.create_user("owner", "restaurant_owner")
+        cls.rival = cls.create_user("rival", "restaurant_owner")
+        cls.customer = cls.create_user("customer", "customer")
+        # Mains: 10.00-14.00; Drinks: 3.00, 7.00, 60.00
+        cls.restaurant, cls.mains, cls.main_items = cls.create_menu(cls.owner)
+        cls.drinks = MenuCategory.objects.create(restaurant=cls.restaurant, name="Drinks")
+        cls.drink_items = [
+            MenuItem.objects.create(category=cls.drinks, name=f"Drink {price}", price=Decimal(price))
+            for price in ("3.00", "7.00", "60.00")
+        ]
+        cls.rival_restaurant, cls.rival_category, cls.rival_items = cls.create_menu(cls.rival, name="Rival")
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.customer)
+
+    def get(self, **params):
+        response = self.client.get("/api/menu-items/", params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def item_ids(self, **params):
+        return {row["id"] for row in self.get(**params).data["results"]}
+
+    def test_filters_by_restaurant_category_and_price(self):
+        self.assertEqual(
+            self.item_ids(restaurant=self.restaurant.pk),
+            {item.pk for item in self.main_items + self.drink_items},
+        )
+        self.assertEqual(self.item_ids(category=self.drinks.pk), {item.pk for item in self.drink_items})
+        self.assertEqual(
+            self.item_ids(restaurant=self.restaurant.pk, min_price="7", max_price="11"),
+            {self.drink_items[1].pk, self.main_items[0].pk, self.main_items[1].pk},
+        )
+        self.assertEqual(
+            self.item_ids(category=f"{self.drinks.pk},{self.rival_category.pk}", max_price="10"),
+            {self.drink_items[0].pk, self.drink_items[1].pk, self.rival_items[0].pk},
+        )
+        self.assertNotIn("facets", self.get(restaurant=self.restaurant.pk).data)
+
+    def test_facets_come_from_one_extra_query(self):
+        with self.assertQueryBudget(2):
+            response = self.get(restaurant=self.restaurant.pk, category=self.drinks.pk, max_price="20", facets=1)
+        self.assertEqual(len(response.data["results"]), 2)
+        facets = response.data["facets"]
+        # Categories ignore ?category=, price buckets ignore the price range
+        self.assertEqual(facets["categories"], [
+            {"id": self.drinks.pk, "name": "Drinks", "count": 2},
+            {"id": self.mains.pk, "name": "Mains", "count": 5},
+        ])
+        self.assertEqual([(bucket["min"], bucket["max"], bucket["count"]) for bucket in facets["price"]], [
+            (None, "5.00", 1), ("5.00", "10.00", 1), ("10.00", "20.00", 0),
+            ("20.00", "50.00", 0), ("50.00", "100.00", 1), ("100.00", None, 0),
+        ])
+
+    @override_settings(MENU_FACETS={"PRICE_BUCKETS": [12]})
+    def test_price_buckets_come_from_settings(self):
+        facets = self.get(restaurant=self.restaurant.pk, facets="true").data["facets"]
+        self.assertEqual(facets["price"], [
+            {"min": None, "max": "12.00", "count": 4},
+            {"min": "12.00", "max": None, "count": 4},
+        ])
+
+    def test_bad_parameters_are_rejected(self):
+        for params in (
+            {"restaurant": "abc"}, {"category": "1,x"}, {"min_price": "cheap"}, {"min_price": "9", "max_price": "5"},
+            {"restaurant": "99999999999999999999999"}, {"category": "1,9223372036854775808"},
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get("/api/menu-items/", params).status_code, 400)
+
+    def test_async_view_returns_the_same_facets(self):
+        factory = APIRequestFactory()
+        path = f"/api/menu-items/?restaurant={self.restaurant.pk}&min_price=5&facets=1"
+        responses = []
+        for view_class in (views.MenuItemListCreateAPIView, async_views.AsyncMenuItemListCreateAPIView):
+            request = factory.get(path)
+            force_authenticate(request, self.customer)
+            view = view_class.as_view()
+            response = async_to_sync(view)(request) if view_class.view_is_async else view(request)
+            responses.append((response.status_code, response.render().content))
+        self.assertEqual(responses[0], responses[1])
+        self.assertIn(b'"facets"', responses[0][1])
+
+
+class ConditionalRequestTests(QueryBudgetMixin, ApiTestData, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = cls.create_user("owner", "restaurant_owner")
+        cls.customer = cls.create_user("customer", "customer")
+        cls.restaurant, cls.category, cls.menu_items = cls.create_menu(cls.owner, items=3)
+        cls.order = cls.create_order(cls.customer, cls.restaurant, cls.menu_items[:2])
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.customer)
+
+    def revalidate(self, path, response, **headers):
+        return self.client.get(path, HTTP_IF_NONE_MATCH=response["ETag"], **headers)
+
+    def test_unchanged_detail_is_a_304_without_serializing(self):
+        path = f"/api/menu-items/{self.menu_items[0].pk}/"
+        first = self.client.get(path)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn("Last-Modified", first)
+
+        with mock.patch("Api.readers.RowReader.serialize_row") as serialize_row:
+            response = self.revalidate(path, first)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["ETag"], first["ETag"])
+        serialize_row.assert_not_called()
+        self.assertEqual(self.client.get(path, HTTP_IF_MODIFIED_SINCE=first["Last-Modified"]).status_code, 304)
+
+        self.menu_items[0].price = Decimal("99.00")
+        self.menu_items[0].save(update_fields=["price"])
+        response = self.revalidate(path, first)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], first["ETag"])
+
+    def test_list_pages_revalidate_on_their_rows(self):
+        path = "/api/menu-items/?ordering=price"
+        first = self.client.get(path)
+        with self.assertQueryBudget(1):
+            self.assertEqual(self.revalidate(path, first).status_code, 304)
+        # A different filter is a different representation
+        self.assertEqual(self.revalidate("/api/menu-items/?ordering=-price", first).status_code, 200)
+
+        MenuItem.objects.filter(pk=self.menu_items[2].pk).delete()
+        second = self.revalidate(path, first)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(len(second.data["results"]), 2)
+        self.assertEqual(self.revalidate(path, second).status_code, 304)
+        self.assertNotIn("ETag", self.client.get("/api/menu-items/?facets=1"))
+
+    def test_order_etag_follows_its_items_and_their_menu_items(self):
+        path = f"/api/orders/{self.order.pk}/"
+        etags = [self.client.get(path)["ETag"]]
+
+        self.menu_items[0].name = "Renamed"
+        self.menu_items[0].save()
+        etags.append(self.client.get(path)["ETag"])
+        OrderItem.objects.create(order=self.order, menu_item=self.menu_items[2], quantity=1, price=Decimal("12.00"))
+        etags.append(self.client.get(path)["ETag"])
+        self.assertEqual(len(set(etags)), 3)
+
+        listed = self.client.get("/api/orders/")
+        self.assertEqual(self.revalidate("/api/orders/", listed).status_code, 304)
+
+    def test_if_match_guards_writes(self):
+        self.client.force_authenticate(self.owner)
+        path = f"/api/restaurants/{self.restaurant.pk}/"
+        etag = self.client.get(path)["ETag"]
+
+        response = self.client.patch(path, {"name": "First"}, format="json", HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        # A second client still holding the old ETag loses
+        response = self.client.patch(path, {"name": "Second"}, format="json", HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+        self.restaurant.refresh_from_db()
+        self.assertEqual(self.restaurant.name, "First")
+
+        fresh = self.client.get(path)["ETag"]
+        self.assertNotEqual(fresh, etag)
+        self.assertEqual(self.client.patch(path, {"name": "Third"}, format="json", HTTP_IF_MATCH=fresh).status_code, 200)
+        self.assertEqual(self.client.patch(path, {"name": "Fourth"}, format="json", HTTP_IF_MATCH="*").status_code, 200)
+
+    def test_if_match_accepts_etags_from_any_shape_of_the_row(self):
+        path = f"/api/orders/{self.order.pk}/"
+        seen = set()
+        for params in ({"fields": "id,status"}, {"expand": "restaurant"}, {"history": 1}):
+            with self.subTest(params=params):
+                etag = self.client.get(path, params)["ETag"]
+                seen.add(etag)
+                response = self.client.patch(path, {"status": "PENDING"}, format="json", HTTP_IF_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                # The write bumped updated_at, so the same ETag is now stale
+                response = self.client.patch(path, {"status": "PENDING"}, format="json", HTTP_IF_MATCH=etag)
+                self.assertEqual(response.status_code, 412)
+        self.assertEqual(len(seen), 3)
+        etag = self.client.get(path)["ETag"]
+        self.assertEqual(self.client.patch(path, {}, format="json", HTTP_IF_MATCH=f"W/{etag}").status_code, 412)
+
+    def call(self, view_class, path, headers=None, **kwargs):
+        request = APIRequestFactory().get(path, **(headers or {}))
+        force_authenticate(request, self.customer)
+        view = view_class.as_view()
+        return async_to_sync(view)(request, **kwargs) if view_class.view_is_async else view(request, **kwargs)
+
+    def test_async_views_send_the_same_validators(self):
+        for view_class, path, kwargs in [
+            (views.MenuItemRetrieveUpdateDestroyAPIView, "/api/menu-items/1/", {"pk": self.menu_items[0].pk}),
+            (views.OrderListCreateAPIView, "/api/orders/", {}),
+        ]:
+            native = getattr(async_views, f"Async{view_class.__name__}")
+            etag = self.call(view_class, path, **kwargs)["ETag"]
+            self.assertEqual(self.call(native, path, **kwargs)["ETag"], etag)
+            response = self.call(native, path, {"HTTP_IF_NONE_MATCH": etag}, **kwargs)
+            self.assertEqual(response.status_code, 304)
+
+
+class ResponseShapeTests(QueryBudgetMixin, ApiTestData, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = cls.create_user("owner", "restaurant_owner")
+        cls.customer = cls.create_user("customer", "customer")
+        cls.restaurant, cls.category, cls.menu_items = cls.create_menu(cls.owner, items=12)
+        cls.orders = [cls.create_order(cls.customer, cls.restaurant, cls.menu_items[:3]) for _ in range(3)]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.customer)
+
+    def get(self, path, **params):
+        response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_sparse_order_list_skips_the_items(self):
+        with self.assertQueryBudget(1) as ctx:
+            response = self.get("/api/orders/", fields="id,status,total_price")
+        self.assertEqual([set(row) for row in response.data["results"]], [{"id", "status", "total_price"}] * 3)
+        self.assertNotIn("api_orderitem", ctx.captured_queries[0]["sql"])
+        self.assertEqual(
+            [set(row) for row in self.get("/api/orders/", fields="id", history=1).data["results"]], [{"id"}] * 3
+        )
+
+    def test_nested_fields_only_join_what_they_render(self):
+        with self.assertQueryBudget(2) as ctx:
+            response = self.get("/api/orders/", fields="id,order_items.quantity")
+        self.assertEqual(response.data["results"][0]["order_items"], [{"quantity": 1}] * 3)
+        self.assertNotIn("api_menuitem", ctx.captured_queries[1]["sql"])
+
+        order = self.get(f"/api/orders/{self.orders[0].pk}/", fields="order_items.menu_item.name,status").data
+        self.assertEqual(order, {
+            "order_items": [{"menu_item": {"name": item.name}} for item in self.menu_items[:3]],
+            "status": "PENDING",
+        })
+
+    def test_expand_nests_related_objects_without_extra_queries(self):
+        with self.assertQueryBudget(2):
+            response = self.get("/api/orders/", expand="restaurant,order_items.menu_item.category")
+        order = response.data["results"][0]
+        self.assertEqual(order["restaurant"]["owner"], "owner")
+        self.assertEqual(order["order_items"][0]["menu_item"]["category"]["name"], "Mains")
+        self.assertEqual(order["order_items"][0]["order"], self.orders[0].pk)
+
+        self.client.force_authenticate(self.owner)
+        path = f"/api/menu-items/{self.menu_items[0].pk}/"
+        with self.assertQueryBudget(1):
+            item = self.get(path, fields="id,category", expand="category.restaurant").data
+        self.assertEqual(item["category"]["restaurant"]["name"], self.restaurant.name)
+        # The ETag covers the expanded rows, and differs from the plain representation's
+        etag = self.get(path, expand="category")["ETag"]
+        self.assertNotEqual(etag, self.get(path)["ETag"])
+        self.category.name = "Specials"
+        self.category.save()
+        self.assertNotEqual(self.get(path, expand="category")["ETag"], etag)
+
+    def test_fast_read_path_selects_only_the_requested_columns(self):
+        self.client.force_authenticate(self.owner)
+        params = {"fields": "id,price", "ordering": "-name"}
+        with self.assertQueryBudget(1) as ctx:
+            fast = self.get("/api/menu-items/", **params)
+        self.assertNotIn("description", ctx.captured_queries[0]["sql"])
+        with override_settings(FAST_READ_PATH=False):
+            slow = self.get("/api/menu-items/", **params)
+        self.assertEqual(fast.content, slow.content)
+        self.assertEqual([set(row) for row in fast.data["results"]], [{"id", "price"}] * 10)
+
+        # The cursor still works without the ordering column in the output
+        second = self.client.get(fast.data["next"])
+        self.assertEqual(len(second.data["results"]), 2)
+        self.assertEqual(self.get(f"/api/restaurants/{self.restaurant.pk}/", fields="name").data, {"name": self.restaurant.name})
+
+    def test_writes_return_the_full_representation(self):
+        self.client.force_authenticate(self.owner)
+        response = self.client.patch(
+            f"/api/restaurants/{self.restaurant.pk}/?fields=id", {"name": "Renamed"}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["data"]["name"], "Renamed")
+        self.assertIn("address", response.data["data"])
+
+    def test_async_views_shape_the_same_way(self):
+        request = APIRequestFactory().get("/api/orders/", {"fields": "id,order_items.price", "expand": "restaurant"})
+        force_authenticate(request, self.customer)
+        native = async_to_sync(async_views.AsyncOrderListCreateAPIView.as_view())(request)
+        request = APIRequestFactory().get("/api/orders/", {"fields": "id,order_items.price", "expand": "restaurant"})
+        force_authenticate(request, self.customer)
+        sync = views.OrderListCreateAPIView.as_view()(request)
+        self.assertEqual(native.data, sync.data)
+        self.assertEqual(set(native.data["results"][0]), {"id", "order_items"})
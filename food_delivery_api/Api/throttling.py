@@ -0,0 +1,211 @@
+import math
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.throttling import BaseThrottle
+
+
+# Rate limiting for every DRF view. RoleRateThrottle counts each request
+# against its role's limit, per user (or per client IP when anonymous);
+# EndpointRateThrottle adds the limits of the view's `throttle_scope`
+# (login, register, order creation). Both use sliding-window counters: the
+# estimate is this window's count plus the previous window's count weighted
+# by how much of it still overlaps the sliding window. A key is two integers
+# and a check is O(1), with no per-request timestamps.
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def rate_limit_settings():
+    options = {
+        "ENABLED": True,
+        "BACKEND": "memory",
+        "CACHE": "default",
+        "ROLES": {},
+        "SCOPES": {},
+        "MAX_KEYS": 100000,
+    }
+    options.update(getattr(settings, 'RATE_LIMITS', None) or {})
+    return options
+
+
+@lru_cache(maxsize=None)
+def parse_rate(rate):
+    """'10/m' -> (10, 60), '100/15m' -> (100, 900); None means no limit."""
+    if rate is None:
+        return None
+    try:
+        count, period = rate.split("/")
+        count, multiple, unit = int(count), int(period[:-1] or 1), period[-1]
+        seconds = multiple * PERIODS[unit]
+    except (ValueError, KeyError, IndexError):
+        raise ImproperlyConfigured(f"Invalid rate {rate!r}; expected e.g. '10/m' or '100/15m'")
+    if count < 1 or seconds < 1:
+        raise ImproperlyConfigured(f"Invalid rate {rate!r}; use None for no limit")
+    return count, seconds
+
+
+def retry_after(previous, current, limit, elapsed, period):
+    """
+    Seconds until one more request fits, or 0 if it fits now. `elapsed` is
+    the fraction of the current window that has passed.
+    """
+    if previous * (1 - elapsed) + current + 1 <= limit:
+        return 0
+    if current + 1 <= limit:
+        # Fits later in this window, once enough of the previous one slides out
+        return max((1 - (limit - 1 - current) / previous - elapsed) * period, 0.001)
+    # Not before the next window, where this window's count is the previous one
+    return (1 - elapsed + max(0.0, 1 - (limit - 1) / current)) * period
+
+
+class MemoryBackend:
+    """Counters shared by the threads of this process."""
+
+    blocking = False
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, period, now):
+        window, offset = divmod(now, period)
+        window = int(window)
+        with self._lock:
+            entry = self._counters.get(key)
+            if entry is None or entry[0] < window - 1:
+                previous = current = 0
+            elif entry[0] == window - 1:
+                previous, current = entry[1], 0
+            else:
+                previous, current = entry[2], entry[1]
+
+            wait = retry_after(previous, current, limit, offset / period, period)
+            if wait:
+                return wait
+            if entry is None and len(self._counters) >= self.max_keys:
+                self.evict(now)
+            # (window, count, previous window's count, expiry)
+            self._counters[key] = (window, current + 1, previous, (window + 2) * period)
+        return 0
+
+    def evict(self, now):
+        # Forgetting a counter can only let requests through, never block them
+        expired = [key for key, entry in self._counters.items() if entry[3] <= now]
+        for key in expired:
+            del self._counters[key]
+        if len(self._counters) >= self.max_keys:
+            for key in list(self._counters)[:len(self._counters) // 2]:
+                del self._counters[key]
+
+
+class CacheBackend:
+    """Counters in a Django cache, shared by every process using it."""
+
+    blocking = True
+
+    def __init__(self, alias="default"):
+        self.alias = alias
+
+    def hit(self, key, limit, period, now):
+        cache = caches[self.alias]
+        window, offset = divmod(now, period)
+        window = int(window)
+        current_key, previous_key = f"{key}:{window}", f"{key}:{window - 1}"
+
+        counts = cache.get_many([current_key, previous_key])
+        wait = retry_after(counts.get(previous_key, 0), counts.get(current_key, 0), limit, offset / period, period)
+        if wait:
+            return wait
+        try:
+            cache.incr(current_key)
+        except ValueError:
+            # First request of the window; a concurrent first request may win the add
+            if not cache.add(current_key, 1, timeout=2 * period + 1):
+                cache.incr(current_key)
+        return 0
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                options = rate_limit_settings()
+                if options["BACKEND"] == "memory":
+                    _backend = MemoryBackend(options["MAX_KEYS"])
+                elif options["BACKEND"] == "cache":
+                    _backend = CacheBackend(options["CACHE"])
+                else:
+                    raise ImproperlyConfigured(f"Unknown RATE_LIMITS BACKEND {options['BACKEND']!r}")
+    return _backend
+
+
+def reset_backend():
+    global _backend
+    with _backend_lock:
+        _backend = None
+
+
+def view_scope(view, method):
+    # `throttle_scope` is a scope name, or a {method: scope name} dict
+    scope = getattr(view, 'throttle_scope', None)
+    if isinstance(scope, dict):
+        return scope.get(method)
+    return scope
+
+
+class RateLimitThrottle(BaseThrottle):
+    wait_seconds = 0
+
+    @property
+    def blocking(self):
+        # Whether a check may wait on I/O (async views run those in a thread)
+        return get_backend().blocking
+
+    def get_rate(self, options, request, view, role):
+        """Return (counter name, rate string or None)."""
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        options = rate_limit_settings()
+        if not options["ENABLED"]:
+            return True
+        user = request.user
+        authenticated = user is not None and user.is_authenticated
+        role = getattr(user, 'role', None) if authenticated else "anon"
+
+        name, rate = self.get_rate(options, request, view, role)
+        limit = parse_rate(rate)
+        if limit is None:
+            return True
+        # Users by id, anonymous clients by IP (honours NUM_PROXIES)
+        ident = f"u{user.pk}" if authenticated else f"ip{self.get_ident(request)}"
+        self.wait_seconds = get_backend().hit(f"ratelimit:{name}:{ident}", *limit, time.time())
+        return not self.wait_seconds
+
+    def wait(self):
+        return math.ceil(self.wait_seconds)
+
+
+class RoleRateThrottle(RateLimitThrottle):
+    def get_rate(self, options, request, view, role):
+        return "role", options["ROLES"].get(role)
+
+
+class EndpointRateThrottle(RateLimitThrottle):
+    def get_rate(self, options, request, view, role):
+        scope = view_scope(view, request.method)
+        if scope is None:
+            return scope, None
+        rates = options["SCOPES"].get(scope, {})
+        return scope, rates.get(role, rates.get("*"))
@@ -1,19 +1,31 @@
+from django.conf import settings
 from django.urls import path
-from rest_framework_simplejwt.views import (
-    TokenObtainPairView,
-    TokenRefreshView,
-)
+from rest_framework_simplejwt.views import TokenRefreshView
 from .views import (
     RestaurantListCreateAPIView, RestaurantRetrieveUpdateDestroyAPIView,
     MenuCategoryListCreateAPIView,
     MenuItemListCreateAPIView, MenuItemRetrieveUpdateDestroyAPIView,
     OrderItemListCreateAPIView,
-    OrderListCreateAPIView, OrderRetrieveUpdateDestroyAPIView, RegisterAPIView, LoginAPIView, LogoutAPIView
+    OrderListCreateAPIView, OrderRetrieveUpdateDestroyAPIView, RegisterAPIView, LoginAPIView, LogoutAPIView,
+    CheckoutAPIView, RestaurantMenuAPIView, OrderStreamAPIView,
+    RestaurantRevenueAPIView, RestaurantOrderStatusAPIView, RestaurantTopItemsAPIView,
+    MenuImportAPIView, MenuExportAPIView, OrderExportAPIView,
+    CourierAPIView, CourierDeliveredAPIView, TokenObtainAPIView
 )
 
+if getattr(settings, 'ASYNC_VIEWS', False):
+    from .async_views import (  # noqa: F811
+        AsyncRestaurantListCreateAPIView as RestaurantListCreateAPIView,
+        AsyncRestaurantRetrieveUpdateDestroyAPIView as RestaurantRetrieveUpdateDestroyAPIView,
+        AsyncMenuItemListCreateAPIView as MenuItemListCreateAPIView,
+        AsyncMenuItemRetrieveUpdateDestroyAPIView as MenuItemRetrieveUpdateDestroyAPIView,
+        AsyncOrderListCreateAPIView as OrderListCreateAPIView,
+        AsyncOrderRetrieveUpdateDestroyAPIView as OrderRetrieveUpdateDestroyAPIView,
+    )
+
 
 urlpatterns = [
-    path('auth/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('auth/token/', TokenObtainAPIView.as_view(), name='token_obtain_pair'),
     path('auth/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
 
     
@@ -24,6 +36,15 @@ urlpatterns = [
     # Restaurants
     path("restaurants/", RestaurantListCreateAPIView.as_view()),
     path("restaurants/<int:pk>/", RestaurantRetrieveUpdateDestroyAPIView.as_view()),
+    path("restaurants/<int:pk>/menu/", RestaurantMenuAPIView.as_view()),
+    path("restaurants/<int:pk>/menu/import/", MenuImportAPIView.as_view()),
+    path("restaurants/<int:pk>/menu/export/", MenuExportAPIView.as_view()),
+    path("restaurants/<int:pk>/orders/export/", OrderExportAPIView.as_view()),
+
+    # Analytics
+    path("restaurants/<int:pk>/analytics/revenue/", RestaurantRevenueAPIView.as_view()),
+    path("restaurants/<int:pk>/analytics/status/", RestaurantOrderStatusAPIView.as_view()),
+    path("restaurants/<int:pk>/analytics/top-items/", RestaurantTopItemsAPIView.as_view()),
 
     # Categories
     path("categories/", MenuCategoryListCreateAPIView.as_view()),
@@ -35,7 +56,15 @@ urlpatterns = [
     # OrderItems
     path("order-items/", OrderItemListCreateAPIView.as_view()),
     path("orders/", OrderListCreateAPIView.as_view()),
+    path("orders/stream/", OrderStreamAPIView.as_view()),
 
     #Orders
     path("orders/<int:pk>/", OrderRetrieveUpdateDestroyAPIView.as_view()),
+
+    # Couriers
+    path("couriers/me/", CourierAPIView.as_view()),
+    path("couriers/me/orders/<int:pk>/delivered/", CourierDeliveredAPIView.as_view()),
+
+    # Checkout
+    path("checkout/", CheckoutAPIView.as_view()),
 ]
\ No newline at end of file
@@ -1,26 +1,56 @@
 from rest_framework import generics, status, permissions
-from rest_framework_simplejwt.tokens import RefreshToken
+from .authentication import RoleRefreshToken
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from .permissions import IsAdmin, IsRestaurantOwner, IsCustomer, IsOwnerOrReadOnly
+from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework_simplejwt.views import TokenObtainPairView
+from .permissions import IsAdmin, IsRestaurantOwner, IsCustomer, IsCourier, IsOwnerOrReadOnly
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
-
-from .models import Restaurant, MenuCategory, MenuItem, Order, OrderItem
+from django.db.models import Q, Sum
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from datetime import timedelta
+
+from .models import Restaurant, MenuCategory, MenuItem, Order, OrderItem, Courier, DailyOrderRollup, DailyMenuItemRollup
 from .serializers import (
     RestaurantSerializer,
     MenuCategorySerializer,
     MenuItemSerializer,
     OrderSerializer,
-    OrderItemSerializer
+    OrderItemSerializer,
+    CheckoutSerializer,
+    CourierSerializer
 )
 from .serializers import RegisterSerializer, LoginSerializer
+from .menu import get_menu_snapshot
+from .search import FullTextSearchFilter, SearchRankOrderingFilter
+from .geo import NearbyFilter
+from .facets import FacetedListMixin, MenuFacetFilter, parse_id
+from .events import order_event_stream, publish_order_status
+from . import bulk
+from .readers import FastReadMixin, MENU_ITEM_READER, RESTAURANT_READER
+from .instrumentation import InstrumentedViewMixin
+from .idempotency import IdempotentViewMixin
+from .archive import OrderHistoryMixin
+from .scoping import ScopedQuerysetMixin
+from .conditional import ConditionalViewMixin, etag_matches
+# Querysets shared by list and detail views, shaped by ?fields=/?expand=
+from .fieldsets import (
+    ShapedViewMixin, restaurant_queryset, menu_category_queryset, menu_item_queryset,
+    order_item_queryset, order_queryset,
+)
 
 
-
-class RegisterAPIView(generics.GenericAPIView):
+class RegisterAPIView(InstrumentedViewMixin, generics.GenericAPIView):
     serializer_class = RegisterSerializer
     permission_classes = [AllowAny]
+    throttle_scope = 'register'
 
     def post(self, request):
         serializer = self.get_serializer(data=request.data)
@@ -40,16 +70,17 @@ class RegisterAPIView(generics.GenericAPIView):
 
 
 # USER LOGIN
-class LoginAPIView(generics.GenericAPIView):
+class LoginAPIView(InstrumentedViewMixin, generics.GenericAPIView):
     serializer_class = LoginSerializer
     permission_classes = [AllowAny]
+    throttle_scope = 'login'
 
     def post(self, request):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         user = serializer.validated_data["user"]
 
-        refresh = RefreshToken.for_user(user)
+        refresh = RoleRefreshToken.for_user(user)
         access = str(refresh.access_token)
 
         return Response({
@@ -65,26 +96,33 @@ class LoginAPIView(generics.GenericAPIView):
 
 
 
+#JWT pair from username/password; runs the password hasher like login
+class TokenObtainAPIView(TokenObtainPairView):
+    throttle_scope = 'login'
+
+
 # USER LOGOUT
-class LogoutAPIView(generics.GenericAPIView):
+class LogoutAPIView(InstrumentedViewMixin, generics.GenericAPIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
         try:
             refresh_token = request.data["refresh"]
-            token = RefreshToken(refresh_token)
+            token = RoleRefreshToken(refresh_token)
             token.blacklist()
             return Response({"message": "Logged out successfully"}, status=status.HTTP_200_OK)
         except Exception:
             return Response({"error": "Invalid token"}, status=status.HTTP_400_BAD_REQUEST)
         
 #List & create restaurants
-class RestaurantListCreateAPIView(generics.ListCreateAPIView):
-    queryset = Restaurant.objects.all()
+class RestaurantListCreateAPIView(InstrumentedViewMixin, IdempotentViewMixin, FastReadMixin, ConditionalViewMixin, ShapedViewMixin, generics.ListCreateAPIView):
+    queryset = restaurant_queryset()
+    shaped_queryset = staticmethod(restaurant_queryset)
     serializer_class = RestaurantSerializer
+    row_reader = RESTAURANT_READER
     permission_classes = [IsAuthenticated, IsRestaurantOwner]
 
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, NearbyFilter, SearchRankOrderingFilter]
 
     filterset_fields = ['name']
 
@@ -111,9 +149,12 @@ class RestaurantListCreateAPIView(generics.ListCreateAPIView):
         )
 
 #Update or destroy restaurants created
-class RestaurantRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Restaurant.objects.all()
+class RestaurantRetrieveUpdateDestroyAPIView(InstrumentedViewMixin, ScopedQuerysetMixin, FastReadMixin, ConditionalViewMixin, ShapedViewMixin, generics.RetrieveUpdateDestroyAPIView):
+    queryset = restaurant_queryset()
+    shaped_queryset = staticmethod(restaurant_queryset)
+    private = False
     serializer_class = RestaurantSerializer
+    row_reader = RESTAURANT_READER
     permission_classes = [permissions.IsAuthenticated, IsRestaurantOwner, IsOwnerOrReadOnly,]
 
     def update(self, request, *args, **kwargs):
@@ -144,9 +185,26 @@ class RestaurantRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIVi
             status=status.HTTP_204_NO_CONTENT
         )
     
+#Full menu document for a restaurant, served from the menu cache
+class RestaurantMenuAPIView(InstrumentedViewMixin, generics.GenericAPIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        snapshot = get_menu_snapshot(pk)
+        if snapshot is None:
+            return Response({"status": "error", "message": "Restaurant not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        headers = {"ETag": snapshot["etag"]}
+        if etag_matches(request, snapshot["etag"]):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(snapshot["document"], headers=headers)
+
+
 #MenuCategory views
-class MenuCategoryListCreateAPIView(generics.ListCreateAPIView):
-    queryset = MenuCategory.objects.all()
+class MenuCategoryListCreateAPIView(InstrumentedViewMixin, IdempotentViewMixin, ConditionalViewMixin, ShapedViewMixin, generics.ListCreateAPIView):
+    queryset = menu_category_queryset()
+    shaped_queryset = staticmethod(menu_category_queryset)
+    etag_embeds = ['restaurant']
     serializer_class = MenuCategorySerializer
     permission_classes = [IsAuthenticated, IsAdmin]
 
@@ -180,12 +238,18 @@ class MenuCategoryListCreateAPIView(generics.ListCreateAPIView):
         )
 
 #Create a menu item
-class MenuItemListCreateAPIView(generics.ListCreateAPIView):
-    queryset = MenuItem.objects.all()
+class MenuItemListCreateAPIView(InstrumentedViewMixin, IdempotentViewMixin, ScopedQuerysetMixin, FacetedListMixin, FastReadMixin, ConditionalViewMixin, ShapedViewMixin, generics.ListCreateAPIView):
+    queryset = menu_item_queryset()
+    shaped_queryset = staticmethod(menu_item_queryset)
+    etag_embeds = ['category', 'category__restaurant']
+    private = False
+    # New items only go into the owner's own categories
+    scoped_fields = ['category']
     serializer_class = MenuItemSerializer
+    row_reader = MENU_ITEM_READER
     permission_classes = [IsAuthenticated, IsRestaurantOwner]
 
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, MenuFacetFilter, SearchRankOrderingFilter]
 
     search_fields = ["name", "description"]
     ordering_fields = ["price", "name"]
@@ -217,23 +281,35 @@ class MenuItemListCreateAPIView(generics.ListCreateAPIView):
 
 
 #Update or destroy menu items created
-class MenuItemRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = MenuItem.objects.all()
+class MenuItemRetrieveUpdateDestroyAPIView(InstrumentedViewMixin, ScopedQuerysetMixin, FastReadMixin, ConditionalViewMixin, ShapedViewMixin, generics.RetrieveUpdateDestroyAPIView):
+    queryset = menu_item_queryset()
+    shaped_queryset = staticmethod(menu_item_queryset)
+    etag_embeds = ['category', 'category__restaurant']
+    private = False
     serializer_class = MenuItemSerializer
+    row_reader = MENU_ITEM_READER
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrReadOnly]
 
 
 #Create an order 
-class OrderItemListCreateAPIView(generics.ListCreateAPIView):
-    queryset = OrderItem.objects.all()
+class OrderItemListCreateAPIView(InstrumentedViewMixin, IdempotentViewMixin, ScopedQuerysetMixin, ShapedViewMixin, generics.ListCreateAPIView):
+    queryset = order_item_queryset()
+    shaped_queryset = staticmethod(order_item_queryset)
+    scoped_fields = ['order']
     serializer_class = OrderItemSerializer
     permission_classes = [IsCustomer]
 
+# Rows an order can embed; only the ones the request's shape loaded count
+ORDER_EMBEDS = ['order_items__menu_item', 'order_items__menu_item__category', 'restaurant']
+
 #OrderList views
-class OrderListCreateAPIView(generics.ListCreateAPIView):
-    queryset = Order.objects.all()
+class OrderListCreateAPIView(InstrumentedViewMixin, IdempotentViewMixin, ScopedQuerysetMixin, OrderHistoryMixin, ConditionalViewMixin, ShapedViewMixin, generics.ListCreateAPIView):
+    queryset = order_queryset()
+    shaped_queryset = staticmethod(order_queryset)
     serializer_class = OrderSerializer
+    etag_embeds = ORDER_EMBEDS
     permission_classes = [IsCustomer]
+    throttle_scope = {'POST': 'orders'}
 
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
 
@@ -267,17 +343,29 @@ class OrderListCreateAPIView(generics.ListCreateAPIView):
 
 
 #Update or destroy an order
-class OrderRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Order.objects.all()
+class OrderRetrieveUpdateDestroyAPIView(InstrumentedViewMixin, ScopedQuerysetMixin, OrderHistoryMixin, ConditionalViewMixin, ShapedViewMixin, generics.RetrieveUpdateDestroyAPIView):
+    queryset = order_queryset()
+    shaped_queryset = staticmethod(order_queryset)
     serializer_class = OrderSerializer
+    etag_embeds = ORDER_EMBEDS
+    # Rollup deltas (Api/analytics.py) are taken from the status the row was
+    # loaded with, so concurrent writes must not both load the same one
+    lock_writes = True
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrReadOnly]
 
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
         serializer = self.get_serializer(instance, data=request.data, partial=True)
 
+        previous_status = instance.status
+
         if serializer.is_valid():
             serializer.save()
+            if instance.status != previous_status:
+                publish_order_status(instance, previous_status)
+            # Drop the prefetched order_items so the response reflects the save
+            if getattr(instance, '_prefetched_objects_cache', None):
+                instance._prefetched_objects_cache = {}
             return Response(
                 {
                     "message": "Order updated successfully",
@@ -293,5 +381,290 @@ class OrderRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
         )
 
 
+#Live order status updates (server-sent events) for customers and restaurant owners
+class OrderStreamAPIView(InstrumentedViewMixin, generics.GenericAPIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        # The stream never ends; under WSGI Django would buffer it forever and hang the worker
+        if not isinstance(request._request, ASGIRequest):
+            return Response(
+                {"status": "error", "message": "Order streams are only served over ASGI (asgi.py)"},
+                status=status.HTTP_501_NOT_IMPLEMENTED
+            )
+        order_id = request.query_params.get("order")
+        try:
+            order_id = parse_id(order_id, "order") if order_id is not None else None
+        except ValidationError:
+            return Response({"status": "error", "message": "order must be an id"}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(
+            order_event_stream(
+                request.user.pk,
+                order_id=order_id,
+                heartbeat=getattr(settings, "ORDER_EVENTS_HEARTBEAT", 15),
+            ),
+            content_type="text/event-stream",
+        )
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+
+#The signed-in courier's location and availability, polled by the dispatcher
+class CourierAPIView(InstrumentedViewMixin, generics.GenericAPIView):
+    serializer_class = CourierSerializer
+    permission_classes = [IsAuthenticated, IsCourier]
+
+    def get_object(self):
+        courier, _ = Courier.objects.get_or_create(user=self.request.user)
+        return courier
+
+    def get(self, request):
+        return Response(self.get_serializer(self.get_object()).data)
+
+    def patch(self, request):
+        serializer = self.get_serializer(self.get_object(), data=request.data, partial=True)
+
+        if serializer.is_valid():
+            serializer.save(last_seen=timezone.now())
+            return Response(
+                {
+                    "message": "Courier updated successfully",
+                    "status": "success",
+                    "data": serializer.data
+                },
+                status=status.HTTP_200_OK
+            )
+
+        return Response(
+            {"status": "error", "errors": serializer.errors},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+
+#Courier hands an assigned order to the customer
+class CourierDeliveredAPIView(InstrumentedViewMixin, generics.GenericAPIView):
+    permission_classes = [IsAuthenticated, IsCourier]
+
+    def post(self, request, pk):
+        order = get_object_or_404(Order.objects.select_related('restaurant'), pk=pk, courier__user=request.user)
+        if order.status != 'OUT_FOR_DELIVERY':
+            return Response(
+                {"status": "error", "message": f"Order is {order.status}, not out for delivery"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        order.status = 'DELIVERED'
+        order.save(update_fields=['status'])
+        publish_order_status(order, 'OUT_FOR_DELIVERY')
+        return Response(
+            {
+                "message": "Order delivered",
+                "status": "success",
+                "data": OrderSerializer(order_queryset().get(pk=pk), context=self.get_serializer_context()).data
+            },
+            status=status.HTTP_200_OK
+        )
+
+
+#Place an order with all of its items in one request
+class CheckoutAPIView(InstrumentedViewMixin, IdempotentViewMixin, generics.GenericAPIView):
+    serializer_class = CheckoutSerializer
+    permission_classes = [IsAuthenticated, IsCustomer]
+    throttle_scope = 'orders'
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+
+        if serializer.is_valid():
+            order = serializer.save(customer=request.user)
+            order = order_queryset().get(pk=order.pk)
+            return Response(
+                {
+                    "message": "Order placed successfully",
+                    "status": "success",
+                    "data": OrderSerializer(order, context=self.get_serializer_context()).data
+                },
+                status=status.HTTP_201_CREATED
+            )
+
+        return Response(
+            {"status": "error", "errors": serializer.errors},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+
+#Base for endpoints under restaurants/<pk>/ that only its owner (or an admin) may use
+class RestaurantOwnerAPIView(InstrumentedViewMixin, generics.GenericAPIView):
+    permission_classes = [IsAuthenticated]
+    owner_only_message = "Only the restaurant owner can do this"
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        restaurant = get_object_or_404(Restaurant.objects.only('id', 'owner_id'), pk=kwargs['pk'])
+        if request.user.role != 'admin' and restaurant.owner_id != request.user.pk:
+            self.permission_denied(request, message=self.owner_only_message)
+        self.restaurant = restaurant
+
+
+#Restaurant sales dashboards, served from the daily rollup tables
+class RestaurantAnalyticsAPIView(RestaurantOwnerAPIView):
+    owner_only_message = "Only the restaurant owner can view its analytics"
+    default_days = 30
+    # Longest ?from=..?to= span; the rollups hold one row per day
+    max_days = 366
+
+    def parse_day(self, name):
+        value = self.request.query_params.get(name, "")
+        try:
+            day = parse_date(value)
+        except ValueError:
+            # Well-formed but not a real date, like 2024-13-45
+            day = None
+        if value and day is None:
+            raise ValidationError({name: ["Use a date like 2024-01-31."]})
+        return day
+
+    def get_date_range(self):
+        end = self.parse_day("to") or timezone.localdate()
+        start = self.parse_day("from") or end - timedelta(days=self.default_days - 1)
+        if start > end:
+            raise ValidationError({"from": ["from is after to."]})
+        if (end - start).days >= self.max_days:
+            raise ValidationError({"from": [f"Ask for at most {self.max_days} days at a time."]})
+        return start, end
+
+    def get_rollups(self, model):
+        start, end = self.get_date_range()
+        return model.objects.filter(restaurant=self.restaurant, day__range=(start, end))
+
+    def wrap(self, data):
+        start, end = self.get_date_range()
+        return Response({
+            "restaurant": self.restaurant.pk,
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            **data,
+        })
+
+
+def money(value):
+    return f"{value or 0:.2f}"
+
+
+class RestaurantRevenueAPIView(RestaurantAnalyticsAPIView):
+    def get(self, request, pk):
+        rows = (
+            self.get_rollups(DailyOrderRollup)
+            .values('day')
+            .annotate(orders=Sum('order_count'), revenue=Sum('revenue', filter=~Q(status='CANCELLED')))
+            .order_by('day')
+        )
+        return self.wrap({
+            "days": [
+                {"day": row["day"].isoformat(), "orders": row["orders"], "revenue": money(row["revenue"])}
+                for row in rows
+            ]
+        })
+
+
+class RestaurantOrderStatusAPIView(RestaurantAnalyticsAPIView):
+    def get(self, request, pk):
+        counts = dict.fromkeys((choice for choice, _ in Order.STATUS_CHOICES), 0)
+        rows = self.get_rollups(DailyOrderRollup).values('status').annotate(orders=Sum('order_count')).order_by()
+        for row in rows:
+            counts[row["status"]] = row["orders"]
+        return self.wrap({"counts": counts})
+
+
+class RestaurantTopItemsAPIView(RestaurantAnalyticsAPIView):
+    def get(self, request, pk):
+        try:
+            limit = min(max(int(request.query_params.get("limit", 10)), 1), 100)
+        except ValueError:
+            limit = 10
+        rows = (
+            self.get_rollups(DailyMenuItemRollup)
+            .values('menu_item_id', 'menu_item__name')
+            .annotate(quantity=Sum('quantity'), revenue=Sum('revenue'))
+            .filter(quantity__gt=0)
+            .order_by('-quantity', '-revenue', 'menu_item_id')[:limit]
+        )
+        return self.wrap({
+            "items": [
+                {
+                    "menu_item": row["menu_item_id"],
+                    "name": row["menu_item__name"],
+                    "quantity": row["quantity"],
+                    "revenue": money(row["revenue"]),
+                }
+                for row in rows
+            ]
+        })
+
+
+#Bulk menu upload (CSV, JSON array or JSON Lines) for one restaurant
+class MenuImportAPIView(RestaurantOwnerAPIView):
+    parser_classes = [MultiPartParser, FormParser]
+    owner_only_message = "Only the restaurant owner can import its menu"
+
+    def post(self, request, pk):
+        upload = request.FILES.get("file")
+        if upload is None:
+            return Response({"status": "error", "errors": {"file": ["No file was submitted."]}}, status=status.HTTP_400_BAD_REQUEST)
+
+        fmt = request.data.get("file_format") or ("csv" if upload.name.lower().endswith(".csv") else "json")
+        if fmt not in ("csv", "json"):
+            return Response({"status": "error", "errors": {"file_format": ["Use csv or json."]}}, status=status.HTTP_400_BAD_REQUEST)
+
+        create_categories = str(request.data.get("create_categories", "")).lower() in ("1", "true", "yes")
+        result = bulk.MenuImport(self.restaurant, create_categories=create_categories).run(
+            bulk.iter_import_rows(upload, fmt)
+        )
+        imported = result.created + result.updated
+        return Response(
+            {
+                "message": "Menu imported" if imported else "Nothing was imported",
+                "status": "success" if imported or not result.error_count else "error",
+                "data": result.summary(),
+            },
+            status=status.HTTP_200_OK if imported or not result.error_count else status.HTTP_400_BAD_REQUEST
+        )
+
+
+class RestaurantExportAPIView(RestaurantOwnerAPIView):
+    owner_only_message = "Only the restaurant owner can export its data"
+    export_name = None
+    header = None
+
+    def get_rows(self):
+        raise NotImplementedError
+
+    def get(self, request, pk):
+        fmt = request.query_params.get("file_format", "csv")
+        if fmt not in ("csv", "json"):
+            return Response({"status": "error", "errors": {"file_format": ["Use csv or json."]}}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(
+            bulk.stream_export(fmt, self.header, self.get_rows()),
+            content_type="text/csv" if fmt == "csv" else "application/json",
+        )
+        response["Content-Disposition"] = f'attachment; filename="{self.export_name}-{self.restaurant.pk}.{fmt}"'
+        return response
+
+
+class MenuExportAPIView(RestaurantExportAPIView):
+    export_name = "menu"
+    header = bulk.MENU_EXPORT_FIELDS
+
+    def get_rows(self):
+        return bulk.menu_export_rows(self.restaurant)
+
 
+class OrderExportAPIView(RestaurantExportAPIView):
+    export_name = "orders"
+    header = bulk.ORDER_EXPORT_FIELDS
 
+    def get_rows(self):
+        return bulk.order_export_rows(self.restaurant)
@@ -0,0 +1,29 @@
+# Settings for the benchmark suite (seed_benchmark_data / run_benchmarks):
+# the normal project settings on a local SQLite file, with nothing that
+# needs an external service.
+from .settings import *  # noqa: F401,F403
+
+DEBUG = False
+ALLOWED_HOSTS = ["testserver", "localhost"]
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'benchmark.sqlite3',  # noqa: F405
+    }
+}
+
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}
+
+# Keep background work out of the timings
+IMAGE_DERIVATIVES = {**IMAGE_DERIVATIVES, "WORKERS": 0}  # noqa: F405
+TOKEN_BLACKLIST = {**TOKEN_BLACKLIST, "PRUNE_INTERVAL": 0}  # noqa: F405
+
+# Rate limiting stays on, so its cost is in every timing, but never trips
+RATE_LIMITS = {
+    **RATE_LIMITS,  # noqa: F405
+    "ROLES": {role: "1000000/s" for role in RATE_LIMITS["ROLES"]},  # noqa: F405
+    "SCOPES": {scope: {"*": "1000000/s"} for scope in RATE_LIMITS["SCOPES"]},  # noqa: F405
+}
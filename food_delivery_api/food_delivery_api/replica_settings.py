@@ -0,0 +1,32 @@
+# Local stand-in for a primary with two read replicas: three SQLite files.
+# Nothing replicates between them; `manage.py sync_sqlite_replicas` copies
+# the primary over the replicas, so until you run it the replicas lag
+# behind, which shows read-your-writes stickiness at work.
+#
+#   python manage.py migrate --settings=food_delivery_api.replica_settings
+#   python manage.py sync_sqlite_replicas --settings=food_delivery_api.replica_settings
+#   python manage.py runserver --settings=food_delivery_api.replica_settings
+from .settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'primary.sqlite3',  # noqa: F405
+    },
+    'replica1': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'replica1.sqlite3',  # noqa: F405
+        'TEST': {'MIRROR': 'default'},
+    },
+    'replica2': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'replica2.sqlite3',  # noqa: F405
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}
+
+DATABASE_REPLICAS = {**DATABASE_REPLICAS, "REPLICAS": ["replica1", "replica2"]}  # noqa: F405
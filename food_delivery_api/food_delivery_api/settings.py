@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -35,8 +36,9 @@ INSTALLED_APPS = [
 AUTH_USER_MODEL = "Api.User"
 
 REST_FRAMEWORK = {
+    # Builds request.user from token claims; no User query per request
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "Api.authentication.ClaimsJWTAuthentication",
     ),
 
     "DEFAULT_PERMISSION_CLASSES": (
@@ -49,16 +51,171 @@ REST_FRAMEWORK = {
         "rest_framework.filters.OrderingFilter",
     ),
 
+    # Cursor-based pages; admins can still pass ?page=N for numbered pages
     "DEFAULT_PAGINATION_CLASS": 
-        "rest_framework.pagination.PageNumberPagination",
+        "Api.pagination.KeysetPagination",
 
     "PAGE_SIZE": 10,
+
+    # orjson-backed, byte-for-byte compatible with the stock JSONRenderer
+    "DEFAULT_RENDERER_CLASSES": (
+        "Api.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
+
+    # Limits come from RATE_LIMITS below
+    "DEFAULT_THROTTLE_CLASSES": (
+        "Api.throttling.RoleRateThrottle",
+        "Api.throttling.EndpointRateThrottle",
+    ),
+}
+
+# Rate limits (Api/throttling.py) as "requests/period", period s, m, h or d
+# with an optional multiple ("100/15m"); None means unlimited. ROLES apply to
+# every request, per user or per client IP when anonymous. SCOPES add limits
+# to the views whose throttle_scope names them; "*" covers unlisted roles.
+# BACKEND "memory" counts per process; "cache" shares the counts through
+# CACHE, which should then be Redis or Memcached. Blocked requests get a 429
+# with Retry-After.
+RATE_LIMITS = {
+    "ENABLED": True,
+    "BACKEND": "memory",
+    "CACHE": "default",
+    "ROLES": {
+        "anon": "300/m",
+        "customer": "600/m",
+        "courier": "600/m",
+        "restaurant_owner": "1200/m",
+        "admin": None,
+    },
+    "SCOPES": {
+        # Each attempt runs the password hasher
+        "login": {"*": "10/m"},
+        "register": {"*": "5/h"},
+        "orders": {"customer": "30/m", "*": "10/m"},
+    },
+}
+
+# Per-request timing (Api/instrumentation.py): Server-Timing headers,
+# slow-request and N+1 warnings on the Api.instrumentation logger, and
+# Prometheus histograms at /metrics (guarded by METRICS_TOKEN when set).
+# Aggregates are per process; scrape each worker.
+INSTRUMENTATION = {
+    "ENABLED": True,
+    "SERVER_TIMING": True,
+    "SLOW_REQUEST_MS": 500,
+    # Password hashing makes these slow by design
+    "SLOW_REQUEST_MS_BY_VIEW": {
+        "LoginAPIView": 2000,
+        "TokenObtainAPIView": 2000,
+        "RegisterAPIView": 2000,
+    },
+    "N_PLUS_ONE_THRESHOLD": 10,
+    # /metrics needs this bearer token (for scrapers) or a staff/admin user;
+    # set METRICS_PUBLIC to serve it to anyone
+    "METRICS_TOKEN": None,
+    "METRICS_PUBLIC": False,
+}
+
+# Restaurant and menu item GETs are served from .values() rows by
+# Api/readers.py instead of ModelSerializer instances
+FAST_READ_PATH = True
+
+SIMPLE_JWT = {
+    "TOKEN_OBTAIN_SERIALIZER": "Api.authentication.RoleTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "Api.authentication.RoleTokenRefreshSerializer",
+}
+
+# LRU cache for users loaded from the database (tokens without role claims,
+# or users changed since their token was issued). Set to None to disable.
+# Role changes and deactivations are stamped in CACHE, which should be shared
+# (Redis/Memcached) so every worker stops trusting the user's older tokens.
+AUTH_USER_CACHE = {
+    "MAX_SIZE": 10000,
+    "TTL": 300,
+    "CACHE": "default",
+}
+
+# Refresh-token revocation (Api/blacklist.py): revoked jtis are checked in
+# memory and re-synced from the database every SYNC_INTERVAL seconds; expired
+# blacklist rows are pruned in the background every PRUNE_INTERVAL seconds.
+# New revocations are also written to CACHE, which should be shared
+# (Redis/Memcached) so other workers refuse the token before their next sync.
+TOKEN_BLACKLIST = {
+    "SYNC_INTERVAL": 5,
+    "PRUNE_INTERVAL": 3600,
+    "PRUNE_BATCH_SIZE": 1000,
+    "CACHE": "default",
+}
+
+# Full-menu snapshots (Api/menu.py) are replaced as soon as a menu row
+# changes; the timeout (seconds) is only a backstop. Use a shared cache
+# backend (Redis/Memcached) in production so every worker sees the same
+# invalidations.
+MENU_CACHE_TIMEOUT = 3600
+
+# Price bucket edges for ?facets=1 on /api/menu-items/ (Api/facets.py)
+MENU_FACETS = {
+    "PRICE_BUCKETS": (5, 10, 20, 50, 100),
+}
+
+# Live order tracking (GET /api/orders/stream/, served under ASGI). The
+# in-process broker only fans out within one worker process.
+ORDER_EVENTS_BROKER = "Api.events.InProcessBroker"
+ORDER_EVENTS_HEARTBEAT = 15
+
+# Menu item photo derivatives (Api/images.py), rendered by a pool of WORKERS
+# processes after upload; WORKERS = 0 renders inline.
+IMAGE_DERIVATIVES = {
+    "SIZES": {"thumbnail": (160, 160), "card": (480, 480), "full": (1280, 1280)},
+    "FORMAT": "WEBP",
+    "QUALITY": 80,
+    "WORKERS": 2,
+}
+
+
+# Idempotency-Key on order/checkout writes (Api/idempotency.py): stored
+# responses live in CACHE for TTL seconds and in the IdempotencyKey table
+# until `manage.py prune_idempotency_keys` removes expired rows.
+IDEMPOTENCY = {
+    "TTL": 24 * 3600,
+    "CACHE": "default",
+    "MAX_KEY_LENGTH": 255,
+}
+
+# Courier dispatch (Api/dispatch.py), run with `manage.py dispatch_orders
+# --every 15`. Each batch pairs up to BATCH_SIZE confirmed orders with idle
+# couriers within MAX_PICKUP_KM whose location is under LOCATION_TTL seconds
+# old. ALGORITHM "optimal" serves the oldest orders first at the lowest total
+# pickup distance; "greedy" always takes the closest pair, which keeps
+# pickups shorter when orders outnumber couriers (compare with
+# `manage.py simulate_dispatch`).
+DISPATCH = {
+    "BATCH_SIZE": 500,
+    "MAX_PICKUP_KM": 8.0,
+    "LOCATION_TTL": 120,
+    "ALGORITHM": "optimal",
+}
+
+# Order archiving (Api/archive.py), run with `manage.py archive_orders
+# --every 3600`. Orders in STATUSES older than AGE_DAYS move to the archive
+# tables BATCH_SIZE at a time, one short transaction per batch, sleeping
+# PAUSE seconds in between. GET /api/orders/ and /api/orders/<id>/ include
+# archived orders with ?history=1.
+ARCHIVE = {
+    "AGE_DAYS": 90,
+    "STATUSES": ("DELIVERED", "CANCELLED"),
+    "BATCH_SIZE": 500,
+    "PAUSE": 0,
 }
 
 
 
 
 MIDDLEWARE = [
+    # Outermost so its totals cover the whole stack
+    'Api.instrumentation.InstrumentationMiddleware',
+    'Api.replicas.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -86,6 +243,13 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'food_delivery_api.wsgi.application'
+ASGI_APPLICATION = 'food_delivery_api.asgi.application'
+
+# asgi.py sets DJANGO_ASYNC_VIEWS=1, which routes the restaurant, menu item
+# and order endpoints to the native async views in Api/async_views.py.
+# Under WSGI the sync views are used, since each async view would need an
+# event loop of its own per request.
+ASYNC_VIEWS = os.environ.get('DJANGO_ASYNC_VIEWS') == '1'
 
 
 # Database
@@ -102,6 +266,21 @@ DATABASES = {
     }
 }
 
+# Read replicas (Api/replicas.py): list their DATABASES aliases in REPLICAS.
+# GETs read from a healthy replica; a user who wrote reads from the primary
+# for STICKY_SECONDS (tracked in CACHE, so use a shared backend). Replicas
+# failing a health check are skipped for EJECT_SECONDS.
+# See food_delivery_api/replica_settings.py for a local SQLite setup.
+DATABASE_ROUTERS = ["Api.replicas.ReplicaRouter"]
+
+DATABASE_REPLICAS = {
+    "REPLICAS": [],
+    "STICKY_SECONDS": 10,
+    "CHECK_INTERVAL": 5,
+    "EJECT_SECONDS": 30,
+    "CACHE": "default",
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -139,6 +318,9 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
 
 
 # Default primary key field type
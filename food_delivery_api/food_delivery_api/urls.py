@@ -1,7 +1,10 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from Api.instrumentation import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('Api.urls')),
+    path('metrics', metrics_view),
 ]
\ No newline at end of file